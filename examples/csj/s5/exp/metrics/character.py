@@ -7,16 +7,17 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-import re
 from tqdm import tqdm
 import pandas as pd
 
-from utils.evaluation.edit_distance import compute_wer
+from utils.evaluation.edit_distance import compute_wer_corpus
+from utils.evaluation.normalization import CharNormalizer
 
 
 def eval_char(models, dataset, eval_batch_size, beam_width,
               max_decode_len, min_decode_len=0,
-              length_penalty=0, coverage_penalty=0, progressbar=False):
+              length_penalty=0, coverage_penalty=0, progressbar=False,
+              results=None):
     """Evaluate trained model by Character Error Rate.
     Args:
         models (list): the models to evaluate
@@ -29,6 +30,8 @@ def eval_char(models, dataset, eval_batch_size, beam_width,
         coverage_penalty (float): coverage penalty in beam search decoding
         progressbar (bool): if True, visualize the progressbar
         temperature (int):
+        results (list, optional): if given, the result of each utterance
+            is appended as a dict
     Returns:
         wer (float): Word error rate
         cer (float): Character error rate
@@ -40,14 +43,21 @@ def eval_char(models, dataset, eval_batch_size, beam_width,
     model = models[0]
     # TODO: fix this
 
+    if model.model_type in ['ctc', 'attention']:
+        vocab_file_path = dataset.vocab_file_path
+    else:
+        vocab_file_path = dataset.vocab_file_path_sub
+    normalizer = CharNormalizer(
+        vocab_file_path, capital_divide=dataset.idx2char.capital_divide)
+
     cer, wer = 0, 0
     sub_char, ins_char, del_char = 0, 0, 0
     sub_word, ins_word, del_word = 0, 0, 0
     num_words, num_chars = 0, 0
     if progressbar:
         pbar = tqdm(total=len(dataset))  # TODO: fix this
-    while True:
-        batch, is_new_epoch = dataset.next(batch_size=eval_batch_size)
+    # NOTE: utterances are decoded in the order of length
+    for batch, _ in dataset.sorted_batches(batch_size=eval_batch_size):
 
         # Decode
         if model.model_type in ['ctc', 'attention']:
@@ -56,7 +66,8 @@ def eval_char(models, dataset, eval_batch_size, beam_width,
                 beam_width=beam_width,
                 max_decode_len=max_decode_len,
                 length_penalty=length_penalty,
-                coverage_penalty=coverage_penalty)
+                coverage_penalty=coverage_penalty,
+                return_attention=False)
             ys = batch['ys'][perm_idx]
             y_lens = batch['y_lens'][perm_idx]
             task_index = 0
@@ -67,73 +78,70 @@ def eval_char(models, dataset, eval_batch_size, beam_width,
                 max_decode_len=max_decode_len,
                 length_penalty=length_penalty,
                 coverage_penalty=coverage_penalty,
-                task_index=1)
+                task_index=1,
+                return_attention=False)
             ys = batch['ys_sub'][perm_idx]
             y_lens = batch['y_lens_sub'][perm_idx]
             task_index = 1
         # TODO: add nested_attention
+        utt_ids = batch['input_names'][perm_idx]
 
-        for b in range(len(batch['xs'])):
+        batch_size = len(batch['xs'])
+        refs, hyps = [], []
+        ref_chars, hyp_chars = [], []
+        for b in range(batch_size):
             ##############################
             # Reference
             ##############################
             if dataset.is_test:
-                str_ref = ys[b][0]
+                refs.append(normalizer.words_from_string(ys[b][0]))
+                ref_chars.append(normalizer.chars_from_words(refs[-1]))
                 # NOTE: transcript is seperated by space('_')
             else:
-                # Convert from list of index to string
-                str_ref = dataset.idx2char(ys[b][:y_lens[b]])
+                refs.append(normalizer.words(ys[b][:y_lens[b]]))
+                ref_chars.append(normalizer.chars(ys[b][:y_lens[b]]))
 
             ##############################
             # Hypothesis
             ##############################
-            str_hyp = dataset.idx2char(best_hyps[b])
-            str_hyp = re.sub(r'(.*)>(.*)', r'\1', str_hyp)
-            # NOTE: Trancate by the first <EOS>
-
-            # Remove garbage labels
-            str_ref = re.sub(r'[@>]+', '', str_ref)
-            str_hyp = re.sub(r'[@>]+', '', str_hyp)
-            # NOTE: @ means <sp>
-
-            # Remove consecutive spaces
-            str_ref = re.sub(r'[_]+', '_', str_ref)
-            str_hyp = re.sub(r'[_]+', '_', str_hyp)
-
-            if dataset.label_type == 'character_wb' or (task_index > 0 and dataset.label_type_sub == 'character_wb'):
-                # Compute WER
-                try:
-                    wer_b, sub_b, ins_b, del_b = compute_wer(
-                        ref=str_ref.split('_'),
-                        hyp=str_hyp.split('_'),
-                        normalize=False)
-                    wer += wer_b
-                    sub_word += sub_b
-                    ins_word += ins_b
-                    del_word += del_b
-                    num_words += len(str_ref.split('_'))
-                except:
-                    pass
-
-            # Compute CER
-            try:
-                cer_b, sub_b, ins_b, del_b = compute_wer(
-                    ref=list(str_ref.replace('_', '')),
-                    hyp=list(str_hyp.replace('_', '')),
-                    normalize=False)
-                cer += cer_b
-                sub_char += sub_b
-                ins_char += ins_b
-                del_char += del_b
-                num_chars += len(str_ref.replace('_', ''))
-            except:
-                pass
-
-            if progressbar:
-                pbar.update(1)
-
-        if is_new_epoch:
-            break
+            # NOTE: Trancate by the first <EOS>, and remove noise
+            # and consecutive spaces
+            hyps.append(normalizer.words(best_hyps[b]))
+            hyp_chars.append(normalizer.chars(best_hyps[b]))
+
+        # Compute WER
+        wer_b, sub_b, ins_b, del_b = compute_wer_corpus(refs, hyps)
+        wer += wer_b.sum()
+        sub_word += sub_b.sum()
+        ins_word += ins_b.sum()
+        del_word += del_b.sum()
+        num_words += sum(len(ref) for ref in refs)
+
+        # Compute CER
+        cer_b, sub_char_b, ins_char_b, del_char_b = compute_wer_corpus(
+            ref_chars, hyp_chars)
+        cer += cer_b.sum()
+        sub_char += sub_char_b.sum()
+        ins_char += ins_char_b.sum()
+        del_char += del_char_b.sum()
+        num_chars += sum(len(ref) for ref in ref_chars)
+
+        if results is not None:
+            for b in range(batch_size):
+                results.append({'utt_id': str(utt_ids[b]),
+                                'ref': normalizer.to_string(refs[b]),
+                                'hyp': normalizer.to_string(hyps[b]),
+                                'num_words': len(refs[b]),
+                                'err': wer_b[b], 'sub': sub_b[b],
+                                'ins': ins_b[b], 'del': del_b[b],
+                                'num_chars': len(ref_chars[b]),
+                                'err_char': cer_b[b],
+                                'sub_char': sub_char_b[b],
+                                'ins_char': ins_char_b[b],
+                                'del_char': del_char_b[b]})
+
+        if progressbar:
+            pbar.update(batch_size)
 
     if progressbar:
         pbar.close()
@@ -13,7 +13,8 @@ import pandas as pd
 import numpy as np
 
 from utils.io.labels.word import Word2char
-from utils.evaluation.edit_distance import compute_wer
+from utils.evaluation.edit_distance import compute_wer_corpus
+from utils.evaluation.normalization import WordNormalizer
 from utils.evaluation.resolving_unk import resolve_unk
 
 
@@ -22,7 +23,7 @@ def eval_word(models, dataset, eval_batch_size,
               beam_width_sub=1, max_decode_len_sub=200, min_decode_len_sub=0,
               length_penalty=0, coverage_penalty=0,
               progressbar=False, resolving_unk=False, a2c_oracle=False,
-              joint_decoding=None, score_sub_weight=0):
+              joint_decoding=None, score_sub_weight=0, results=None):
     """Evaluate trained model by Word Error Rate.
     Args:
         models (list): the models to evaluate
@@ -42,6 +43,8 @@ def eval_word(models, dataset, eval_batch_size,
         a2c_oracle (bool):
         joint_decoding (bool): onepass or resocring or None
         score_sub_weight (float):
+        results (list, optional): if given, the result of each utterance
+            is appended as a dict
     Returns:
         wer (float): Word error rate
         df_word (pd.DataFrame): dataframe of substitution, insertion, and deletion
@@ -56,13 +59,16 @@ def eval_word(models, dataset, eval_batch_size,
         word2char = Word2char(dataset.vocab_file_path,
                               dataset.vocab_file_path_sub)
 
+    normalizer = WordNormalizer(dataset.vocab_file_path)
+    oov_index = normalizer.tokens.index('OOV') if resolving_unk else None
+
     wer = 0
     sub, ins, dele, = 0, 0, 0
     num_words = 0
     if progressbar:
         pbar = tqdm(total=len(dataset))  # TODO: fix this
-    while True:
-        batch, is_new_epoch = dataset.next(batch_size=eval_batch_size)
+    # NOTE: utterances are decoded in the order of length
+    for batch, _ in dataset.sorted_batches(batch_size=eval_batch_size):
 
         batch_size = len(batch['xs'])
 
@@ -94,6 +100,7 @@ def eval_word(models, dataset, eval_batch_size,
 
             best_hyps, aw, best_hyps_sub, aw_sub, _, perm_idx = model.decode(
                 batch['xs'], batch['x_lens'],
+                utt_ids=batch['input_names'],
                 beam_width=beam_width,
                 max_decode_len=max_decode_len,
                 min_decode_len=min_decode_len,
@@ -104,10 +111,12 @@ def eval_word(models, dataset, eval_batch_size,
                 coverage_penalty=coverage_penalty,
                 teacher_forcing=a2c_oracle,
                 ys_sub=ys_sub,
-                y_lens_sub=y_lens_sub)
+                y_lens_sub=y_lens_sub,
+                return_attention=resolving_unk)
         elif model.model_type == 'hierarchical_attention' and joint_decoding is not None:
             best_hyps, aw, best_hyps_sub, aw_sub, perm_idx = model.decode(
                 batch['xs'], batch['x_lens'],
+                utt_ids=batch['input_names'],
                 beam_width=beam_width,
                 max_decode_len=max_decode_len,
                 min_decode_len=min_decode_len,
@@ -119,18 +128,22 @@ def eval_word(models, dataset, eval_batch_size,
                 word2char=word2char,
                 idx2word=dataset.idx2word,
                 idx2char=dataset.idx2char,
-                score_sub_weight=score_sub_weight)
+                score_sub_weight=score_sub_weight,
+                return_attention=resolving_unk)
         else:
             best_hyps, aw, perm_idx = model.decode(
                 batch['xs'], batch['x_lens'],
+                utt_ids=batch['input_names'],
                 beam_width=beam_width,
                 max_decode_len=max_decode_len,
                 min_decode_len=min_decode_len,
                 length_penalty=length_penalty,
-                coverage_penalty=coverage_penalty)
+                coverage_penalty=coverage_penalty,
+                return_attention=resolving_unk)
             if resolving_unk:
                 best_hyps_sub, aw_sub, _ = model.decode(
                     batch['xs'], batch['x_lens'],
+                    utt_ids=batch['input_names'],
                     beam_width=beam_width,
                     max_decode_len=max_decode_len_sub,
                     min_decode_len=min_decode_len_sub,
@@ -140,67 +153,60 @@ def eval_word(models, dataset, eval_batch_size,
 
         ys = batch['ys'][perm_idx]
         y_lens = batch['y_lens'][perm_idx]
+        utt_ids = batch['input_names'][perm_idx]
 
+        refs, hyps = [], []
         for b in range(batch_size):
             ##############################
             # Reference
             ##############################
             if dataset.is_test:
-                str_ref = ys[b][0]
+                refs.append(normalizer.words_from_string(ys[b][0]))
                 # NOTE: transcript is seperated by space('_')
             else:
-                # Convert from list of index to string
-                str_ref = dataset.idx2word(ys[b][:y_lens[b]])
+                refs.append(normalizer.words(ys[b][:y_lens[b]]))
 
             ##############################
             # Hypothesis
             ##############################
-            str_hyp = dataset.idx2word(best_hyps[b])
-            if dataset.label_type == 'word':
-                str_hyp = re.sub(r'(.*)_>(.*)', r'\1', str_hyp)
-            else:
-                str_hyp = re.sub(r'(.*)>(.*)', r'\1', str_hyp)
-            # NOTE: Trancate by the first <EOS>
+            # NOTE: Trancate by the first <EOS>, and remove noise
+            # and consecutive spaces
+            if resolving_unk and oov_index in best_hyps[b]:
+                str_hyp = dataset.idx2word(best_hyps[b])
+                if dataset.label_type == 'word':
+                    str_hyp = re.sub(r'(.*)_>(.*)', r'\1', str_hyp)
+                else:
+                    str_hyp = re.sub(r'(.*)>(.*)', r'\1', str_hyp)
 
-            ##############################
-            # Resolving UNK
-            ##############################
-            if resolving_unk and 'OOV' in str_hyp:
+                ##############################
+                # Resolving UNK
+                ##############################
                 str_hyp = resolve_unk(
                     str_hyp, best_hyps_sub[b], aw[b], aw_sub[b], dataset.idx2char)
                 str_hyp = str_hyp.replace('*', '')
-
-            ##############################
-            # Post-proccessing
-            ##############################
-            # Remove noise labels
-            str_ref = re.sub(r'[@>]+', '', str_ref)
-            str_hyp = re.sub(r'[@>]+', '', str_hyp)
-            # NOTE: @ means <sp>
-
-            # Remove consecutive spaces
-            str_ref = re.sub(r'[_]+', '_', str_ref)
-            str_hyp = re.sub(r'[_]+', '_', str_hyp)
-
-            # Compute WER
-            try:
-                wer_b, sub_b, ins_b, del_b = compute_wer(
-                    ref=str_ref.split('_'),
-                    hyp=str_hyp.split('_'),
-                    normalize=False)
-                wer += wer_b
-                sub += sub_b
-                ins += ins_b
-                dele += del_b
-                num_words += len(str_ref.split('_'))
-            except:
-                pass
-
-            if progressbar:
-                pbar.update(1)
-
-        if is_new_epoch:
-            break
+                hyps.append(normalizer.words_from_string(str_hyp))
+            else:
+                hyps.append(normalizer.words(best_hyps[b]))
+
+        # Compute WER
+        wer_b, sub_b, ins_b, del_b = compute_wer_corpus(refs, hyps)
+        wer += wer_b.sum()
+        sub += sub_b.sum()
+        ins += ins_b.sum()
+        dele += del_b.sum()
+        num_words += sum(len(ref) for ref in refs)
+
+        if results is not None:
+            for b in range(batch_size):
+                results.append({'utt_id': str(utt_ids[b]),
+                                'ref': normalizer.to_string(refs[b]),
+                                'hyp': normalizer.to_string(hyps[b]),
+                                'num_words': len(refs[b]),
+                                'err': wer_b[b], 'sub': sub_b[b],
+                                'ins': ins_b[b], 'del': del_b[b]})
+
+        if progressbar:
+            pbar.update(batch_size)
 
     if progressbar:
         pbar.close()
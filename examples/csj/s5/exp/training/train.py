@@ -28,6 +28,7 @@ from examples.csj.s5.exp.metrics.word import eval_word
 from utils.training.learning_rate_controller import Controller
 from utils.training.plot import plot_loss
 from utils.training.training_loop import train_step
+from utils.training.training_loop import GradientAccumulator, flush_gradients
 from utils.training.logging import set_logger
 from utils.directory import mkdir_join
 from utils.config import load_config, save_config
@@ -183,6 +184,11 @@ def main():
 
     train_data.epoch = epoch - 1
 
+    # Make inputs and outputs of decoders in the data loader
+    if hasattr(model, 'target_dirs'):
+        train_data.target_dirs = model.target_dirs
+        train_data.target_dirs_sub = model.target_dirs_sub
+
     # GPU setting
     model.set_cuda(deterministic=False, benchmark=True)
 
@@ -206,6 +212,20 @@ def main():
         decay_patient_epoch=params['decay_patient_epoch'],
         lower_better=True)
 
+    # Define gradient accumulator
+    if 'accum_grad_steps' not in params.keys():
+        params['accum_grad_steps'] = 1
+    if 'accum_grad_frames' not in params.keys():
+        params['accum_grad_frames'] = 0
+    if 'accum_grad_normalize' not in params.keys():
+        params['accum_grad_normalize'] = 'utterance'
+    accumulator = None
+    if params['backend'] == 'pytorch' and (params['accum_grad_steps'] > 1 or params['accum_grad_frames'] > 0):
+        accumulator = GradientAccumulator(
+            accum_grad_steps=params['accum_grad_steps'],
+            accum_grad_frames=params['accum_grad_frames'],
+            normalize=params['accum_grad_normalize'])
+
     # Setting for tensorboard
     if params['backend'] == 'pytorch':
         tf_writer = SummaryWriter(model.save_path)
@@ -223,7 +243,8 @@ def main():
         # Compute loss in the training set (including parameter update)
         batch_train, is_new_epoch = train_data.next()
         model, loss_train = train_step(
-            model, batch_train, params['clip_grad_norm'], params['backend'])
+            model, batch_train, params['clip_grad_norm'], params['backend'],
+            accumulator=accumulator)
         loss_train_mean += loss_train
 
         pbar_epoch.update(len(batch_train['xs']))
@@ -266,6 +287,9 @@ def main():
 
         # Save checkpoint and evaluate model per epoch
         if is_new_epoch:
+            model = flush_gradients(
+                model, params['clip_grad_norm'], accumulator)
+
             duration_epoch = time.time() - start_time_epoch
             logger.info('===== EPOCH:%d (%.3f min) =====' %
                         (epoch, duration_epoch / 60))
@@ -285,7 +309,7 @@ def main():
                     metric_dev, _ = eval_word(
                         models=[model],
                         dataset=dev_data,
-                        eval_batch_size=1,
+                        eval_batch_size=params['batch_size'],
                         beam_width=1,
                         max_decode_len=MAX_DECODE_LEN_WORD)
                     logger.info('  WER (dev): %.3f %%' %
@@ -294,7 +318,7 @@ def main():
                     wer_dev, metric_dev, _ = eval_char(
                         models=[model],
                         dataset=dev_data,
-                        eval_batch_size=1,
+                        eval_batch_size=params['batch_size'],
                         beam_width=1,
                         max_decode_len=MAX_DECODE_LEN_CHAR)
                     logger.info('  WER / CER (dev): %.3f / %.3f %%' %
@@ -315,7 +339,7 @@ def main():
                         wer_eval1, _ = eval_word(
                             models=[model],
                             dataset=eval1_data,
-                            eval_batch_size=1,
+                            eval_batch_size=params['batch_size'],
                             beam_width=1,
                             max_decode_len=MAX_DECODE_LEN_CHAR)
                         logger.info('  WER (eval1): %.3f %%' %
@@ -324,7 +348,7 @@ def main():
                         wer_eval1, cer_eval1, _ = eval_char(
                             models=[model],
                             dataset=eval1_data,
-                            eval_batch_size=1,
+                            eval_batch_size=params['batch_size'],
                             beam_width=1,
                             max_decode_len=MAX_DECODE_LEN_CHAR)
                         logger.info('  WER / CER (eval1): %.3f / %.3f %%' %
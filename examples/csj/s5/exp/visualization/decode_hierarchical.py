@@ -86,6 +86,9 @@ def main():
     # GPU setting
     model.set_cuda(deterministic=False, benchmark=True)
 
+    # Encode each utterance only once for the main and sub tasks
+    model.set_encoder_cache()
+
     # sys.stdout = open(join(model.model_dir, 'decode.txt'), 'w')
 
     ######################################################################
@@ -98,6 +101,7 @@ def main():
         if model.model_type == 'nested_attention':
             best_hyps, aw, best_hyps_sub, aw_sub, _, perm_idx = model.decode(
                 batch['xs'], batch['x_lens'],
+                utt_ids=batch['input_names'],
                 beam_width=args.beam_width,
                 beam_width_sub=args.beam_width_sub,
                 max_decode_len=MAX_DECODE_LEN_WORD,
@@ -107,6 +111,7 @@ def main():
         else:
             best_hyps, aw, perm_idx = model.decode(
                 batch['xs'], batch['x_lens'],
+                utt_ids=batch['input_names'],
                 beam_width=args.beam_width,
                 max_decode_len=MAX_DECODE_LEN_WORD,
                 min_decode_len=MIN_DECODE_LEN_WORD,
@@ -114,6 +119,7 @@ def main():
                 coverage_penalty=args.coverage_penalty)
             best_hyps_sub, aw_sub, _ = model.decode(
                 batch['xs'], batch['x_lens'],
+                utt_ids=batch['input_names'],
                 beam_width=args.beam_width_sub,
                 max_decode_len=MAX_DECODE_LEN_CHAR,
                 min_decode_len=MIN_DECODE_LEN_CHAR,
@@ -124,6 +130,7 @@ def main():
         if model.model_type == 'hierarchical_attention' and args.joint_decoding is not None:
             best_hyps_joint, aw_joint, best_hyps_sub_joint, aw_sub_joint, _ = model.decode(
                 batch['xs'], batch['x_lens'],
+                utt_ids=batch['input_names'],
                 beam_width=args.beam_width,
                 max_decode_len=MAX_DECODE_LEN_WORD,
                 min_decode_len=MIN_DECODE_LEN_WORD,
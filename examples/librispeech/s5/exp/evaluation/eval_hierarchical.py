@@ -87,6 +87,9 @@ def main():
             # GPU setting
             model.set_cuda(deterministic=False, benchmark=True)
 
+            # Encode each utterance only once for the main and sub tasks
+            model.set_encoder_cache()
+
             logger.info('beam width (main): %d' % args.beam_width)
             logger.info('beam width (sub) : %d' % args.beam_width_sub)
             logger.info('epoch: %d' % (epoch - 1))
@@ -0,0 +1,204 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Evaluate the trained model by multiple processes (Librispeech corpus).
+   Each evaluation set is split into shards, and each shard is decoded by
+   a separate process on CPUs. The result of each utterance is saved in
+   the JSON Lines format.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from os.path import join, abspath, basename
+import sys
+import argparse
+import json
+import multiprocessing as mp
+import pandas as pd
+import torch
+
+sys.path.append(abspath('../../../'))
+from models.load_model import load
+from examples.librispeech.s5.exp.dataset.load_dataset import Dataset
+from examples.librispeech.s5.exp.metrics.character import eval_char
+from examples.librispeech.s5.exp.metrics.word import eval_word
+from utils.config import load_config
+from utils.evaluation.logging import set_logger
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--data_save_path', type=str,
+                    help='path to saved data')
+parser.add_argument('--model_path', type=str,
+                    help='path to the model to evaluate')
+parser.add_argument('--epoch', type=int, default=-1,
+                    help='the epoch to restore')
+parser.add_argument('--data_types', type=str, default='test_clean,test_other',
+                    help='comma-separated names of the evaluation sets')
+parser.add_argument('--beam_width', type=int, default=1,
+                    help='the size of beam')
+parser.add_argument('--eval_batch_size', type=int, default=1,
+                    help='the size of mini-batch in evaluation')
+parser.add_argument('--length_penalty', type=float, default=0,
+                    help='length penalty in beam search decoding')
+parser.add_argument('--coverage_penalty', type=float, default=0,
+                    help='coverage penalty in beam search decoding')
+parser.add_argument('--num_workers', type=int, default=mp.cpu_count(),
+                    help='the number of processes')
+parser.add_argument('--num_threads', type=int, default=mp.cpu_count(),
+                    help='the number of threads shared by all processes')
+
+MAX_DECODE_LEN_WORD = 200
+MIN_DECODE_LEN_WORD = 0
+MAX_DECODE_LEN_CHAR = 600
+MIN_DECODE_LEN_CHAR = 0
+
+# NOTE: set in each process by _init_worker
+_args = None
+_params = None
+_model = None
+
+
+def _load_dataset(args, params, data_type):
+    return Dataset(
+        data_save_path=args.data_save_path,
+        backend=params['backend'],
+        input_freq=params['input_freq'],
+        use_delta=params['use_delta'],
+        use_double_delta=params['use_double_delta'],
+        data_type=data_type,
+        data_size=params['data_size'],
+        label_type=params['label_type'],
+        batch_size=args.eval_batch_size, splice=params['splice'],
+        num_stack=params['num_stack'], num_skip=params['num_skip'],
+        sort_utt=False, tool=params['tool'])
+
+
+def _init_worker(args, params, num_threads):
+    global _args, _params, _model
+    _args = args
+    _params = params
+
+    # NOTE: threads are split among processes
+    torch.set_num_threads(num_threads)
+
+    # Load model
+    _model = load(model_type=params['model_type'],
+                  params=params,
+                  backend=params['backend'])
+
+    # Restore the saved parameters
+    _model.load_checkpoint(save_path=args.model_path, epoch=args.epoch)
+
+
+def _eval_shard(task):
+    """Evaluate a shard of the evaluation set.
+    Args:
+        task (tuple): the name of the evaluation set, the index of the shard,
+            and the number of shards
+    Returns:
+        results (list): A list of dict of each utterance
+    """
+    data_type, index, num_shards = task
+    dataset = _load_dataset(_args, _params, data_type)
+    positions = {basename(path).split('.')[0]: i
+                 for i, path in enumerate(dataset.df['input_path'])}
+    dataset.shard(index, num_shards)
+
+    results = []
+    if _params['label_type'] == 'word':
+        eval_word(models=[_model],
+                  dataset=dataset,
+                  eval_batch_size=_args.eval_batch_size,
+                  beam_width=_args.beam_width,
+                  max_decode_len=MAX_DECODE_LEN_WORD,
+                  min_decode_len=MIN_DECODE_LEN_WORD,
+                  length_penalty=_args.length_penalty,
+                  coverage_penalty=_args.coverage_penalty,
+                  results=results)
+    else:
+        eval_char(models=[_model],
+                  dataset=dataset,
+                  eval_batch_size=_args.eval_batch_size,
+                  beam_width=_args.beam_width,
+                  max_decode_len=MAX_DECODE_LEN_CHAR,
+                  min_decode_len=MIN_DECODE_LEN_CHAR,
+                  length_penalty=_args.length_penalty,
+                  coverage_penalty=_args.coverage_penalty,
+                  results=results)
+
+    for result in results:
+        result['position'] = positions[result['utt_id']]
+    return results
+
+
+def _error_rate(results, suffix, unit):
+    num_units = sum(r['num_' + unit] for r in results)
+    error_rate = sum(r['err' + suffix] for r in results) / num_units
+    df = pd.DataFrame(
+        {'SUB': [sum(r['sub' + suffix] for r in results) / num_units * 100],
+         'INS': [sum(r['ins' + suffix] for r in results) / num_units * 100],
+         'DEL': [sum(r['del' + suffix] for r in results) / num_units * 100]},
+        columns=['SUB', 'INS', 'DEL'])
+    return error_rate, df
+
+
+def main():
+
+    args = parser.parse_args()
+
+    # Load a config file (.yml)
+    params = load_config(join(args.model_path, 'config.yml'), is_eval=True)
+
+    logger = set_logger(args.model_path)
+
+    data_types = args.data_types.split(',')
+    params['num_classes'] = _load_dataset(
+        args, params, data_types[0]).num_classes
+
+    num_threads = max(1, args.num_threads // args.num_workers)
+    pool = mp.Pool(args.num_workers, initializer=_init_worker,
+                   initargs=(args, params, num_threads))
+    logger.info('beam width: %d' % args.beam_width)
+    logger.info('processes: %d, threads per process: %d' %
+                (args.num_workers, num_threads))
+
+    for data_type in data_types:
+        num_shards = min(args.num_workers,
+                         len(_load_dataset(args, params, data_type)))
+        shards = pool.map(_eval_shard,
+                          [(data_type, i, num_shards)
+                           for i in range(num_shards)],
+                          chunksize=1)
+
+        # Restore the original order of utterances
+        results = sorted([r for shard in shards for r in shard],
+                         key=lambda r: r['position'])
+
+        result_path = join(args.model_path, 'results_' + data_type + '.jsonl')
+        with open(result_path, 'w') as f:
+            for r in results:
+                del r['position']
+                f.write(json.dumps(r, default=int) + '\n')
+
+        wer, df = _error_rate(results, '', 'words')
+        df.index = ['WER']
+        if params['label_type'] == 'word':
+            logger.info('  WER (%s, %s): %.3f %%' %
+                        (data_type, params['label_type'], (wer * 100)))
+        else:
+            cer, df_char = _error_rate(results, '_char', 'chars')
+            df_char.index = ['CER']
+            df = pd.concat([df, df_char])
+            logger.info('  WER / CER (%s, %s): %.3f / %.3f %%' %
+                        (data_type, params['label_type'],
+                         (wer * 100), (cer * 100)))
+        logger.info(df)
+
+    pool.close()
+    pool.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -28,6 +28,7 @@ from examples.librispeech.s5.exp.metrics.word import eval_word
 from utils.training.learning_rate_controller import Controller
 from utils.training.plot import plot_loss
 from utils.training.training_loop import train_hierarchical_step
+from utils.training.training_loop import GradientAccumulator, flush_gradients
 from utils.training.logging import set_logger
 from utils.directory import mkdir_join
 from utils.config import load_config, save_config
@@ -187,6 +188,11 @@ def main():
 
     train_data.epoch = epoch - 1
 
+    # Make inputs and outputs of decoders in the data loader
+    if hasattr(model, 'target_dirs'):
+        train_data.target_dirs = model.target_dirs
+        train_data.target_dirs_sub = model.target_dirs_sub
+
     # GPU setting
     model.set_cuda(deterministic=False, benchmark=True)
 
@@ -210,6 +216,20 @@ def main():
         decay_patient_epoch=params['decay_patient_epoch'],
         lower_better=True)
 
+    # Define gradient accumulator
+    if 'accum_grad_steps' not in params.keys():
+        params['accum_grad_steps'] = 1
+    if 'accum_grad_frames' not in params.keys():
+        params['accum_grad_frames'] = 0
+    if 'accum_grad_normalize' not in params.keys():
+        params['accum_grad_normalize'] = 'utterance'
+    accumulator = None
+    if params['backend'] == 'pytorch' and (params['accum_grad_steps'] > 1 or params['accum_grad_frames'] > 0):
+        accumulator = GradientAccumulator(
+            accum_grad_steps=params['accum_grad_steps'],
+            accum_grad_frames=params['accum_grad_frames'],
+            normalize=params['accum_grad_normalize'])
+
     # Setting for tensorboard
     if params['backend'] == 'pytorch':
         tf_writer = SummaryWriter(model.save_path)
@@ -227,7 +247,8 @@ def main():
         # Compute loss in the training set (including parameter update)
         batch_train, is_new_epoch = train_data.next()
         model, loss_train_val, loss_main_train_val, loss_sub_train_val = train_hierarchical_step(
-            model, batch_train, params['clip_grad_norm'], backend=params['backend'])
+            model, batch_train, params['clip_grad_norm'], backend=params['backend'],
+            accumulator=accumulator)
         loss_train_mean += loss_train_val
         loss_main_train_mean += loss_main_train_val
         loss_sub_train_mean += loss_sub_train_val
@@ -283,6 +304,9 @@ def main():
 
         # Save checkpoint and evaluate model per epoch
         if is_new_epoch:
+            model = flush_gradients(
+                model, params['clip_grad_norm'], accumulator)
+
             duration_epoch = time.time() - start_time_epoch
             logger.info('===== EPOCH:%d (%.3f min) =====' %
                         (epoch, duration_epoch / 60))
@@ -302,7 +326,7 @@ def main():
                     metric_dev, _ = eval_word(
                         models=[model],
                         dataset=dev_data,
-                        eval_batch_size=1,
+                        eval_batch_size=params['batch_size'],
                         beam_width=1,
                         max_decode_len=MAX_DECODE_LEN_WORD,
                         max_decode_len_sub=MAX_DECODE_LEN_CHAR)
@@ -312,7 +336,7 @@ def main():
                     wer_dev_sub, metric_dev, _ = eval_char(
                         models=[model],
                         dataset=dev_data,
-                        eval_batch_size=1,
+                        eval_batch_size=params['batch_size'],
                         beam_width=1,
                         max_decode_len=MAX_DECODE_LEN_CHAR)
                     logger.info('  WER / CER (dev-clean, sub): %.3f / %.3f %%' %
@@ -333,7 +357,7 @@ def main():
                         wer_test, _ = eval_word(
                             models=[model],
                             dataset=test_data,
-                            eval_batch_size=1,
+                            eval_batch_size=params['batch_size'],
                             beam_width=1,
                             max_decode_len=MAX_DECODE_LEN_WORD,
                             max_decode_len_sub=MAX_DECODE_LEN_CHAR)
@@ -343,7 +367,7 @@ def main():
                         wer_test_sub, cer_test_sub, _ = eval_char(
                             models=[model],
                             dataset=test_data,
-                            eval_batch_size=1,
+                            eval_batch_size=params['batch_size'],
                             beam_width=1,
                             max_decode_len=MAX_DECODE_LEN_CHAR)
                         logger.info(' WER / CER (test-clean, sub): %.3f / %.3f %%' %
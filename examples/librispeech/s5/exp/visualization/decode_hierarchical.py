@@ -78,6 +78,9 @@ def main():
     # GPU setting
     model.set_cuda(deterministic=False, benchmark=True)
 
+    # Encode each utterance only once for the main and sub tasks
+    model.set_encoder_cache()
+
     # sys.stdout = open(join(model.model_dir, 'decode.txt'), 'w')
 
     ######################################################################
@@ -86,6 +89,7 @@ def main():
         # Decode
         best_hyps, aw, perm_idx = model.decode(
             batch['xs'], batch['x_lens'],
+            utt_ids=batch['input_names'],
             beam_width=args.beam_width,
             max_decode_len=MAX_DECODE_LEN_WORD,
             min_decode_len=MIN_DECODE_LEN_WORD,
@@ -93,6 +97,7 @@ def main():
             coverage_penalty=args.coverage_penalty)
         best_hyps_sub, aw_sub, _ = model.decode(
             batch['xs'], batch['x_lens'],
+            utt_ids=batch['input_names'],
             beam_width=args.beam_width_sub,
             max_decode_len=MAX_DECODE_LEN_CHAR,
             min_decode_len=MIN_DECODE_LEN_CHAR,
@@ -0,0 +1,98 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Save CTC posteriors of the evaluation sets (Switchboard corpus)."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from os.path import join, abspath
+import sys
+import argparse
+import numpy as np
+from tqdm import tqdm
+
+sys.path.append(abspath('../../../'))
+from models.load_model import load
+from examples.swbd.s5c.exp.dataset.load_dataset import Dataset
+from utils.config import load_config
+from utils.io.posteriors import PosteriorWriter
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--data_save_path', type=str,
+                    help='path to saved data')
+parser.add_argument('--model_path', type=str,
+                    help='path to the model to evaluate')
+parser.add_argument('--epoch', type=int, default=-1,
+                    help='the epoch to restore')
+parser.add_argument('--eval_batch_size', type=int, default=1,
+                    help='the size of mini-batch in evaluation')
+parser.add_argument('--top_k', type=int, default=None,
+                    help='the number of classes saved per frame. By default, all classes are saved.')
+parser.add_argument('--temperature', type=float, default=1,
+                    help='the temperature of the softmax layer')
+
+
+def main():
+
+    args = parser.parse_args()
+
+    # Load a config file (.yml)
+    params = load_config(join(args.model_path, 'config.yml'), is_eval=True)
+    assert params['model_type'] in ['ctc', 'hierarchical_ctc']
+
+    for i, data_type in enumerate(['eval2000_swbd', 'eval2000_ch']):
+        # Load dataset
+        dataset = Dataset(
+            data_save_path=args.data_save_path,
+            backend=params['backend'],
+            input_freq=params['input_freq'],
+            use_delta=params['use_delta'],
+            use_double_delta=params['use_double_delta'],
+            data_type=data_type, data_size=params['data_size'],
+            label_type=params['label_type'],
+            batch_size=args.eval_batch_size, splice=params['splice'],
+            num_stack=params['num_stack'], num_skip=params['num_skip'],
+            sort_utt=False, tool=params['tool'])
+
+        if i == 0:
+            params['num_classes'] = dataset.num_classes
+
+            # Load model
+            model = load(model_type=params['model_type'],
+                         params=params,
+                         backend=params['backend'])
+
+            # Restore the saved parameters
+            model.load_checkpoint(save_path=args.model_path, epoch=args.epoch)
+
+            # GPU setting
+            model.set_cuda(deterministic=False, benchmark=True)
+
+        save_path = join(args.model_path, 'posteriors_' + data_type)
+        # NOTE: each mini-batch is reduced before the next one is computed
+        writer = PosteriorWriter(save_path, top_k=args.top_k)
+        pbar = tqdm(total=len(dataset))
+        while True:
+            batch, is_new_epoch = dataset.next(batch_size=args.eval_batch_size)
+
+            probs, x_lens, perm_idx = model.posteriors(
+                batch['xs'], batch['x_lens'], temperature=args.temperature)
+            writer.add(batch['input_names'][perm_idx],
+                       np.log(probs + 1e-10), x_lens,
+                       refs=[ys[0] for ys in batch['ys'][perm_idx]])
+            # NOTE: transcript is seperated by space('_')
+
+            pbar.update(len(batch['xs']))
+            if is_new_epoch:
+                break
+        pbar.close()
+
+        writer.close()
+        print('Saved posteriors of %d utterances to %s' %
+              (len(writer), save_path))
+
+
+if __name__ == '__main__':
+    main()
@@ -83,6 +83,9 @@ def main():
     # GPU setting
     model.set_cuda(deterministic=False, benchmark=True)
 
+    # Encode each utterance only once for the main and sub tasks
+    model.set_encoder_cache()
+
     a2c_oracle = False
     resolving_unk = False
 
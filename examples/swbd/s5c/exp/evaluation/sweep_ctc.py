@@ -0,0 +1,172 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tune decoding parameters of the CTC model on saved posteriors
+   (Switchboard corpus). Run dump_posteriors.py first. The acoustic model
+   is not used here, and each setting is decoded by a separate process.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from os.path import join, abspath
+import sys
+import argparse
+import itertools
+import multiprocessing as mp
+import numpy as np
+
+sys.path.append(abspath('../../../'))
+from examples.swbd.s5c.exp.metrics.glm import GLM
+from examples.swbd.s5c.exp.metrics.post_processing import fix_trans
+from models.pytorch_v3.ctc.decoders.greedy_decoder import GreedyDecoder
+from models.pytorch_v3.ctc.decoders.beam_search_decoder import BeamSearchDecoder
+from models.pytorch_v3.ctc.decoders.ngram_lm import NgramLM
+from utils.config import load_config
+from utils.evaluation.edit_distance import compute_wer_corpus
+from utils.io.labels.character import Idx2char
+from utils.io.labels.word import Idx2word
+from utils.io.posteriors import PosteriorArchive
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--data_save_path', type=str,
+                    help='path to saved data')
+parser.add_argument('--model_path', type=str,
+                    help='path to the model which saved posteriors')
+parser.add_argument('--beam_widths', type=str, default='1',
+                    help='comma-separated sizes of beam')
+parser.add_argument('--lm_weights', type=str, default='0',
+                    help='comma-separated weights of the language model')
+parser.add_argument('--blank_scales', type=str, default='1',
+                    help='comma-separated scales of the blank probability')
+parser.add_argument('--length_penalties', type=str, default='0',
+                    help='comma-separated bonuses per token')
+parser.add_argument('--lm_path', type=str, default=None,
+                    help='path to the ARPA file')
+parser.add_argument('--num_workers', type=int, default=mp.cpu_count() - 1,
+                    help='the number of processes')
+parser.add_argument('--batch_size', type=int, default=100,
+                    help='the number of utterances decoded at once')
+parser.add_argument('--glm_path', type=str,
+                    default='/n/sd8/inaguma/corpus/swbd/data/eval2000/LDC2002T43/reference/en20000405_hub5.glm',
+                    help='path to the GLM file')
+
+DATA_TYPES = ['eval2000_swbd', 'eval2000_ch']
+
+# NOTE: set in each process by _init_worker
+_archives = None
+_lm = None
+
+
+def _init_worker(archive_paths, lm_path, vocab_file_path):
+    global _archives, _lm
+    _archives = [PosteriorArchive(path) for path in archive_paths]
+    # NOTE: posteriors are shared among processes by memory mapping
+    if lm_path is not None:
+        _lm = NgramLM(lm_path, vocab_file_path)
+
+
+def decode_archive(archive, beam_width, lm_weight=0, blank_scale=1,
+                   length_penalty=0, lm=None, batch_size=100):
+    """Decode all utterances in the archive.
+    Args:
+        archive (PosteriorArchive):
+        beam_width (int): the size of beam
+        lm_weight (float): the weight of the language model
+        blank_scale (float): the scale of the blank probability
+        length_penalty (float): the bonus per token
+        lm (optional): the language model for shallow fusion
+        batch_size (int): the number of utterances decoded at once
+    Returns:
+        best_hyps (list): A list of length `[U]` of np.ndarray
+    """
+    decode_greedy = GreedyDecoder(blank_index=0)
+    decode_beam = BeamSearchDecoder(blank_index=0)
+
+    best_hyps = []
+    for start in range(0, len(archive), batch_size):
+        log_probs, x_lens = archive.batch(
+            np.arange(start, min(start + batch_size, len(archive))))
+        if blank_scale != 1:
+            log_probs[:, :, 0] += np.log(blank_scale)
+
+        if beam_width == 1:
+            hyps, y_lens = decode_greedy(log_probs, x_lens)
+            hyps = [hyps[b, :y_lens[b]] for b in range(len(y_lens))]
+        else:
+            hyps = decode_beam(log_probs, x_lens, beam_width=beam_width,
+                               alpha=lm_weight, beta=length_penalty,
+                               lm=lm if lm_weight > 0 else None)
+
+        # NOTE: index 0 is reserved for the blank class in warpctc_pytorch
+        best_hyps += [np.asarray(hyp, dtype=np.int64) - 1 for hyp in hyps]
+    return best_hyps
+
+
+def _decode(setting):
+    beam_width, lm_weight, blank_scale, length_penalty, batch_size = setting
+    return [decode_archive(archive, beam_width, lm_weight, blank_scale,
+                           length_penalty, lm=_lm, batch_size=batch_size)
+            for archive in _archives]
+
+
+def main():
+
+    args = parser.parse_args()
+
+    # Load a config file (.yml)
+    params = load_config(join(args.model_path, 'config.yml'), is_eval=True)
+    vocab_file_path = join(args.data_save_path, 'vocab',
+                           params['label_type'] + '.txt')
+    if 'word' in params['label_type']:
+        idx2token = Idx2word(vocab_file_path)
+    else:
+        idx2token = Idx2char(
+            vocab_file_path,
+            capital_divide=params['label_type'] == 'character_capital_divide')
+
+    archive_paths = [join(args.model_path, 'posteriors_' + data_type)
+                     for data_type in DATA_TYPES]
+    archives = [PosteriorArchive(path) for path in archive_paths]
+
+    settings = list(itertools.product(
+        [int(x) for x in args.beam_widths.split(',')],
+        [float(x) for x in args.lm_weights.split(',')],
+        [float(x) for x in args.blank_scales.split(',')],
+        [float(x) for x in args.length_penalties.split(',')]))
+    if args.lm_path is None:
+        assert all(lm_weight == 0 for _, lm_weight, _, _ in settings)
+    else:
+        NgramLM(args.lm_path, vocab_file_path)
+        # NOTE: build the binary cache before it is loaded by processes
+
+    pool = mp.Pool(max(1, min(args.num_workers, len(settings))),
+                   initializer=_init_worker,
+                   initargs=(archive_paths, args.lm_path, vocab_file_path))
+    results = pool.map(_decode, [s + (args.batch_size,) for s in settings],
+                       chunksize=1)
+    pool.close()
+    pool.join()
+
+    # Score in the parent process
+    glm = GLM(glm_path=args.glm_path)
+    refs = [[fix_trans(ref, glm) for ref in archive.refs]
+            for archive in archives]
+    for setting, best_hyps in zip(settings, results):
+        wers = []
+        for refs_i, best_hyps_i in zip(refs, best_hyps):
+            word_refs, word_hyps = [], []
+            for str_ref, hyp in zip(refs_i, best_hyps_i):
+                if len(str_ref) == 0:
+                    continue
+                word_refs.append(str_ref.split('_'))
+                word_hyps.append(fix_trans(idx2token(hyp), glm).split('_'))
+            errors, _, _, _ = compute_wer_corpus(word_refs, word_hyps)
+            wers.append(errors.sum() / sum(len(ref) for ref in word_refs))
+        print('beam: %d, lm: %.2f, blank: %.2f, length: %.2f | WER (SWB / CHE): %.3f / %.3f %%' %
+              (setting + (wers[0] * 100, wers[1] * 100)))
+
+
+if __name__ == '__main__':
+    main()
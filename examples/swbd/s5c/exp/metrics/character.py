@@ -57,8 +57,8 @@ def eval_char(models, dataset, beam_width, max_decode_len,
     num_words, num_chars = 0, 0
     if progressbar:
         pbar = tqdm(total=len(dataset))  # TODO: fix this
-    while True:
-        batch, is_new_epoch = dataset.next(batch_size=eval_batch_size)
+    # NOTE: utterances are decoded in the order of length
+    for batch, _ in dataset.sorted_batches(batch_size=eval_batch_size):
 
         # TODO: add CTC ensemble
 
@@ -71,7 +71,8 @@ def eval_char(models, dataset, beam_width, max_decode_len,
                 batch['xs'], batch['x_lens'],
                 beam_width=beam_width,
                 max_decode_len=max_decode_len,
-                length_penalty=length_penalty)
+                length_penalty=length_penalty,
+                return_attention=False)
             ys = batch['ys'][perm_idx]
             y_lens = batch['y_lens'][perm_idx]
         else:
@@ -80,7 +81,8 @@ def eval_char(models, dataset, beam_width, max_decode_len,
                 beam_width=beam_width,
                 max_decode_len=max_decode_len,
                 length_penalty=length_penalty,
-                task_index=1)
+                task_index=1,
+                return_attention=False)
             ys = batch['ys_sub'][perm_idx]
             y_lens = batch['y_lens_sub'][perm_idx]
 
@@ -147,9 +149,6 @@ def eval_char(models, dataset, beam_width, max_decode_len,
             if progressbar:
                 pbar.update(1)
 
-        if is_new_epoch:
-            break
-
     if progressbar:
         pbar.close()
 
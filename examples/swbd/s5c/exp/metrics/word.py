@@ -62,8 +62,8 @@ def eval_word(models, dataset, beam_width, max_decode_len,
     num_words = 0
     if progressbar:
         pbar = tqdm(total=len(dataset))  # TODO: fix this
-    while True:
-        batch, is_new_epoch = dataset.next(batch_size=eval_batch_size)
+    # NOTE: utterances are decoded in the order of length
+    for batch, _ in dataset.sorted_batches(batch_size=eval_batch_size):
 
         batch_size = len(batch['xs'])
 
@@ -72,7 +72,8 @@ def eval_word(models, dataset, beam_width, max_decode_len,
             assert models[0].model_type in ['ctc']
             for i, model in enumerate(models):
                 probs, x_lens, perm_idx = model.posteriors(
-                    batch['xs'], batch['x_lens'])
+                    batch['xs'], batch['x_lens'],
+                    utt_ids=batch['input_names'])
                 if i == 0:
                     probs_ensenmble = probs
                 else:
@@ -109,6 +110,7 @@ def eval_word(models, dataset, beam_width, max_decode_len,
 
                 best_hyps, aw, best_hyps_sub, aw_sub, perm_idx = model.decode(
                     batch['xs'], batch['x_lens'],
+                    utt_ids=batch['input_names'],
                     beam_width=beam_width,
                     beam_width_sub=beam_width_sub,
                     max_decode_len=max_decode_len,
@@ -116,16 +118,20 @@ def eval_word(models, dataset, beam_width, max_decode_len,
                     length_penalty=length_penalty,
                     teacher_forcing=a2c_oracle,
                     ys_sub=ys_sub,
-                    y_lens_sub=y_lens_sub)
+                    y_lens_sub=y_lens_sub,
+                    return_attention=resolving_unk)
             else:
                 best_hyps, aw, perm_idx = model.decode(
                     batch['xs'], batch['x_lens'],
+                    utt_ids=batch['input_names'],
                     beam_width=beam_width,
                     max_decode_len=max_decode_len,
-                    length_penalty=length_penalty)
+                    length_penalty=length_penalty,
+                    return_attention=resolving_unk)
                 if resolving_unk:
                     best_hyps_sub, aw_sub, _ = model.decode(
                         batch['xs'], batch['x_lens'],
+                        utt_ids=batch['input_names'],
                         beam_width=beam_width,
                         max_decode_len=max_decode_len_sub,
                         length_penalty=length_penalty,
@@ -194,9 +200,6 @@ def eval_word(models, dataset, beam_width, max_decode_len,
             if progressbar:
                 pbar.update(1)
 
-        if is_new_epoch:
-            break
-
     if progressbar:
         pbar.close()
 
@@ -118,12 +118,14 @@ def decode(model, dataset, beam_width,
                 batch['xs'], batch['x_lens'],
                 beam_width=beam_width,
                 max_decode_len=max_decode_len,
-                max_decode_len_sub=max_decode_len)
+                max_decode_len_sub=max_decode_len,
+                return_attention=False)
         else:
             best_hyps, _, perm_idx = model.decode(
                 batch['xs'], batch['x_lens'],
                 beam_width=beam_width,
-                max_decode_len=max_decode_len)
+                max_decode_len=max_decode_len,
+                return_attention=False)
 
         if model.model_type == 'attention' and model.ctc_loss_weight > 0:
             best_hyps_ctc, perm_idx = model.decode_ctc(
@@ -77,6 +77,9 @@ def main():
     # GPU setting
     model.set_cuda(deterministic=False, benchmark=True)
 
+    # Encode each utterance only once for the main and sub tasks
+    model.set_encoder_cache()
+
     # Visualize
     decode(model=model,
            dataset=test_data,
@@ -121,6 +124,7 @@ def decode(model, dataset, beam_width, beam_width_sub,
         if model.model_type == 'nested_attention':
             best_hyps, aw, best_hyps_sub, aw_sub, perm_idx = model.decode(
                 batch['xs'], batch['x_lens'],
+                utt_ids=batch['input_names'],
                 beam_width=beam_width,
                 beam_width_sub=beam_width_sub,
                 max_decode_len=MAX_DECODE_LEN_WORD,
@@ -128,10 +132,12 @@ def decode(model, dataset, beam_width, beam_width_sub,
         else:
             best_hyps, aw, perm_idx = model.decode(
                 batch['xs'], batch['x_lens'],
+                utt_ids=batch['input_names'],
                 beam_width=beam_width,
                 max_decode_len=MAX_DECODE_LEN_WORD)
             best_hyps_sub, aw_sub, _ = model.decode(
                 batch['xs'], batch['x_lens'],
+                utt_ids=batch['input_names'],
                 beam_width=beam_width_sub,
                 max_decode_len=MAX_DECODE_LEN_CHAR,
                 task_index=1)
@@ -46,8 +46,8 @@ def eval_phone(model, dataset, map_file_path, eval_batch_size, beam_width,
     num_phones = 0
     if progressbar:
         pbar = tqdm(total=len(dataset))  # TODO: fix this
-    while True:
-        batch, is_new_epoch = dataset.next(batch_size=eval_batch_size)
+    # NOTE: utterances are decoded in the order of length
+    for batch, _ in dataset.sorted_batches(batch_size=eval_batch_size):
 
         # Decode
         best_hyps, _, perm_idx = model.decode(
@@ -56,7 +56,8 @@ def eval_phone(model, dataset, map_file_path, eval_batch_size, beam_width,
             max_decode_len=max_decode_len,
             min_decode_len=min_decode_len,
             length_penalty=length_penalty,
-            coverage_penalty=coverage_penalty)
+            coverage_penalty=coverage_penalty,
+            return_attention=False)
 
         ys = batch['ys'][perm_idx]
         y_lens = batch['y_lens'][perm_idx]
@@ -105,9 +106,6 @@ def eval_phone(model, dataset, map_file_path, eval_batch_size, beam_width,
             if progressbar:
                 pbar.update(1)
 
-        if is_new_epoch:
-            break
-
     if progressbar:
         pbar.close()
 
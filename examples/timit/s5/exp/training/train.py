@@ -27,6 +27,7 @@ from examples.timit.s5.exp.metrics.phone import eval_phone
 from utils.training.learning_rate_controller import Controller
 from utils.training.plot import plot_loss
 from utils.training.training_loop import train_step
+from utils.training.training_loop import GradientAccumulator, flush_gradients
 from utils.training.logging import set_logger
 from utils.directory import mkdir_join
 from utils.config import load_config, save_config
@@ -179,6 +180,11 @@ def main():
 
     train_data.epoch = epoch - 1
 
+    # Make inputs and outputs of decoders in the data loader
+    if hasattr(model, 'target_dirs'):
+        train_data.target_dirs = model.target_dirs
+        train_data.target_dirs_sub = model.target_dirs_sub
+
     # GPU setting
     model.set_cuda(deterministic=False, benchmark=True)
 
@@ -202,6 +208,20 @@ def main():
         decay_patient_epoch=params['decay_patient_epoch'],
         lower_better=True)
 
+    # Define gradient accumulator
+    if 'accum_grad_steps' not in params.keys():
+        params['accum_grad_steps'] = 1
+    if 'accum_grad_frames' not in params.keys():
+        params['accum_grad_frames'] = 0
+    if 'accum_grad_normalize' not in params.keys():
+        params['accum_grad_normalize'] = 'utterance'
+    accumulator = None
+    if params['backend'] == 'pytorch' and (params['accum_grad_steps'] > 1 or params['accum_grad_frames'] > 0):
+        accumulator = GradientAccumulator(
+            accum_grad_steps=params['accum_grad_steps'],
+            accum_grad_frames=params['accum_grad_frames'],
+            normalize=params['accum_grad_normalize'])
+
     # Setting for tensorboard
     if params['backend'] == 'pytorch':
         tf_writer = SummaryWriter(model.save_path)
@@ -219,7 +239,8 @@ def main():
         # Compute loss in the training set (including parameter update)
         batch_train, is_new_epoch = train_data.next()
         model, loss_train_val = train_step(
-            model, batch_train, params['clip_grad_norm'], params['backend'])
+            model, batch_train, params['clip_grad_norm'], params['backend'],
+            accumulator=accumulator)
         loss_train_mean += loss_train_val
 
         pbar_epoch.update(len(batch_train['xs']))
@@ -261,6 +282,9 @@ def main():
 
         # Save checkpoint and evaluate model per epoch
         if is_new_epoch:
+            model = flush_gradients(
+                model, params['clip_grad_norm'], accumulator)
+
             duration_epoch = time.time() - start_time_epoch
             logger.info('===== EPOCH:%d (%.3f min) =====' %
                         (epoch, duration_epoch / 60))
@@ -280,7 +304,7 @@ def main():
                     model=model,
                     dataset=dev_data,
                     map_file_path='./conf/phones.60-48-39.map',
-                    eval_batch_size=1,
+                    eval_batch_size=params['batch_size'],
                     beam_width=1,
                     max_decode_len=MAX_DECODE_LEN_PHONE)
                 logger.info('  PER (dev): %.3f %%' % (per_dev_epoch * 100))
@@ -300,7 +324,7 @@ def main():
                         model=model,
                         dataset=test_data,
                         map_file_path='./conf/phones.60-48-39.map',
-                        eval_batch_size=1,
+                        eval_batch_size=params['batch_size'],
                         beam_width=1,
                         max_decode_len=MAX_DECODE_LEN_PHONE)
                     logger.info('  PER (test): %.3f %%' % (per_test * 100))
@@ -361,7 +385,7 @@ def main():
         dataset=test_data,
         beam_width=10,
         max_decode_len=MAX_DECODE_LEN_PHONE,
-        eval_batch_size=1,
+        eval_batch_size=params['batch_size'],
         map_file_path='./conf/phones.60-48-39.map')
     logger.info('  PER (test, beam: 10): %.3f %%' %
                 (per_test_best * 100))
@@ -83,7 +83,8 @@ def main():
             max_decode_len=MAX_DECODE_LEN_PHONE,
             min_decode_len=MIN_DECODE_LEN_PHONE,
             length_penalty=args.length_penalty,
-            coverage_penalty=args.coverage_penalty)
+            coverage_penalty=args.coverage_penalty,
+            return_attention=False)
 
         if model.model_type == 'attention' and model.ctc_loss_weight > 0:
             best_hyps_ctc, perm_idx = model.decode_ctc(
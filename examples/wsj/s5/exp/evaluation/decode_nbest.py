@@ -0,0 +1,144 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Save N-best lists of the trained model (WSJ corpus)."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from os.path import join, abspath
+import sys
+import argparse
+from tqdm import tqdm
+
+sys.path.append(abspath('../../../'))
+from models.load_model import load
+from examples.wsj.s5.exp.dataset.load_dataset import Dataset
+from utils.config import load_config
+from utils.evaluation.logging import set_logger
+from utils.io.nbest import save_nbest
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--data_save_path', type=str,
+                    help='path to saved data')
+parser.add_argument('--model_path', type=str,
+                    help='path to the model to evaluate')
+parser.add_argument('--epoch', type=int, default=-1,
+                    help='the epoch to restore')
+parser.add_argument('--beam_width', type=int, default=10,
+                    help='the size of beam')
+parser.add_argument('--nbest', type=int, default=None,
+                    help='the number of hypotheses per utterance')
+parser.add_argument('--eval_batch_size', type=int, default=1,
+                    help='the size of mini-batch in evaluation')
+parser.add_argument('--length_penalty', type=float, default=0,
+                    help='length penalty in beam search decoding')
+parser.add_argument('--ctc_weight', type=float, default=0,
+                    help='the weight of CTC scores in joint CTC/attention decoding')
+parser.add_argument('--score_bwd', action='store_true',
+                    help='score hypotheses with the backward decoder')
+
+MAX_DECODE_LEN_WORD = 32
+MIN_DECODE_LEN_WORD = 2
+MAX_DECODE_LEN_CHAR = 199
+MIN_DECODE_LEN_CHAR = 10
+
+
+def main():
+
+    args = parser.parse_args()
+
+    # Load a config file (.yml)
+    params = load_config(join(args.model_path, 'config.yml'), is_eval=True)
+
+    # Setting for logging
+    logger = set_logger(args.model_path)
+
+    if params['label_type'] == 'word':
+        max_decode_len = MAX_DECODE_LEN_WORD
+        min_decode_len = MIN_DECODE_LEN_WORD
+    else:
+        max_decode_len = MAX_DECODE_LEN_CHAR
+        min_decode_len = MIN_DECODE_LEN_CHAR
+
+    for i, data_type in enumerate(['test_dev93', 'test_eval92']):
+        # Load dataset
+        dataset = Dataset(
+            data_save_path=args.data_save_path,
+            backend=params['backend'],
+            input_freq=params['input_freq'],
+            use_delta=params['use_delta'],
+            use_double_delta=params['use_double_delta'],
+            data_type=data_type,
+            data_size=params['data_size'],
+            label_type=params['label_type'],
+            batch_size=args.eval_batch_size, splice=params['splice'],
+            num_stack=params['num_stack'], num_skip=params['num_skip'],
+            sort_utt=False, tool=params['tool'])
+
+        if i == 0:
+            params['num_classes'] = dataset.num_classes
+
+            # Load model
+            model = load(model_type=params['model_type'],
+                         params=params,
+                         backend=params['backend'])
+
+            # Restore the saved parameters
+            epoch, _, _, _ = model.load_checkpoint(
+                save_path=args.model_path, epoch=args.epoch)
+
+            # GPU setting
+            model.set_cuda(deterministic=False, benchmark=True)
+
+            # Encode each utterance only once for decoding and rescoring
+            model.set_encoder_cache()
+
+            logger.info('beam width: %d' % args.beam_width)
+            logger.info('epoch: %d' % (epoch - 1))
+
+        utt_ids, nbest_hyps, scores = [], [], {'am': []}
+        if args.score_bwd:
+            scores['bwd'] = []
+        pbar = tqdm(total=len(dataset))
+        while True:
+            batch, is_new_epoch = dataset.next(batch_size=args.eval_batch_size)
+
+            if params['model_type'] == 'ctc':
+                hyps, am_scores, perm_idx = model.decode_nbest(
+                    batch['xs'], batch['x_lens'],
+                    beam_width=args.beam_width,
+                    nbest=args.nbest,
+                    utt_ids=batch['input_names'])
+            else:
+                hyps, am_scores, perm_idx = model.decode_nbest(
+                    batch['xs'], batch['x_lens'],
+                    beam_width=args.beam_width,
+                    max_decode_len=max_decode_len,
+                    min_decode_len=min_decode_len,
+                    length_penalty=args.length_penalty,
+                    nbest=args.nbest,
+                    ctc_weight=args.ctc_weight,
+                    utt_ids=batch['input_names'])
+            if args.score_bwd:
+                scores['bwd'] += model.score_nbest(
+                    batch['xs'], batch['x_lens'], hyps, dir='bwd',
+                    utt_ids=batch['input_names'])
+
+            utt_ids += list(batch['input_names'][perm_idx])
+            nbest_hyps += hyps
+            scores['am'] += am_scores
+
+            pbar.update(len(batch['xs']))
+            if is_new_epoch:
+                break
+        pbar.close()
+
+        save_path = join(args.model_path, 'nbest_' + data_type + '.npz')
+        save_nbest(save_path, utt_ids, nbest_hyps, scores)
+        logger.info('Saved %d N-best lists to %s' % (len(utt_ids), save_path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Rescore N-best lists with the RNNLM (WSJ corpus)."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from os.path import join, abspath
+import sys
+import re
+import argparse
+import numpy as np
+
+sys.path.append(abspath('../../../'))
+from models.pytorch.lm.rnnlm import RNNLM
+from examples.wsj.s5.exp.dataset.load_dataset import Dataset
+from utils.config import load_config
+from utils.evaluation.logging import set_logger
+from utils.evaluation.edit_distance import compute_wer
+from utils.evaluation.rescoring import rerank
+from utils.io.nbest import load_nbest
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--data_save_path', type=str,
+                    help='path to saved data')
+parser.add_argument('--model_path', type=str,
+                    help='path to the model which saved N-best lists')
+parser.add_argument('--lm_path', type=str, default=None,
+                    help='path to the RNNLM')
+parser.add_argument('--lm_epoch', type=int, default=-1,
+                    help='the epoch of the RNNLM to restore')
+parser.add_argument('--lm_batch_size', type=int, default=100,
+                    help='the number of hypotheses scored by the RNNLM at once')
+parser.add_argument('--lm_weight', type=float, default=0,
+                    help='the weight of the RNNLM score')
+parser.add_argument('--bwd_weight', type=float, default=0,
+                    help='the weight of the backward decoder score')
+parser.add_argument('--length_bonus', type=float, default=0,
+                    help='the bonus per token')
+
+
+def main():
+
+    args = parser.parse_args()
+
+    # Load a config file (.yml)
+    params = load_config(join(args.model_path, 'config.yml'), is_eval=True)
+
+    # Setting for logging
+    logger = set_logger(args.model_path)
+
+    # Load the RNNLM
+    if args.lm_path is not None:
+        params_lm = load_config(join(args.lm_path, 'config.yml'),
+                                is_eval=True)
+        lm = RNNLM(num_classes=params_lm['num_classes'],
+                   embedding_dim=params_lm['embedding_dim'],
+                   rnn_type=params_lm['rnn_type'],
+                   bidirectional=False,
+                   num_units=params_lm['num_units'],
+                   num_layers=params_lm['num_layers'],
+                   dropout_embedding=0,
+                   dropout_hidden=0,
+                   dropout_output=0,
+                   tie_weights=params_lm['tie_weights'])
+        lm_epoch, _, _, _ = lm.load_checkpoint(
+            save_path=args.lm_path, epoch=args.lm_epoch)
+        lm.set_cuda(deterministic=False, benchmark=True)
+        logger.info('RNNLM epoch: %d' % (lm_epoch - 1))
+
+    weights = {'am': 1, 'lm': args.lm_weight, 'bwd': args.bwd_weight}
+
+    for data_type in ['test_dev93', 'test_eval92']:
+        utt_ids, nbest_hyps, scores = load_nbest(
+            join(args.model_path, 'nbest_' + data_type + '.npz'))
+
+        # Score all hypotheses of all utterances at once
+        if args.lm_path is not None:
+            lm_scores = lm.sequence_log_probs(
+                [hyp for hyps in nbest_hyps for hyp in hyps],
+                batch_size=args.lm_batch_size)
+            scores['lm'] = np.split(
+                lm_scores, np.cumsum([len(hyps) for hyps in nbest_hyps])[:-1])
+
+        best_hyps, _ = rerank(
+            nbest_hyps, scores,
+            weights=dict((k, v) for k, v in weights.items() if k in scores),
+            length_bonus=args.length_bonus)
+        best_hyps = dict(zip(utt_ids, best_hyps))
+
+        # Load references
+        dataset = Dataset(
+            data_save_path=args.data_save_path,
+            backend=params['backend'],
+            input_freq=params['input_freq'],
+            use_delta=params['use_delta'],
+            use_double_delta=params['use_double_delta'],
+            data_type=data_type,
+            data_size=params['data_size'],
+            label_type=params['label_type'],
+            batch_size=1, splice=params['splice'],
+            num_stack=params['num_stack'], num_skip=params['num_skip'],
+            sort_utt=False, tool=params['tool'])
+        idx2token = dataset.idx2word if params['label_type'] == 'word' \
+            else dataset.idx2char
+
+        wer, num_words = 0, 0
+        while True:
+            batch, is_new_epoch = dataset.next()
+            for b in range(len(batch['xs'])):
+                str_ref = batch['ys'][b][0]
+                str_hyp = idx2token(best_hyps[batch['input_names'][b]])
+
+                # Remove garbage labels and consecutive spaces
+                str_ref = re.sub(r'[_]+', '_', re.sub(r'[@>]+', '', str_ref))
+                str_hyp = re.sub(r'[_]+', '_', re.sub(r'[@>]+', '', str_hyp))
+
+                wer_b, _, _, _ = compute_wer(ref=str_ref.split('_'),
+                                             hyp=str_hyp.split('_'),
+                                             normalize=False)
+                wer += wer_b
+                num_words += len(str_ref.split('_'))
+            if is_new_epoch:
+                break
+
+        logger.info('  WER (%s): %.3f %%' %
+                    (data_type, (wer / num_words * 100)))
+
+
+if __name__ == '__main__':
+    main()
@@ -96,7 +96,8 @@ def main():
                 max_decode_len=max_decode_len,
                 max_decode_len_sub=max_decode_len,
                 length_penalty=args.length_penalty,
-                coverage_penalty=args.coverage_penalty)
+                coverage_penalty=args.coverage_penalty,
+                return_attention=False)
         else:
             best_hyps, _, perm_idx = model.decode(
                 batch['xs'], batch['x_lens'],
@@ -104,7 +105,8 @@ def main():
                 max_decode_len=max_decode_len,
                 min_decode_len=min_decode_len,
                 length_penalty=args.length_penalty,
-                coverage_penalty=args.coverage_penalty)
+                coverage_penalty=args.coverage_penalty,
+                return_attention=False)
 
         if model.model_type == 'attention' and model.ctc_loss_weight > 0:
             best_hyps_ctc, perm_idx = model.decode_ctc(
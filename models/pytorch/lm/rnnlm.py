@@ -7,6 +7,7 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -15,7 +16,6 @@ from torch.nn.utils.rnn import pack_padded_sequence, pad_packed_sequence
 from models.pytorch.base import ModelBase
 from models.pytorch.linear import LinearND, Embedding
 from models.pytorch.encoders.rnn import _init_hidden
-from utils.io.variable import np2var, var2np
 
 
 class RNNLM(ModelBase):
@@ -143,11 +143,9 @@ class RNNLM(ModelBase):
             loss (torch.autograd.Variable(float) or float): A tensor of size `[1]`
         """
         # Wrap by Variable
-        ys = np2var(
-            ys, dtype='long', use_cuda=self.use_cuda, backend='pytorch')
+        ys = self.np2tensor(ys, dtype=torch.long)
         # NOTE: ys must be long
-        y_lens = np2var(
-            y_lens, dtype='int', use_cuda=self.use_cuda, backend='pytorch')
+        y_lens = self.np2tensor(y_lens, dtype=torch.int)
 
         # NOTE: exclude <EOS>
         y_lens = y_lens - 1
@@ -158,12 +156,11 @@ class RNNLM(ModelBase):
             self.train()
 
         # Path through character embedding
-        ys_embed = []
-        for t in range(ys.size(1) - 1):
-            ys_embed.append(self.embed(ys[:, t:t + 1]))
-        ys_embed = torch.cat(ys_embed, dim=1)
+        ys_embed = self.embed(
+            ys[:, :-1].masked_fill(ys[:, :-1] == self.padded_index, 0))
         # ys_embed: `[B, T - 1, embedding_dim]`
         # NOTE: exclude the last token
+        # NOTE: padded positions are removed by packing
 
         # Sort xs by lengths in descending order
         y_lens, perm_idx = y_lens.sort(dim=0, descending=True)
@@ -171,7 +168,7 @@ class RNNLM(ModelBase):
         ys_embed = ys_embed[perm_idx]
         # NOTE: batch-first yet here
         # NOTE: must be descending order for pack_padded_sequence
-        y_lens = var2np(y_lens).tolist()
+        y_lens = self.tensor2np(y_lens).tolist()
 
         # Initialize hidden states (and memory cells) per mini-batch
         h_0 = _init_hidden(batch_size=ys.size(0),
@@ -179,8 +176,7 @@ class RNNLM(ModelBase):
                            num_units=self.num_units,
                            num_directions=self.num_directions,
                            num_layers=self.num_layers,
-                           use_cuda=self.use_cuda,
-                           volatile=is_eval)
+                           use_cuda=self.use_cuda)
 
         # Pack RNN inputs
         ys_embed = pack_padded_sequence(ys_embed, y_lens, batch_first=True)
@@ -208,9 +204,125 @@ class RNNLM(ModelBase):
 
         return loss
 
+    def forward_bptt(self, ys, hidden=None, is_eval=False):
+        """Forward computation over a window of the token stream for
+            truncated BPTT.
+        Args:
+            ys (np.ndarray): A tensor of size `[B, T + 1]`
+            hidden (torch.FloatTensor or tuple, optional): the hidden states
+                (and memory cells) carried over from the previous window.
+                By default, the RNN starts from zero states.
+            is_eval (bool): if True, the history will not be saved.
+                This should be used in inference model for memory efficiency.
+        Returns:
+            loss (torch.FloatTensor or float): the negative log-likelihood
+                averaged over tokens. A tensor of size `[1]`
+            hidden (torch.FloatTensor or tuple): the hidden states (and
+                memory cells) after the window, detached from the graph
+        """
+        if self.bidirectional:
+            raise NotImplementedError
+
+        ys = self.np2tensor(ys, dtype=torch.long)
+
+        if is_eval:
+            self.eval()
+        else:
+            self.train()
+
+        with torch.set_grad_enabled(not is_eval):
+            # Embed the whole window at once
+            ys_embed = self.embed(ys[:, :-1])
+            out, hidden = getattr(self, self.rnn_type)(ys_embed, hx=hidden)
+            logits = self.output(out)
+
+            loss = F.cross_entropy(
+                input=logits.view((-1, logits.size(2))),
+                target=ys[:, 1:].contiguous().view(-1))
+
+        if isinstance(hidden, tuple):
+            hidden = tuple(h.detach() for h in hidden)
+        else:
+            hidden = hidden.detach()
+
+        if is_eval:
+            loss = loss.item()
+
+        return loss, hidden
+
     def _encode(self):
         pass
 
+    def predict(self, ys, hidden=None):
+        """Compute log-scale probabilities of the next tokens incrementally.
+        Args:
+            ys (torch.LongTensor): the last tokens. A tensor of size `[B]`
+            hidden (torch.FloatTensor or tuple, optional): the hidden states
+                (and memory cells) of the RNN after the previous tokens.
+                A tensor of size `[num_layers, B, num_units]`.
+                By default, the RNN starts from zero states.
+        Returns:
+            log_probs (torch.FloatTensor): A tensor of size `[B, num_classes]`
+            hidden (torch.FloatTensor or tuple): the hidden states
+                (and memory cells) after ys
+        """
+        if self.bidirectional:
+            raise NotImplementedError
+
+        if hidden is None:
+            hidden = _init_hidden(batch_size=ys.size(0),
+                                  rnn_type=self.rnn_type,
+                                  num_units=self.num_units,
+                                  num_directions=self.num_directions,
+                                  num_layers=self.num_layers,
+                                  use_cuda=self.use_cuda)
+
+        ys_embed = self.embed(ys.unsqueeze(1))
+        out, hidden = getattr(self, self.rnn_type)(ys_embed, hx=hidden)
+        logits = self.output(out.squeeze(1))
+
+        return F.log_softmax(logits, dim=-1), hidden
+
+    def sequence_log_probs(self, ys_list, batch_size=100):
+        """Compute log-likelihoods of whole sentences in batches.
+            Sentences are sorted by their lengths, so that padding is small.
+        Args:
+            ys_list (list): A list of np.ndarray of indices (excluding <EOS>)
+            batch_size (int): the number of sentences computed at once
+        Returns:
+            scores (np.ndarray): natural log probabilities of sentences
+                including <EOS>. A tensor of size `[len(ys_list)]`
+        """
+        if self.bidirectional:
+            raise NotImplementedError
+
+        self.eval()
+        eos = self.num_classes - 1
+        y_lens = np.array([len(y) for y in ys_list], dtype=np.int64)
+        scores = np.zeros((len(ys_list),), dtype=np.float64)
+
+        order = np.argsort(-y_lens, kind='mergesort')
+        with torch.no_grad():
+            for i in range(0, len(order), batch_size):
+                idx = order[i:i + batch_size]
+                max_len = y_lens[idx[0]]
+                ys = np.full((len(idx), max_len + 2), eos, dtype=np.int64)
+                mask = np.zeros((len(idx), max_len + 1), dtype=np.float64)
+                for j, k in enumerate(idx):
+                    ys[j, 1:y_lens[k] + 1] = ys_list[k]
+                    mask[j, :y_lens[k] + 1] = 1
+                # NOTE: outputs after <EOS> are masked instead of packing
+
+                ys = self.np2tensor(ys, dtype=torch.long)
+                out, _ = getattr(self, self.rnn_type)(self.embed(ys[:, :-1]))
+                log_probs = F.log_softmax(self.output(out), dim=-1)
+                log_probs = log_probs.gather(
+                    2, ys[:, 1:].unsqueeze(2)).squeeze(2)
+                scores[idx] = np.sum(
+                    self.tensor2np(log_probs).astype(np.float64) * mask, axis=1)
+
+        return scores
+
     def decode(self, start_token, beam_width, max_decode_len):
         """Decoding in the inference stage.
         Args:
@@ -265,3 +377,143 @@ class RNNLM(ModelBase):
             perm_idx = var2np(perm_idx, backend='pytorch')
 
         return best_hyps, perm_idx
+
+
+class RNNLMScorer(object):
+    """Incremental scoring with the RNN language model for shallow fusion.
+        LM states are integer indices of hypothesis prefixes. A new index is
+        issued for each (prefix, token) pair, and the RNN is run lazily when
+        probabilities after the prefix are requested, so that all uncomputed
+        prefixes are computed by a single forward step.
+        The interface is the same as `NgramLM` in
+        `models.pytorch_v3.ctc.decoders.ngram_lm`.
+    Args:
+        lm (RNNLM): the unidirectional RNN language model.
+            The last class is used as both <SOS> and <EOS>.
+    """
+
+    def __init__(self, lm):
+        if lm.bidirectional:
+            raise ValueError('Bidirectional LMs can not score incrementally.')
+        self.lm = lm
+        self.eos = lm.num_classes - 1
+        self.reset()
+
+    def reset(self):
+        """Clear the state cache."""
+        self._children = {}
+        # NOTE: index 0 is <SOS>
+        self._parents = [-1]
+        self._tokens = [self.eos]
+        self._hidden = [None]
+        self._log_probs = [None]
+
+    def initial_state(self, batch_size):
+        """
+        Args:
+            batch_size (int): the number of states
+        Returns:
+            states (np.ndarray): the states after <SOS>.
+                A tensor of size `[batch_size]`
+        """
+        self.reset()
+        # NOTE: states issued before are invalidated
+        return np.zeros((batch_size,), dtype=np.int64)
+
+    def select_state(self, states, indices):
+        """
+        Args:
+            states (np.ndarray): A tensor of size `[N]`
+            indices (np.ndarray): A tensor of size `[M]`
+        Returns:
+            states (np.ndarray): A tensor of size `[M]`
+        """
+        return states[indices]
+
+    def _compute(self, states):
+        """Run the RNN for all prefixes which are not computed yet.
+        Args:
+            states (np.ndarray): A tensor of size `[N]`
+        """
+        states = [i for i in set(states.tolist())
+                  if self._log_probs[i] is None]
+        if len(states) == 0:
+            return
+
+        if states == [0]:
+            # Start from zero states
+            hidden = None
+        else:
+            # NOTE: parents are always computed before their children are
+            # issued
+            hidden = [self._hidden[self._parents[i]] for i in states]
+            if isinstance(hidden[0], tuple):
+                hidden = tuple(torch.cat([h[j] for h in hidden], dim=1)
+                               for j in range(len(hidden[0])))
+            else:
+                hidden = torch.cat(hidden, dim=1)
+        ys = self.lm.np2tensor(
+            np.array([self._tokens[i] for i in states]), dtype=torch.long)
+
+        self.lm.eval()
+        with torch.no_grad():
+            log_probs, hidden = self.lm.predict(ys, hidden)
+
+        for j, i in enumerate(states):
+            self._log_probs[i] = log_probs[j]
+            if isinstance(hidden, tuple):
+                self._hidden[i] = tuple(h[:, j:j + 1] for h in hidden)
+            else:
+                self._hidden[i] = hidden[:, j:j + 1]
+
+    def log_probs(self, states):
+        """
+        Args:
+            states (np.ndarray): A tensor of size `[N]`
+        Returns:
+            log_probs (torch.FloatTensor): log-scale probabilities of all
+                classes. A tensor of size `[N, num_classes]`
+        """
+        self._compute(states)
+        return torch.stack([self._log_probs[i] for i in states], dim=0)
+
+    def score(self, states, words):
+        """Compute log-scale probabilities of the next words.
+        Args:
+            states (np.ndarray): A tensor of size `[N]`
+            words (np.ndarray): A tensor of size `[N]`
+        Returns:
+            scores (np.ndarray): A tensor of size `[N]`
+            new_states (np.ndarray): A tensor of size `[N]`
+        """
+        states = np.asarray(states, dtype=np.int64)
+        words = np.asarray(words, dtype=np.int64)
+        if len(states) == 0:
+            return np.zeros((0,), dtype=np.float64), states
+
+        uniq, inv = np.unique(states, return_inverse=True)
+        log_probs = self.lm.tensor2np(self.log_probs(uniq))
+        scores = log_probs[inv, words].astype(np.float64)
+
+        new_states = np.empty((len(states),), dtype=np.int64)
+        for j, key in enumerate(zip(states.tolist(), words.tolist())):
+            if key not in self._children:
+                self._children[key] = len(self._parents)
+                self._parents.append(key[0])
+                self._tokens.append(key[1])
+                self._hidden.append(None)
+                self._log_probs.append(None)
+            new_states[j] = self._children[key]
+
+        return scores, new_states
+
+    def final_score(self, states):
+        """
+        Args:
+            states (np.ndarray): A tensor of size `[N]`
+        Returns:
+            scores (np.ndarray): log-scale probabilities of <EOS>.
+                A tensor of size `[N]`
+        """
+        return self.score(states, np.full((len(states),), self.eos,
+                                          dtype=np.int64))[0]
@@ -211,18 +211,20 @@ class AttentionMechanism(nn.Module):
 
             energy.append(energy_head)
 
+        # Mask padded frames
+        steps = Variable(torch.arange(0, max_time).type_as(x_lens.data))
+        pad_mask = steps.unsqueeze(0).expand(batch_size, max_time) >= \
+            x_lens.unsqueeze(1).expand(batch_size, max_time)
+        # NOTE: pad_mask: `[B, T_in]`
+
         context_vec = []
         aw_step = []
         for h in range(self.num_heads):
             # Mask attention distribution
-            energy_mask = Variable(torch.ones(batch_size, max_time))
-            if enc_out_a.is_cuda:
-                energy_mask = energy_mask.cuda()
-            for b in range(batch_size):
-                if x_lens[b].data[0] < max_time:
-                    energy_mask.data[b, x_lens[b].data[0]:] = 0
-            energy[h] *= energy_mask
+            energy[h] = energy[h].masked_fill(pad_mask, -float('inf'))
             # NOTE: energy[h]: `[B, T_in]`
+            # NOTE: padded frames get no attention weight, so that the
+            # results do not depend on the other utterances in the mini-batch
 
             # Sharpening
             energy[h] *= self.sharpening_factor
@@ -9,7 +9,6 @@ from __future__ import print_function
 
 import random
 import numpy as np
-import copy
 import torch
 import torch.nn.functional as F
 
@@ -18,10 +17,16 @@ from models.pytorch_v3.linear import LinearND, Embedding, Embedding_LS
 from models.pytorch_v3.encoders.load_encoder import load
 from models.pytorch_v3.attention.rnn_decoder import RNNDecoder
 from models.pytorch_v3.attention.attention_layer import AttentionMechanism
+from models.pytorch_v3.attention.beam_history import BeamHistory
 from models.pytorch_v3.ctc.ctc import _concatenate_labels, my_warpctc
 from models.pytorch_v3.criterion import cross_entropy_label_smoothing
 from models.pytorch_v3.ctc.decoders.greedy_decoder import GreedyDecoder
 from models.pytorch_v3.ctc.decoders.beam_search_decoder import BeamSearchDecoder
+from models.pytorch_v3.ctc.decoders.ctc_prefix_scorer import CTCPrefixScorer
+from utils.dataset.targets import make_decoder_targets
+
+CTC_SCORING_RATIO = 1.5
+# NOTE: the number of candidates scored by CTC is beam_width * CTC_SCORING_RATIO
 
 
 class AttentionSeq2seq(ModelBase):
@@ -419,7 +424,18 @@ class AttentionSeq2seq(ModelBase):
         if init_forget_gate_bias_with_one:
             self.init_forget_gate_bias_with_one()
 
-    def forward(self, xs, ys, x_lens, y_lens, is_eval=False):
+    @property
+    def target_dirs(self):
+        """Directions of decoders whose inputs and outputs are made by
+            the data loader."""
+        return [dir for dir in ['fwd', 'bwd']
+                if getattr(self, dir + '_weight_0') > 0]
+
+    @property
+    def target_dirs_sub(self):
+        return []
+
+    def forward(self, xs, ys, x_lens, y_lens, is_eval=False, targets=None):
         """Forward computation.
         Args:
             xs (np.ndarray): A tensor of size `[B, T_in, input_size]`
@@ -428,6 +444,9 @@ class AttentionSeq2seq(ModelBase):
             y_lens (np.ndarray): A tensor of size `[B]`
             is_eval (bool): if True, the history will not be saved.
                 This should be used in inference model for memory efficiency.
+            targets (dict, optional): inputs and outputs of decoders made by
+                the data loader (ys_in_fwd, ys_out_fwd, ...). If not given,
+                they are made from ys here.
         Returns:
             loss (torch.autograd.Variable(float) or float): A tensor of size `[1]`
         """
@@ -451,26 +470,8 @@ class AttentionSeq2seq(ModelBase):
         # Compute loss for the forward decoder
         ##################################################
         if self.fwd_weight_0 > 0:
-            # NOTE: ys is padded with -1 here
-            # ys_in_fwd is padded with <EOS> in order to convert to one-hot vector,
-            # and added <SOS> before the first token
-            # ys_out_fwd is padded with -1, and added <EOS> after the last token
-            ys_in_fwd = self._create_var((ys.shape[0], ys.shape[1] + 1),
-                                         fill_value=self.eos_0, dtype='long')
-            ys_out_fwd = self._create_var((ys.shape[0], ys.shape[1] + 1),
-                                          fill_value=-1, dtype='long')
-
-            ys_in_fwd.data[:, 0] = self.sos_0
-            for b in range(len(xs)):
-                ys_in_fwd.data[b, 1:y_lens[b] + 1] = torch.from_numpy(
-                    ys[b, :y_lens[b]])
-                ys_out_fwd.data[b, :y_lens[b]] = torch.from_numpy(
-                    ys[b, :y_lens[b]])
-                ys_out_fwd.data[b, y_lens[b]] = self.eos_0
-
-            if self.use_cuda:
-                ys_in_fwd = ys_in_fwd.cuda()
-                ys_out_fwd = ys_out_fwd.cuda()
+            ys_in_fwd, ys_out_fwd = self._make_decoder_targets(
+                ys, y_lens, task=0, dir='fwd', targets=targets)
 
             # Wrap by Variable
             y_lens_fwd = self.np2var(y_lens, dtype='int')
@@ -492,27 +493,8 @@ class AttentionSeq2seq(ModelBase):
         # Compute loss for the backward decoder
         ##################################################
         if self.bwd_weight_0 > 0:
-            # Reverse the order
-            ys_tmp = copy.deepcopy(ys)
-            for b in range(len(xs)):
-                ys_tmp[b, :y_lens[b]] = ys[b, :y_lens[b]][::-1]
-
-            ys_in_bwd = self._create_var((ys.shape[0], ys.shape[1] + 1),
-                                         fill_value=self.eos_0, dtype='long')
-            ys_out_bwd = self._create_var((ys.shape[0], ys.shape[1] + 1),
-                                          fill_value=-1, dtype='long')
-
-            ys_in_bwd.data[:, 0] = self.sos_0
-            for b in range(len(xs)):
-                ys_in_bwd.data[b, 1:y_lens[b] + 1] = torch.from_numpy(
-                    ys_tmp[b, :y_lens[b]])
-                ys_out_bwd.data[b, :y_lens[b]] = torch.from_numpy(
-                    ys_tmp[b, :y_lens[b]])
-                ys_out_bwd.data[b, y_lens[b]] = self.eos_0
-
-            if self.use_cuda:
-                ys_in_bwd = ys_in_bwd.cuda()
-                ys_out_bwd = ys_out_bwd.cuda()
+            ys_in_bwd, ys_out_bwd = self._make_decoder_targets(
+                ys, y_lens, task=0, dir='bwd', targets=targets)
 
             # Wrap by Variable
             y_lens_bwd = self.np2var(y_lens, dtype='int')
@@ -561,6 +543,38 @@ class AttentionSeq2seq(ModelBase):
 
         return loss
 
+    def _make_decoder_targets(self, ys, y_lens, task, dir, targets=None):
+        """Make inputs and outputs of the decoder.
+        Args:
+            ys (np.ndarray): A tensor of size `[B, T_out]`, which should be
+                padded with -1.
+            y_lens (np.ndarray): A tensor of size `[B]`
+            task (int): the index of a task
+            dir (str): fwd or bwd
+            targets (dict, optional): inputs and outputs made by the data
+                loader
+        Returns:
+            ys_in (torch.autograd.Variable, long): A tensor of size
+                `[B, T_out + 1]`, which is padded with <EOS>
+            ys_out (torch.autograd.Variable, long): A tensor of size
+                `[B, T_out + 1]`, which is padded with -1
+        """
+        key = ('_sub' if task > 0 else '') + '_' + dir
+        if targets is not None and 'ys_in' + key in targets:
+            ys_in = targets['ys_in' + key]
+            ys_out = targets['ys_out' + key]
+        else:
+            ys_in, ys_out = make_decoder_targets(
+                ys, y_lens,
+                sos=getattr(self, 'sos_' + str(task)),
+                eos=getattr(self, 'eos_' + str(task)),
+                reverse=dir == 'bwd')
+        # NOTE: ys_in is padded with <EOS> in order to convert to one-hot
+        # vector, and added <SOS> before the first token.
+        # ys_out is padded with -1, and added <EOS> after the last token.
+
+        return self.np2var(ys_in, dtype='long'), self.np2var(ys_out, dtype='long')
+
     def compute_xe_loss(self, enc_out, ys_in, ys_out, x_lens, y_lens, task, dir):
         """Compute XE loss.
         Args:
@@ -865,7 +879,8 @@ class AttentionSeq2seq(ModelBase):
 
     def decode(self, xs, x_lens, beam_width, max_decode_len, min_decode_len=0,
                length_penalty=0, coverage_penalty=0, task_index=0,
-               resolving_unk=False):
+               resolving_unk=False, return_attention=True, lm=None, lm_weight=0,
+               ctc_weight=0, utt_ids=None):
         """Decoding in the inference stage.
         Args:
             xs (np.ndarray): A tensor of size `[B, T_in, input_size]`
@@ -877,6 +892,15 @@ class AttentionSeq2seq(ModelBase):
             coverage_penalty (float): coverage penalty in beam search decoding
             task_index (int): not used (to make compatible)
             resolving_unk (bool): not used (to make compatible)
+            return_attention (bool): if False, attention weights are not
+                collected and None is returned instead
+            lm (RNNLMScorer, optional): the language model for shallow fusion
+                in beam search. The vocabulary must be the same as the model.
+            lm_weight (float): the weight of the language model
+            ctc_weight (float): the weight of CTC prefix scores in joint
+                CTC/attention decoding. The auxiliary CTC layer is required.
+            utt_ids (list, optional): utterance ids to look up the encoder
+                output cache
         Returns:
             best_hyps (np.ndarray): A tensor of size `[B]`
             # aw (np.ndarray): A tensor of size `[B, T_out, T_in, num_heads]`
@@ -885,25 +909,25 @@ class AttentionSeq2seq(ModelBase):
         """
         self.eval()
 
-        # Wrap by Variable
-        xs = self.np2var(xs)
-        x_lens = self.np2var(x_lens, dtype='int')
-
         # Encode acoustic features
-        enc_out, x_lens, perm_idx = self._encode(xs, x_lens)
+        enc_out, x_lens, perm_idx = self._encode_cached(xs, x_lens, utt_ids)
 
         dir = 'fwd' if self.fwd_weight_0 >= self.bwd_weight_0 else 'bwd'
 
-        if beam_width == 1:
+        is_greedy = beam_width == 1 and ctc_weight == 0
+        if is_greedy:
             best_hyps, aw = self._decode_infer_greedy(
-                enc_out, x_lens, max_decode_len, task=0, dir=dir)
+                enc_out, x_lens, max_decode_len, task=0, dir=dir,
+                return_attention=return_attention)
         else:
             best_hyps, aw = self._decode_infer_beam(
                 enc_out, x_lens, beam_width, max_decode_len, min_decode_len,
-                length_penalty, coverage_penalty, task=0, dir=dir)
+                length_penalty, coverage_penalty, task=0, dir=dir,
+                return_attention=return_attention,
+                lm=lm, lm_weight=lm_weight, ctc_weight=ctc_weight)
 
         # TODO: fix this
-        if beam_width == 1:
+        if is_greedy and return_attention:
             aw = aw[:, :, :, 0]
 
         # Permutate indices to the original order
@@ -914,8 +938,123 @@ class AttentionSeq2seq(ModelBase):
 
         return best_hyps, aw, perm_idx
 
-    def _decode_infer_greedy(self, enc_out, x_lens, max_decode_len, task, dir):
+    def decode_nbest(self, xs, x_lens, beam_width, max_decode_len,
+                     min_decode_len=0, length_penalty=0, nbest=None,
+                     lm=None, lm_weight=0, ctc_weight=0, utt_ids=None):
+        """Beam search decoding with N-best outputs.
+        Args:
+            xs (np.ndarray): A tensor of size `[B, T_in, input_size]`
+            x_lens (np.ndarray): A tensor of size `[B]`
+            beam_width (int): the size of beam
+            max_decode_len (int): the maximum sequence length of tokens
+            min_decode_len (int): the minimum sequence length of tokens
+            length_penalty (float): length penalty in beam search decoding
+            nbest (int, optional): the number of hypotheses of each
+                utterance. By default, beam_width.
+            lm (RNNLMScorer, optional): the language model for shallow fusion
+            lm_weight (float): the weight of the language model
+            ctc_weight (float): the weight of CTC prefix scores in joint
+                CTC/attention decoding
+            utt_ids (list, optional): utterance ids to look up the encoder
+                output cache
+        Returns:
+            nbest_hyps (list): A list of length `[B]`, which contains lists
+                of np.ndarray (excluding <EOS>) in the descending order of
+                scores
+            scores (list): A list of length `[B]`, which contains
+                np.ndarray of scores
+            perm_idx (np.ndarray): A tensor of size `[B]`
+        """
+        self.eval()
+
+        # Encode acoustic features
+        enc_out, x_lens, perm_idx = self._encode_cached(xs, x_lens, utt_ids)
+
+        dir = 'fwd' if self.fwd_weight_0 >= self.bwd_weight_0 else 'bwd'
+
+        nbest_hyps, scores = self._decode_infer_beam(
+            enc_out, x_lens, beam_width, max_decode_len, min_decode_len,
+            length_penalty, 0, task=0, dir=dir, return_attention=False,
+            lm=lm, lm_weight=lm_weight,
+            nbest=beam_width if nbest is None else nbest,
+            ctc_weight=ctc_weight)
+
+        # Permutate indices to the original order
+        if perm_idx is None:
+            perm_idx = np.arange(0, len(xs), 1)
+        else:
+            perm_idx = self.var2np(perm_idx)
+
+        return nbest_hyps, scores, perm_idx
+
+    def score_nbest(self, xs, x_lens, nbest_hyps, dir='bwd', batch_size=100,
+                    utt_ids=None):
+        """Compute log-likelihoods of N-best hypotheses by teacher-forcing.
+            The encoder is run once, and all hypotheses of all utterances are
+            scored in batches sorted by their lengths.
+        Args:
+            xs (np.ndarray): A tensor of size `[B, T_in, input_size]`
+            x_lens (np.ndarray): A tensor of size `[B]`
+            nbest_hyps (list): A list of length `[B]`, which contains lists
+                of np.ndarray. They must be in the order of perm_idx
+                returned by `decode_nbest`.
+            dir (str): fwd or bwd. Hypotheses are reversed for bwd.
+            batch_size (int): the number of hypotheses scored at once
+            utt_ids (list, optional): utterance ids to look up the encoder
+                output cache
+        Returns:
+            scores (list): A list of length `[B]`, which contains
+                np.ndarray of log-likelihoods including <EOS>
+        """
+        assert getattr(self, dir + '_weight_0') > 0
+
+        self.eval()
+
+        # Encode acoustic features
+        enc_out, x_lens, _ = self._encode_cached(xs, x_lens, utt_ids)
+
+        utt_idx = np.array([b for b, hyps in enumerate(nbest_hyps)
+                            for _ in hyps], dtype=np.int64)
+        hyps = [hyp[::-1] if dir == 'bwd' else hyp
+                for hyps in nbest_hyps for hyp in hyps]
+        y_lens = np.array([len(hyp) for hyp in hyps], dtype=np.int64)
+        scores = np.zeros((len(hyps),), dtype=np.float64)
+
+        # NOTE: teacher-forcing without scheduled sampling
+        ss_prob, self._ss_prob = self._ss_prob, 0
+
+        order = np.argsort(-y_lens, kind='mergesort')
+        for i in range(0, len(order), batch_size):
+            idx = order[i:i + batch_size]
+            max_len = y_lens[idx[0]]
+            ys_in = np.full((len(idx), max_len + 1), self.eos_0,
+                            dtype=np.int64)
+            ys_out = np.full((len(idx), max_len + 1), -1, dtype=np.int64)
+            ys_in[:, 0] = self.sos_0
+            for j, k in enumerate(idx):
+                ys_in[j, 1:y_lens[k] + 1] = hyps[k]
+                ys_out[j, :y_lens[k]] = hyps[k]
+                ys_out[j, y_lens[k]] = self.eos_0
+
+            rows = self.np2var(utt_idx[idx], dtype='long')
+            logits, _ = self._decode_train(
+                enc_out.index_select(0, rows), x_lens.index_select(0, rows),
+                self.np2var(ys_in, dtype='long'), task=0, dir=dir)
+            log_probs = self.var2np(F.log_softmax(logits, dim=-1))
+            log_probs = log_probs[np.arange(len(idx))[:, None],
+                                  np.arange(max_len + 1)[None, :],
+                                  np.maximum(ys_out, 0)]
+            scores[idx] = np.sum(log_probs * (ys_out >= 0), axis=1)
+
+        self._ss_prob = ss_prob
+
+        return np.split(scores, np.cumsum([len(h) for h in nbest_hyps])[:-1])
+
+    def _decode_infer_greedy(self, enc_out, x_lens, max_decode_len, task, dir,
+                             return_attention=True):
         """Greedy decoding in the inference stage.
+            Sequences which have emitted <EOS> are removed from the active
+            mini-batch, and the rest of them are padded with <EOS>.
         Args:
             enc_out (torch.autograd.Variable, float): A tensor of size
                 `[B, T_in, encoder_num_units]`
@@ -923,20 +1062,23 @@ class AttentionSeq2seq(ModelBase):
             max_decode_len (int): the maximum sequence length of tokens
             task (int): the index of a task
             dir (str): fwd or bwd
+            return_attention (bool): if False, attention weights are not
+                collected
         Returns:
             best_hyps (np.ndarray): A tensor of size `[B, T_out]`
-            aw (np.ndarray): A tensor of size `[B, T_out, T_in, num_heads]`
+            aw (np.ndarray): A tensor of size `[B, T_out, T_in, num_heads]`,
+                or None if return_attention is False
         """
         if dir == 'bwd':
             assert getattr(self, 'bwd_weight_' + str(task)) > 0
 
         batch_size, max_time = enc_out.size()[:2]
+        num_heads = getattr(self, 'num_heads_' + str(task))
 
         # Initialize decoder state
         dec_state, dec_out = self._init_dec_state(enc_out, x_lens, task, dir)
-        aw_step = self._create_var((
-            batch_size, max_time, getattr(self, 'num_heads_' + str(task))),
-            fill_value=0., volatile=True)
+        aw_step = self._create_var((batch_size, max_time, num_heads),
+                                   fill_value=0., volatile=True)
         context_vec = self._create_var(
             (batch_size, 1, enc_out.size(-1)), fill_value=0., volatile=True)
 
@@ -947,121 +1089,141 @@ class AttentionSeq2seq(ModelBase):
 
         # Pre-computation of encoder-side features computing scores
         enc_out_a = []
-        for h in range(getattr(self, 'num_heads_' + str(task))):
+        for h in range(num_heads):
             enc_out_a += [getattr(getattr(self, 'attend_' +
                                           str(task) + '_' + dir), 'W_enc_head' + str(h))(enc_out)]
         enc_out_a = torch.stack(enc_out_a, dim=-1)
 
+        # Indices of unfinished sequences in the mini-batch
+        active_idx = self.np2var(np.arange(batch_size), dtype='long')
+
         best_hyps, aw = [], []
-        y_lens = np.zeros((batch_size,), dtype=np.int32)
-        eos_flag = [False] * batch_size
         for t in range(max_decode_len):
-            y = getattr(self, 'embed_' + str(task))(y)
-
-            if self.decoding_order == 'bahdanau':
-                if t > 0:
-                    # Recurrency
-                    dec_in = torch.cat([y, context_vec], dim=-1)
-                    dec_out, dec_state = getattr(
-                        self, 'decoder_' + str(task) + '_' + dir)(dec_in, dec_state)
-
-                # Score
-                context_vec, aw_step = getattr(self, 'attend_' + str(task) + '_' + dir)(
-                    enc_out, enc_out_a, x_lens, dec_out, aw_step)
-
-            elif self.decoding_order == 'luong':
-                # Recurrency
-                dec_in = torch.cat([y, context_vec], dim=-1)
-                dec_out, dec_state = getattr(
-                    self, 'decoder_' + str(task) + '_' + dir)(dec_in, dec_state)
-
-                # Score
-                context_vec, aw_step = getattr(self, 'attend_' + str(task) + '_' + dir)(
-                    enc_out, enc_out_a, x_lens, dec_out, aw_step)
-
-            elif self.decoding_order == 'conditional':
-                # Recurrency of the first decoder
-                _dec_out, _dec_state = getattr(self, 'decoder_first_' + str(task) + '_' + dir)(
-                    y, dec_state)
-
-                # Score
-                context_vec, aw_step = getattr(self, 'attend_' + str(task) + '_' + dir)(
-                    enc_out, enc_out_a, x_lens, _dec_out, aw_step)
-
-                # Recurrency of the second decoder
-                dec_out, dec_state = getattr(self, 'decoder_second_' + str(task) + '_' + dir)(
-                    context_vec, _dec_state)
-
-            else:
-                raise ValueError(self.decoding_order)
-
-            # Generate
-            logits_step = getattr(self, 'fc_' + str(task) + '_' + dir)(F.tanh(
-                getattr(self, 'W_d_' + str(task) + '_' + dir)(dec_out) +
-                getattr(self, 'W_c_' + str(task) + '_' + dir)(context_vec)))
+            logits_step, dec_state, dec_out, context_vec, aw_step = self._decode_step(
+                enc_out, enc_out_a, x_lens, y,
+                dec_state, dec_out, context_vec, aw_step, t == 0, task, dir)
 
             # Pick up 1-best
             y = torch.max(logits_step.squeeze(1), dim=1)[1].unsqueeze(1)
-            best_hyps.append(y)
 
-            aw.append(aw_step)
-
-            # Count lengths of hypotheses
-            if dir == 'bwd':
-                for b in range(batch_size):
-                    if not eos_flag[b]:
-                        if y.data.cpu().numpy()[b] == eos:
-                            eos_flag[b] = True
-                        else:
-                            y_lens[b] += 1
-                        # NOTE: exclude <EOS>
-
-            # Break if <EOS> is outputed in all mini-batch
-            if torch.sum(y.data == eos) == y.numel():
+            # Scatter outputs of the active sequences to the whole mini-batch
+            if y.size(0) == batch_size:
+                best_hyps.append(y)
+                if return_attention:
+                    aw.append(aw_step)
+            else:
+                y_all = self._create_var(
+                    (batch_size, 1), fill_value=eos, dtype='long')
+                y_all.data.index_copy_(0, active_idx.data, y.data)
+                best_hyps.append(y_all)
+                if return_attention:
+                    aw_step_all = self._create_var(
+                        (batch_size, max_time, num_heads), fill_value=0., volatile=True)
+                    aw_step_all.data.index_copy_(
+                        0, active_idx.data, aw_step.data)
+                    aw.append(aw_step_all)
+
+            # Remove finished sequences from the active mini-batch
+            is_active = y.data.squeeze(1) != eos
+            num_active = is_active.sum()
+            if num_active == 0:
                 break
-
-        # Concatenate in T_out dimension
-        best_hyps = torch.cat(best_hyps, dim=1)
-        aw = torch.stack(aw, dim=1)
-
-        # Convert to numpy
-        best_hyps = self.var2np(best_hyps)
-        aw = self.var2np(aw)
+            elif num_active < y.size(0):
+                keep_idx = torch.autograd.Variable(
+                    is_active.nonzero().squeeze(1))
+                active_idx = active_idx.index_select(0, keep_idx)
+                enc_out = enc_out.index_select(0, keep_idx)
+                enc_out_a = enc_out_a.index_select(0, keep_idx)
+                x_lens = x_lens.index_select(0, keep_idx)
+                y = y.index_select(0, keep_idx)
+                dec_state = self._reorder_dec_state(dec_state, keep_idx)
+                dec_out = dec_out.index_select(0, keep_idx)
+                context_vec = context_vec.index_select(0, keep_idx)
+                aw_step = aw_step.index_select(0, keep_idx)
+
+        # Concatenate in T_out dimension & convert to numpy
+        best_hyps = self.var2np(torch.cat(best_hyps, dim=1))
+        if return_attention:
+            aw = self.var2np(torch.stack(aw, dim=1))
+        else:
+            aw = None
 
         # Reverse the order
         if dir == 'bwd':
-            for b in range(batch_size):
-                best_hyps[b, :y_lens[b]] = best_hyps[b, :y_lens[b]][::-1]
+            # Count lengths of hypotheses
+            y_lens = np.sum(np.cumsum(best_hyps == eos, axis=1) == 0, axis=1)
+            # NOTE: exclude <EOS>
+
+            steps = np.arange(best_hyps.shape[1])[None, :]
+            reverse_idx = np.where(steps < y_lens[:, None],
+                                   y_lens[:, None] - 1 - steps, steps)
+            best_hyps = best_hyps[np.arange(batch_size)[:, None], reverse_idx]
 
         return best_hyps, aw
 
     def _decode_infer_beam(self, enc_out, x_lens, beam_width,
                            max_decode_len, min_decode_len,
-                           length_penalty, coverage_penalty, task, dir):
+                           length_penalty, coverage_penalty, task, dir,
+                           return_attention=True, lm=None, lm_weight=0,
+                           nbest=None, ctc_weight=0):
         """Beam search decoding in the inference stage.
+            All hypotheses of all utterances are decoded at once by flattening
+            the batch and beam dimensions into `[B * beam_width]`.
         Args:
             enc_out (torch.autograd.Variable, float): A tensor of size
                 `[B, T_in, encoder_num_units]`
             x_lens (torch.autograd.Variable, int): A tensor of size `[B]`
             beam_width (int): the size of beam
-            max_decode_len (int): the maximum sequence length of tokens
+            max_decode_len (int): the maximum sequence length of tokens.
+                In joint CTC/attention decoding, this can be None, and then
+                the length of encoder outputs is used.
             min_decode_len (int): the minimum sequence length of tokens
             length_penalty (float): length penalty in beam search decoding
             coverage_penalty (float): coverage penalty in beam search decoding
             task (int): the index of a task
             dir (str): fwd or bwd
+            return_attention (bool): if False, attention weights are not
+                collected
+            lm (RNNLMScorer, optional): the language model for shallow fusion
+            lm_weight (float): the weight of the language model
+            nbest (int, optional): if not None, return N-best hypotheses
+                and their scores instead of best_hyps and aw
+            ctc_weight (float): the weight of CTC prefix scores in joint
+                CTC/attention decoding
         Returns:
             best_hyps (np.ndarray): A tensor of size `[B]`
-            aw (list): attention weights of the best hypothesis
+            aw (list): attention weights of the best hypothesis,
+                or None if return_attention is False
         """
         if dir == 'bwd':
             assert getattr(self, 'bwd_weight_' + str(task)) > 0
 
+        if coverage_penalty > 0:
+            raise NotImplementedError
+
+        if lm is not None and dir == 'bwd':
+            raise ValueError('The LM can not be fused with the backward decoder.')
+
+        batch_size, max_time = enc_out.size()[:2]
+        num_hyps = batch_size * beam_width
+
         # Start from <SOS>
         sos = getattr(self, 'sos_' + str(task))
         eos = getattr(self, 'eos_' + str(task))
 
-        min_decode_len_ratio = 0.05
+        if lm is not None:
+            # NOTE: the LM must share the vocabulary and <EOS>
+            assert lm.lm.num_classes == self.num_classes
+            assert lm.eos == eos
+
+        # CTC prefix scores over the shared encoder outputs
+        if ctc_weight > 0:
+            ctc_scorer = self._ctc_prefix_scorer(enc_out, x_lens, task, dir)
+            utt_idx = np.repeat(np.arange(batch_size), beam_width)
+            ctc_state = ctc_scorer.initial_state(utt_idx)
+            if max_decode_len is None:
+                max_decode_len = int(self.var2np(x_lens).max()) + 1
+                # NOTE: CTC can not emit more tokens than frames
 
         # Pre-computation of encoder-side features computing scores
         enc_out_a = []
@@ -1070,173 +1232,408 @@ class AttentionSeq2seq(ModelBase):
                                           str(task) + '_' + dir), 'W_enc_head' + str(h))(enc_out)]
         enc_out_a = torch.stack(enc_out_a, dim=-1)
 
-        best_hyps, aw = [], []
-        y_lens = np.zeros((enc_out.size(0),), dtype=np.int32)
-        for b in range(enc_out.size(0)):
-            # Initialization per utterance
-            dec_state, dec_out = self._init_dec_state(
-                enc_out[b:b + 1], x_lens[b:b + 1], task, dir)
-            aw_step = self._create_var(
-                (1,  x_lens[b].data[0], getattr(
-                    self, 'num_heads_' + str(task))), fill_value=0., volatile=True)
-            context_vec = self._create_var(
-                (1,  1, enc_out.size(-1)), fill_value=0., volatile=True)
-
-            complete = []
-            beam = [{'hyp': [sos],
-                     'score': 0,  # log 1
-                     'dec_state': dec_state,
-                     'dec_out': dec_out,
-                     'context_vec': context_vec,
-                     'aw_steps': [aw_step]}]
-            for t in range(max_decode_len):
-                new_beam = []
-                for i_beam in range(len(beam)):
-                    y = self._create_var(
-                        (1, 1), fill_value=beam[i_beam]['hyp'][-1], dtype='long')
-                    y = getattr(self, 'embed_' + str(task))(y)
-
-                    if self.decoding_order == 'bahdanau':
-                        if t == 0:
-                            dec_out = beam[i_beam]['dec_out']
-                        else:
-                            # Recurrency
-                            dec_in = torch.cat(
-                                [y, beam[i_beam]['context_vec']], dim=-1)
-                            dec_out, dec_state = getattr(
-                                self, 'decoder_' + str(task) + '_' + dir)(dec_in, beam[i_beam]['dec_state'])
-
-                        # Score
-                        context_vec, aw_step = getattr(self, 'attend_' + str(task) + '_' + dir)(
-                            enc_out[b:b + 1, :x_lens.data[b]],
-                            enc_out_a[b:b + 1, :x_lens.data[b]],
-                            x_lens[b:b + 1],
-                            dec_out, beam[i_beam]['aw_steps'][-1])
-
-                    elif self.decoding_order == 'luong':
-                        # Recurrency
-                        dec_in = torch.cat(
-                            [y, beam[i_beam]['context_vec']], dim=-1)
-                        dec_out, dec_state = getattr(self, 'decoder_' + str(task) + '_' + dir)(
-                            dec_in, beam[i_beam]['dec_state'])
-
-                        # Score
-                        context_vec, aw_step = getattr(self, 'attend_' + str(task) + '_' + dir)(
-                            enc_out[b:b + 1, :x_lens.data[b]],
-                            enc_out_a[b:b + 1, :x_lens.data[b]],
-                            x_lens[b:b + 1],
-                            dec_out, beam[i_beam]['aw_steps'][-1])
-
-                    elif self.decoding_order == 'conditional':
-                        # Recurrency of the first decoder
-                        _dec_out, _dec_state = getattr(self, 'decoder_first_' + str(task) + '_' + dir)(
-                            y, beam[i_beam]['dec_state'])
-
-                        # Score
-                        context_vec, aw_step = getattr(self, 'attend_' + str(task) + '_' + dir)(
-                            enc_out[b:b + 1, :x_lens.data[b]],
-                            enc_out_a[b:b + 1, :x_lens.data[b]],
-                            x_lens[b:b + 1],
-                            _dec_out, beam[i_beam]['aw_steps'][-1])
-
-                        # Recurrency of the second decoder
-                        dec_out, dec_state = getattr(self, 'decoder_second_' + str(task) + '_' + dir)(
-                            context_vec, _dec_state)
-
-                    else:
-                        raise ValueError(self.decoding_order)
-
-                    # Generate
-                    logits_step = getattr(self, 'fc_' + str(task) + '_' + dir)(F.tanh(
-                        getattr(self, 'W_d_' + str(task) + '_' + dir)(dec_out) +
-                        getattr(self, 'W_c_' + str(task) + '_' + dir)(context_vec)))
-
-                    # Path through the softmax layer & convert to log-scale
-                    log_probs = F.log_softmax(logits_step.squeeze(1), dim=1)
-                    # log_probs = logits_step.squeeze(1)
-                    # NOTE: `[1 (B), 1, num_classes]` -> `[1 (B), num_classes]`
-
-                    # Pick up the top-k scores
-                    log_probs_topk, indices_topk = torch.topk(
-                        log_probs, k=beam_width, dim=1, largest=True, sorted=True)
-
-                    for k in range(beam_width):
-                        # Exclude short hypotheses
-                        if indices_topk[0, k].data[0] == eos and len(beam[i_beam]['hyp']) < min_decode_len:
-                            continue
-                        # if indices_topk[0, k].data[0] == eos and len(beam[i_beam]['hyp']) < x_lens[b].data[0] * min_decode_len_ratio:
-                        #     continue
-
-                        # Add length penalty
-                        score = beam[i_beam]['score'] + \
-                            log_probs_topk.data[0, k] + length_penalty
-
-                        # Add coverage penalty
-                        if coverage_penalty > 0:
-                            raise NotImplementedError
-
-                            threshold = 0.5
-                            aw_steps = torch.cat(
-                                beam[i_beam]['aw_steps'], dim=0).sum(0).squeeze(1)
-
-                            # Google NMT
-                            # cov_sum = torch.where(
-                            #     aw_steps < threshold, aw_steps, torch.ones_like(aw_steps) * threshold).sum(0)
-                            # score += torch.log(cov_sum) * coverage_penalty
-
-                            # Toward better decoding
-                            cov_sum = torch.where(
-                                aw_steps > threshold, aw_steps, torch.zeros_like(aw_steps)).sum(0)
-                            score += cov_sum * coverage_penalty
-
-                        new_beam.append(
-                            {'hyp': beam[i_beam]['hyp'] + [indices_topk.data[0, k]],
-                             'score': score,
-                             'dec_state': copy.deepcopy(dec_state),
-                             'dec_out': dec_out,
-                             'context_vec': context_vec,
-                             'aw_steps': beam[i_beam]['aw_steps'] + [aw_step]})
-
-                new_beam = sorted(
-                    new_beam, key=lambda x: x['score'], reverse=True)
-
-                # Remove complete hypotheses
-                not_complete = []
-                for cand in new_beam[:beam_width]:
-                    if cand['hyp'][-1] == eos:
-                        complete.append(cand)
-                    else:
-                        not_complete.append(cand)
+        # Expand to all hypotheses
+        x_lens_np = self.var2np(x_lens)
 
-                if len(complete) >= beam_width:
-                    complete = complete[:beam_width]
-                    break
+        # The minimum length of each hypothesis
+        min_decode_lens = np.full((num_hyps,), min_decode_len, dtype=np.int64)
+        if ctc_weight > 0:
+            min_decode_lens = np.minimum(
+                min_decode_lens, np.repeat(x_lens_np, beam_width))
+            # NOTE: CTC can not emit more tokens than frames
+        enc_out = self._tile_beam(enc_out, beam_width)
+        enc_out_a = self._tile_beam(enc_out_a, beam_width)
+        x_lens = self._tile_beam(x_lens, beam_width)
 
-                beam = not_complete[:beam_width]
+        # Initialize decoder state
+        dec_state, dec_out = self._init_dec_state(enc_out, x_lens, task, dir)
+        aw_step = self._create_var((
+            num_hyps, max_time, getattr(self, 'num_heads_' + str(task))),
+            fill_value=0., volatile=True)
+        context_vec = self._create_var(
+            (num_hyps, 1, enc_out.size(-1)), fill_value=0., volatile=True)
+        y = self._create_var((num_hyps, 1), fill_value=sos, dtype='long')
+        if lm is not None:
+            lm_state = lm.initial_state(num_hyps)
+
+        # NOTE: only the first hypothesis of each utterance is alive at first
+        scores = np.full((batch_size, beam_width), -np.inf, dtype=np.float64)
+        scores[:, 0] = 0  # log 1
+        # NOTE: hypotheses are stored as back-pointers
+        history = BeamHistory()
+        cand_rows = np.full((num_hyps,), -1, dtype=np.int64)
+        # NOTE: cand_rows: the index of each hypothesis in the last step of
+        # the history
+
+        complete = [[] for _ in range(batch_size)]
+        finished = [False] * batch_size
+        batch_idx = np.arange(batch_size)[:, None]
+        for t in range(max_decode_len):
+            logits_step, dec_state, dec_out, context_vec, aw_step = self._decode_step(
+                enc_out, enc_out_a, x_lens, y,
+                dec_state, dec_out, context_vec, aw_step, t == 0, task, dir)
+
+            # Path through the softmax layer & convert to log-scale
+            log_probs = F.log_softmax(logits_step.squeeze(1), dim=1)
+            # NOTE: `[B * beam_width, 1, num_classes]` -> `[B * beam_width, num_classes]`
+
+            # Shallow fusion with the LM
+            # NOTE: the LM is run once for all hypotheses
+            if lm is not None:
+                lm_log_probs = self.np2var(
+                    lm.lm.tensor2np(lm.log_probs(lm_state)), dtype='float')
+                log_probs = log_probs + lm_weight * lm_log_probs
+                # NOTE: the LM may be built on another backend, so its
+                # scores are converted into Variable of this model
+
+            # Pick up the top-k scores of each hypothesis
+            if ctc_weight > 0:
+                # NOTE: CTC prefix scores are computed only for candidates
+                # pre-selected by the attention decoder. <EOS> is always
+                # scored so that every hypothesis can be ended.
+                num_cands = min(max(int(beam_width * CTC_SCORING_RATIO),
+                                    beam_width + 1), log_probs.size(1))
+                log_probs = self.var2np(log_probs)
+                log_probs_eos = log_probs[:, eos].copy()
+                log_probs[:, eos] = -np.inf
+                indices_topk = np.argsort(
+                    -log_probs, axis=1, kind='mergesort')[:, :num_cands - 1]
+                indices_topk = np.concatenate(
+                    [indices_topk, np.full((num_hyps, 1), eos, dtype=np.int64)],
+                    axis=1)
+                log_probs_topk = log_probs[np.arange(num_hyps)[:, None],
+                                           indices_topk]
+                log_probs_topk[:, -1] = log_probs_eos
+                ctc_scores, ctc_new_state = ctc_scorer.score(
+                    ctc_state, utt_idx,
+                    np.where(indices_topk == eos, ctc_scorer.eos,
+                             indices_topk + 1), t)
+                # NOTE: index 0 is reserved for blank in warpctc_pytorch
+                joint_scores = (1 - ctc_weight) * log_probs_topk + \
+                    ctc_weight * ctc_scores
+                # Exclude short hypotheses before the candidates are cut
+                # down to beam_width
+                if t + 1 < min_decode_len:
+                    joint_scores = self._exclude_short_eos(
+                        joint_scores, indices_topk == eos,
+                        t + 1 < min_decode_lens, batch_size)
+                ctc_cols = np.argsort(-joint_scores, axis=1,
+                                      kind='mergesort')[:, :beam_width]
+                rows = np.arange(num_hyps)[:, None]
+                log_probs_topk = joint_scores[rows, ctc_cols]
+                indices_topk = indices_topk[rows, ctc_cols]
+                # NOTE: candidates without CTC alignments are pruned by -inf
+            else:
+                log_probs_topk, indices_topk = torch.topk(
+                    log_probs, k=beam_width, dim=1, largest=True, sorted=True)
+                log_probs_topk = self.var2np(log_probs_topk)
+                indices_topk = self.var2np(indices_topk)
+
+            # Add length penalty
+            cand_scores = scores.reshape(-1, 1) + log_probs_topk + length_penalty
+
+            # Exclude short hypotheses
+            if t + 1 < min_decode_len and ctc_weight == 0:
+                cand_scores = self._exclude_short_eos(
+                    cand_scores, indices_topk == eos,
+                    t + 1 < min_decode_lens, batch_size)
+
+            # Pick up the top-k candidates of each utterance
+            # NOTE: the top-k over `[B, beam_width * num_classes]` is always
+            # included in the top-k of each hypothesis
+            cand_scores = cand_scores.reshape(batch_size, -1)
+            indices_topk = indices_topk.reshape(batch_size, -1)
+            cand_idx = np.argsort(-cand_scores, axis=1,
+                                  kind='mergesort')[:, :beam_width]
+            top_scores = cand_scores[batch_idx, cand_idx]
+            top_tokens = indices_topk[batch_idx, cand_idx]
+            src_rows = (batch_idx * beam_width +
+                        cand_idx // beam_width).reshape(-1)
+            # NOTE: `[B, beam_width]`
+
+            # Extend hypotheses
+            if return_attention:
+                history.append(
+                    back_pointers=cand_rows[src_rows],
+                    token=top_tokens.reshape(-1),
+                    aw=aw_step.index_select(
+                        0, self.np2var(src_rows, dtype='long'))[:, :, 0])
+                # TODO: fix for MHA
+            else:
+                history.append(back_pointers=cand_rows[src_rows],
+                               token=top_tokens.reshape(-1))
 
-            if len(complete) == 0:
-                complete = beam
+            # Remove complete hypotheses
+            keep_rows = []
+            scores = np.full((batch_size, beam_width), -np.inf, dtype=np.float64)
+            for b in range(batch_size):
+                not_complete = []
+                if not finished[b]:
+                    for k in range(beam_width):
+                        if top_scores[b, k] == -np.inf:
+                            break
+                        i = b * beam_width + k
+                        if top_tokens[b, k] == eos:
+                            complete[b].append({'score': top_scores[b, k],
+                                                'step': t,
+                                                'index': i})
+                        else:
+                            not_complete.append(k)
+
+                    if len(complete[b]) >= beam_width:
+                        complete[b] = complete[b][:beam_width]
+                        finished[b] = True
+                        not_complete = []
+                    elif len(not_complete) == 0:
+                        finished[b] = True
+                    elif ctc_weight > 0 and length_penalty <= 0 and \
+                            len(complete[b]) > 0 and \
+                            max(c['score'] for c in complete[b]) >= top_scores[b, not_complete[0]]:
+                        # NOTE: joint scores never increase because CTC
+                        # prefix scores are monotonic, so alive hypotheses
+                        # can not outperform the complete one
+                        finished[b] = True
+                        not_complete = []
+
+                scores[b, :len(not_complete)] = top_scores[b, not_complete]
+                # NOTE: dead hypotheses are filled with a copy of an alive one
+                keep_rows += [b * beam_width + k for k in not_complete]
+                keep_rows += [b * beam_width + (not_complete + [0])[0]] * \
+                    (beam_width - len(not_complete))
+
+            if all(finished):
+                break
 
-            complete = sorted(
-                complete, key=lambda x: x['score'], reverse=True)
-            best_hyps.append(np.array(complete[0]['hyp'][1:]))
-            aw.append(complete[0]['aw_steps'][1:])
-            y_lens[b] = len(complete[0]['hyp'][1:])
+            # Reorder decoder states
+            cand_rows = np.array(keep_rows, dtype=np.int64)
+            state_rows_var = self.np2var(src_rows[cand_rows], dtype='long')
+            y = self.np2var(
+                top_tokens.reshape(-1, 1)[cand_rows], dtype='long')
+            dec_state = self._reorder_dec_state(dec_state, state_rows_var)
+            dec_out = dec_out.index_select(0, state_rows_var)
+            context_vec = context_vec.index_select(0, state_rows_var)
+            aw_step = aw_step.index_select(0, state_rows_var)
+            if lm is not None:
+                _, lm_state = lm.score(lm_state[src_rows[cand_rows]],
+                                       top_tokens.reshape(-1)[cand_rows])
+            if ctc_weight > 0:
+                ctc_state = ctc_scorer.select_state(
+                    ctc_new_state, src_rows[cand_rows],
+                    ctc_cols[src_rows, (cand_idx % beam_width).reshape(-1)][cand_rows])
 
-        # Concatenate in T_out dimension
-        for j in range(len(aw)):
-            for k in range(len(aw[j])):
-                aw[j][k] = aw[j][k][:, :, 0]  # TODO: fix for MHA
-            aw[j] = self.var2np(torch.stack(aw[j], dim=1).squeeze(0))
+        best_hyps, aw = [], []
+        nbest_hyps, nbest_scores = [], []
+        y_lens = np.zeros((batch_size,), dtype=np.int32)
+        for b in range(batch_size):
+            if len(complete[b]) == 0:
+                complete[b] = [{'score': scores[b, k],
+                                'step': len(history) - 1,
+                                'index': cand_rows[b * beam_width + k]}
+                               for k in range(beam_width) if scores[b, k] > -np.inf]
+
+            complete[b] = sorted(
+                complete[b], key=lambda x: x['score'], reverse=True)
+
+            if nbest is not None:
+                hyps = []
+                for hyp in complete[b][:nbest]:
+                    tokens = np.array(history.backtrack(
+                        hyp['step'], hyp['index'])['token'], dtype=np.int64)
+                    if len(tokens) > 0 and tokens[-1] == eos:
+                        tokens = tokens[:-1]
+                    hyps.append(tokens[::-1] if dir == 'bwd' else tokens)
+                nbest_hyps.append(hyps)
+                nbest_scores.append(np.array(
+                    [hyp['score'] for hyp in complete[b][:nbest]]))
+                continue
+
+            # Recover the best hypothesis from back-pointers
+            trace = history.backtrack(
+                complete[b][0]['step'], complete[b][0]['index'])
+            best_hyps.append(np.array(trace['token'], dtype=np.int64))
+            if return_attention:
+                aw.append(self.var2np(
+                    torch.stack(trace['aw'], dim=0)[:, :x_lens_np[b]]))
+            y_lens[b] = len(best_hyps[b])
+            if y_lens[b] > 0 and best_hyps[b][-1] == eos:
+                y_lens[b] -= 1
+                # NOTE: exclude <EOS>
+
+        if nbest is not None:
+            return nbest_hyps, nbest_scores
 
         # Reverse the order
         if dir == 'bwd':
-            for b in range(enc_out.size(0)):
+            for b in range(batch_size):
                 best_hyps[b][:y_lens[b]] = best_hyps[b][:y_lens[b]][::-1]
 
+        if not return_attention:
+            aw = None
+
         return np.array(best_hyps), aw
 
-    def decode_ctc(self, xs, x_lens, beam_width=1, task_index=0):
+    def _exclude_short_eos(self, cand_scores, is_eos, is_short, batch_size):
+        """Exclude <EOS> from candidates of short hypotheses. <EOS> is kept
+            for utterances without any other alive candidate, so that every
+            utterance has a hypothesis.
+        Args:
+            cand_scores (np.ndarray): A tensor of size
+                `[B * beam_width, num_candidates]`
+            is_eos (np.ndarray): A tensor of size
+                `[B * beam_width, num_candidates]`
+            is_short (np.ndarray): A tensor of size `[B * beam_width]`
+            batch_size (int): the size of mini-batch
+        Returns:
+            cand_scores (np.ndarray): A tensor of size
+                `[B * beam_width, num_candidates]`
+        """
+        cand_scores_long = np.where(is_eos & is_short[:, None],
+                                    -np.inf, cand_scores)
+        is_alive = np.any(
+            cand_scores_long.reshape(batch_size, -1) > -np.inf, axis=1)
+        return np.where(
+            np.repeat(is_alive, len(cand_scores) // batch_size)[:, None],
+            cand_scores_long, cand_scores)
+
+    def _ctc_prefix_scorer(self, enc_out, x_lens, task, dir):
+        """Set up the CTC prefix scorer for joint CTC/attention decoding.
+        Args:
+            enc_out (torch.autograd.Variable, float): A tensor of size
+                `[B, T_in, encoder_num_units]`
+            x_lens (torch.autograd.Variable, int): A tensor of size `[B]`
+            task (int): the index of a task
+            dir (str): fwd or bwd. For the backward decoder, CTC posteriors
+                are reversed in time.
+        Returns:
+            ctc_scorer (CTCPrefixScorer):
+        """
+        if not hasattr(self, 'fc_ctc_' + str(task)):
+            raise ValueError('The CTC layer is not trained for task %d.' % task)
+
+        batch_size, max_time = enc_out.size()[:2]
+        logits_ctc = getattr(self, 'fc_ctc_' + str(task))(
+            enc_out.contiguous().view(batch_size * max_time, -1))
+        log_probs_ctc = self.var2np(F.log_softmax(logits_ctc, dim=-1)).reshape(
+            batch_size, max_time, -1)
+        x_lens = self.var2np(x_lens)
+
+        if dir == 'bwd':
+            t_idx = np.arange(max_time)[None, :]
+            t_idx = np.where(t_idx < x_lens[:, None],
+                             x_lens[:, None] - 1 - t_idx, t_idx)
+            log_probs_ctc = log_probs_ctc[np.arange(batch_size)[:, None], t_idx]
+
+        return CTCPrefixScorer(log_probs_ctc, x_lens, blank_index=0)
+
+    def _decode_step(self, enc_out, enc_out_a, x_lens, y, dec_state, dec_out,
+                     context_vec, aw_step, is_first_step, task, dir):
+        """Decode one step in the inference stage.
+        Args:
+            enc_out (torch.autograd.Variable, float): A tensor of size
+                `[B, T_in, encoder_num_units]`
+            enc_out_a (torch.autograd.Variable, float): A tensor of size
+                `[B, T_in, attention_dim, num_heads]`
+            x_lens (torch.autograd.Variable, int): A tensor of size `[B]`
+            y (torch.autograd.Variable, long): A tensor of size `[B, 1]`
+            dec_state (list or tuple of list):
+            dec_out (torch.autograd.Variable, float): A tensor of size
+                `[B, 1, decoder_num_units]`
+            context_vec (torch.autograd.Variable, float): A tensor of size
+                `[B, 1, encoder_num_units]`
+            aw_step (torch.autograd.Variable, float): A tensor of size
+                `[B, T_in, num_heads]`
+            is_first_step (bool): If True, the decoder state is not updated
+                in the bahdanau decoding order
+            task (int): the index of a task
+            dir (str): fwd or bwd
+        Returns:
+            logits_step (torch.autograd.Variable, float): A tensor of size
+                `[B, 1, num_classes]`
+            dec_state (list or tuple of list):
+            dec_out (torch.autograd.Variable, float): A tensor of size
+                `[B, 1, decoder_num_units]`
+            context_vec (torch.autograd.Variable, float): A tensor of size
+                `[B, 1, encoder_num_units]`
+            aw_step (torch.autograd.Variable, float): A tensor of size
+                `[B, T_in, num_heads]`
+        """
+        y = getattr(self, 'embed_' + str(task))(y)
+
+        if self.decoding_order == 'bahdanau':
+            if not is_first_step:
+                # Recurrency
+                dec_in = torch.cat([y, context_vec], dim=-1)
+                dec_out, dec_state = getattr(
+                    self, 'decoder_' + str(task) + '_' + dir)(dec_in, dec_state)
+
+            # Score
+            context_vec, aw_step = getattr(self, 'attend_' + str(task) + '_' + dir)(
+                enc_out, enc_out_a, x_lens, dec_out, aw_step)
+
+        elif self.decoding_order == 'luong':
+            # Recurrency
+            dec_in = torch.cat([y, context_vec], dim=-1)
+            dec_out, dec_state = getattr(
+                self, 'decoder_' + str(task) + '_' + dir)(dec_in, dec_state)
+
+            # Score
+            context_vec, aw_step = getattr(self, 'attend_' + str(task) + '_' + dir)(
+                enc_out, enc_out_a, x_lens, dec_out, aw_step)
+
+        elif self.decoding_order == 'conditional':
+            # Recurrency of the first decoder
+            _dec_out, _dec_state = getattr(self, 'decoder_first_' + str(task) + '_' + dir)(
+                y, dec_state)
+
+            # Score
+            context_vec, aw_step = getattr(self, 'attend_' + str(task) + '_' + dir)(
+                enc_out, enc_out_a, x_lens, _dec_out, aw_step)
+
+            # Recurrency of the second decoder
+            dec_out, dec_state = getattr(self, 'decoder_second_' + str(task) + '_' + dir)(
+                context_vec, _dec_state)
+
+        else:
+            raise ValueError(self.decoding_order)
+
+        # Generate
+        logits_step = getattr(self, 'fc_' + str(task) + '_' + dir)(F.tanh(
+            getattr(self, 'W_d_' + str(task) + '_' + dir)(dec_out) +
+            getattr(self, 'W_c_' + str(task) + '_' + dir)(context_vec)))
+
+        return logits_step, dec_state, dec_out, context_vec, aw_step
+
+    def _tile_beam(self, var, beam_width):
+        """Repeat each utterance for all hypotheses in the beam.
+        Args:
+            var (torch.autograd.Variable): A tensor of size `[B, ...]`
+            beam_width (int): the size of beam
+        Returns:
+            var (torch.autograd.Variable): A tensor of size
+                `[B * beam_width, ...]`
+        """
+        size = var.size()
+        var = var.unsqueeze(1).expand(size[0], beam_width, *size[1:])
+        return var.contiguous().view(size[0] * beam_width, *size[1:])
+
+    def _reorder_dec_state(self, dec_state, index):
+        """Select decoder states of the surviving hypotheses.
+        Args:
+            dec_state (list or tuple of list):
+            index (torch.autograd.Variable, long): A tensor of size `[B']`
+        Returns:
+            dec_state (list or tuple of list):
+        """
+        if self.decoder_type == 'lstm':
+            hx_list, cx_list = dec_state
+            hx_list = [hx.index_select(0, index) for hx in hx_list]
+            cx_list = [cx.index_select(0, index) for cx in cx_list]
+            return (hx_list, cx_list)
+        else:
+            return [hx.index_select(0, index) for hx in dec_state]
+
+    def decode_ctc(self, xs, x_lens, beam_width=1, task_index=0,
+                   utt_ids=None):
         """Decoding by the CTC layer in the inference stage.
             This is only used for Joint CTC-Attention model.
         Args:
@@ -1244,22 +1641,21 @@ class AttentionSeq2seq(ModelBase):
             x_lens (np.ndarray): A tensor of size `[B]`
             beam_width (int): the size of beam
             task_index (int): the index of a task
+            utt_ids (list, optional): utterance ids to look up the encoder
+                output cache
         Returns:
             best_hyps (np.ndarray): A tensor of size `[B]`
             perm_idx (np.ndarray): A tensor of size `[B]`
         """
         self.eval()
 
-        # Wrap by Variable
-        xs = self.np2var(xs)
-        x_lens = self.np2var(x_lens, dtype='int')
-
         # Encode acoustic features
         if task_index == 0:
-            enc_out, x_lens, perm_idx = self._encode(xs, x_lens)
+            enc_out, x_lens, perm_idx = self._encode_cached(
+                xs, x_lens, utt_ids)
         elif task_index == 1:
-            _, _, enc_out, x_lens, perm_idx = self._encode(
-                xs, x_lens, is_multi_task=True)
+            _, _, enc_out, x_lens, perm_idx = self._encode_cached(
+                xs, x_lens, utt_ids, is_multi_task=True)
         else:
             raise NotImplementedError
 
@@ -1270,8 +1666,12 @@ class AttentionSeq2seq(ModelBase):
         logits_ctc = logits_ctc.view(batch_size, max_time, -1)
 
         if beam_width == 1:
-            best_hyps = self._decode_ctc_greedy_np(
-                self.var2np(logits_ctc), self.var2np(x_lens))
+            # NOTE: pick up the best path on the device
+            best_hyps, y_lens = self._decode_ctc_greedy_np(
+                self.var2np(torch.max(logits_ctc, dim=-1)[1]),
+                self.var2np(x_lens))
+            best_hyps = np.array([best_hyps[b, :y_lens[b]]
+                                  for b in range(len(y_lens))])
         else:
             best_hyps = self._decode_ctc_beam_np(
                 self.var2np(F.log_softmax(logits_ctc, dim=-1)),
@@ -0,0 +1,59 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Back-pointers of hypotheses in beam search (pytorch)."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+
+class BeamHistory(object):
+    """Back-pointers of hypotheses in beam search.
+        Instead of copying the whole token sequence and attention weights of
+        each hypothesis at every extension, values of all hypotheses are
+        stored once per step together with the index of their parents in the
+        previous step. A hypothesis is recovered only at the end.
+    """
+
+    def __init__(self):
+        self.back_pointers = []
+        self.values = []
+
+    def __len__(self):
+        return len(self.back_pointers)
+
+    def append(self, back_pointers, **values):
+        """Store hypotheses of the current step.
+        Args:
+            back_pointers (list or np.ndarray): indices of the parent
+                hypotheses in the previous step of size `[N]`.
+                Negative values indicate the root.
+            values: values of the current step (e.g. tokens and attention
+                weights). Each of them must be indexable by hypotheses
+                (list, np.ndarray, or torch.autograd.Variable of size `[N, ...]`)
+        Returns:
+            step (int): the index of the current step
+        """
+        self.back_pointers.append(back_pointers)
+        self.values.append(values)
+        return len(self.back_pointers) - 1
+
+    def backtrack(self, step, index):
+        """Recover a hypothesis by following back-pointers.
+        Args:
+            step (int): the last step of the hypothesis
+            index (int): the index of the hypothesis in the last step
+        Returns:
+            trace (dict): values of all steps from the first one,
+                keyed by the names given to `append`
+        """
+        trace = {}
+        while step >= 0 and index >= 0:
+            for key, value in self.values[step].items():
+                trace.setdefault(key, []).append(value[index])
+            index = int(self.back_pointers[step][index])
+            step -= 1
+        for key in trace.keys():
+            trace[key] = trace[key][::-1]
+        return trace
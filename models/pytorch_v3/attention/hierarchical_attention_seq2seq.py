@@ -17,6 +17,7 @@ from models.pytorch_v3.linear import LinearND, Embedding, Embedding_LS
 from models.pytorch_v3.encoders.load_encoder import load
 from models.pytorch_v3.attention.rnn_decoder import RNNDecoder
 from models.pytorch_v3.attention.attention_layer import AttentionMechanism
+from models.pytorch_v3.attention.beam_history import BeamHistory
 from models.pytorch_v3.ctc.decoders.greedy_decoder import GreedyDecoder
 from models.pytorch_v3.ctc.decoders.beam_search_decoder import BeamSearchDecoder
 
@@ -367,7 +368,16 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
         if init_forget_gate_bias_with_one:
             self.init_forget_gate_bias_with_one()
 
-    def forward(self, xs, ys, x_lens, y_lens, ys_sub, y_lens_sub, is_eval=False):
+    @property
+    def target_dirs(self):
+        return ['fwd']
+
+    @property
+    def target_dirs_sub(self):
+        return ['bwd' if self.backward_1 else 'fwd']
+
+    def forward(self, xs, ys, x_lens, y_lens, ys_sub, y_lens_sub, is_eval=False,
+                targets=None):
         """Forward computation.
         Args:
             xs (np.ndarray): A tensor of size `[B, T_in, input_size]`
@@ -378,6 +388,9 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
             y_lens_sub (np.ndarray): A tensor of size `[B]`
             is_eval (bool): if True, the history will not be saved.
                 This should be used in inference model for memory efficiency.
+            targets (dict, optional): inputs and outputs of decoders made by
+                the data loader (ys_in_fwd, ys_out_fwd, ys_in_sub_bwd, ...).
+                If not given, they are made from ys and ys_sub here.
         Returns:
             loss (torch.autograd.Variable(float) or float): A tensor of size `[1]`
             loss_main (torch.autograd.Variable(float) or float): A tensor of size `[1]`
@@ -392,47 +405,12 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
             if self.weight_noise_injection:
                 self.inject_weight_noise(mean=0, std=self.weight_noise_std)
 
-        # Reverse the order
-        if self.backward_1:
-            ys_sub_tmp = copy.deepcopy(ys_sub)
-            for b in range(len(xs)):
-                ys_sub_tmp[b, :y_lens_sub[b]] = ys_sub[b, :y_lens_sub[b]][::-1]
-        else:
-            ys_sub_tmp = ys_sub
-
-        # NOTE: ys and ys_sub are padded with -1 here
-        # ys_in and ys_in_sub areb padded with <EOS> in order to convert to
-        # one-hot vector, and added <SOS> before the first token
-        # ys_out and ys_out_sub are padded with -1, and added <EOS>
-        # after the last token
-        ys_in = self._create_var((ys.shape[0], ys.shape[1] + 1),
-                                 fill_value=self.eos_0, dtype='long')
-        ys_in_sub = self._create_var((ys_sub.shape[0], ys_sub.shape[1] + 1),
-                                     fill_value=self.eos_1, dtype='long')
-        ys_out = self._create_var((ys.shape[0], ys.shape[1] + 1),
-                                  fill_value=-1, dtype='long')
-        ys_out_sub = self._create_var((ys_sub.shape[0], ys_sub.shape[1] + 1),
-                                      fill_value=-1, dtype='long')
-
-        ys_in.data[:, 0] = self.sos_0
-        ys_in_sub.data[:, 0] = self.sos_1
-        for b in range(len(xs)):
-            ys_in.data[b, 1:y_lens[b] + 1] = torch.from_numpy(
-                ys[b, :y_lens[b]])
-            ys_in_sub.data[b, 1:y_lens_sub[b] + 1] = torch.from_numpy(
-                ys_sub_tmp[b, :y_lens_sub[b]])
-
-            ys_out.data[b, :y_lens[b]] = torch.from_numpy(ys[b, :y_lens[b]])
-            ys_out.data[b, y_lens[b]] = self.eos_0
-            ys_out_sub.data[b, :y_lens_sub[b]] = torch.from_numpy(
-                ys_sub_tmp[b, :y_lens_sub[b]])
-            ys_out_sub.data[b, y_lens_sub[b]] = self.eos_1
-
-        if self.use_cuda:
-            ys_in = ys_in.cuda()
-            ys_out = ys_out.cuda()
-            ys_in_sub = ys_in_sub.cuda()
-            ys_out_sub = ys_out_sub.cuda()
+        ys_in, ys_out = self._make_decoder_targets(
+            ys, y_lens, task=0, dir='fwd', targets=targets)
+        ys_in_sub, ys_out_sub = self._make_decoder_targets(
+            ys_sub, y_lens_sub, task=1,
+            dir='bwd' if self.backward_1 else 'fwd',
+            targets=targets)
 
         # Wrap by Variable
         xs = self.np2var(xs)
@@ -517,7 +495,8 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
     def decode(self, xs, x_lens, beam_width, max_decode_len, min_decode_len=0,
                length_penalty=0, coverage_penalty=0, task_index=0,
                joint_decoding=None, space_index=-1, oov_index=-1,
-               word2char=None, score_sub_weight=0, idx2word=None, idx2char=None):
+               word2char=None, score_sub_weight=0, idx2word=None, idx2char=None,
+               return_attention=True, ctc_weight=0, utt_ids=None):
         """Decoding in the inference stage.
         Args:
             xs (np.ndarray): A tensor of size `[B, T_in, input_size]`
@@ -533,6 +512,12 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
             oov_index (int):
             word2char ():
             score_sub_weight (float):
+            return_attention (bool): if False, attention weights are not
+                collected and None is returned instead
+            ctc_weight (float): the weight of CTC prefix scores in joint
+                CTC/attention decoding of the sub task
+            utt_ids (list, optional): utterance ids to look up the encoder
+                output cache
         Returns:
             best_hyps (np.ndarray): A tensor of size `[B]`
             aw ():
@@ -543,27 +528,23 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
         if task_index > 0 and self.ctc_loss_weight_sub > self.sub_loss_weight:
             # Decode by CTC decoder
             best_hyps, perm_idx = self.decode_ctc(
-                xs, x_lens, beam_width, task_index)
+                xs, x_lens, beam_width, task_index, utt_ids=utt_ids)
 
             return best_hyps, None, perm_idx
             # NOTE: None corresponds to aw in attention-based models
         else:
-            # Wrap by Variable
-            xs = self.np2var(xs)
-            x_lens = self.np2var(x_lens, dtype='int')
-
             dir = 'bwd' if task_index == 1 and self.backward_1 else 'fwd'
 
             # Encode acoustic features
             if joint_decoding is not None and task_index == 0 and dir == 'fwd':
-                enc_out, x_lens, enc_out_sub, x_lens_sub, perm_idx = self._encode(
-                    xs, x_lens, is_multi_task=True)
+                enc_out, x_lens, enc_out_sub, x_lens_sub, perm_idx = self._encode_cached(
+                    xs, x_lens, utt_ids, is_multi_task=True)
             elif task_index == 0:
-                enc_out, x_lens, _, _, perm_idx = self._encode(
-                    xs, x_lens, is_multi_task=True)
+                enc_out, x_lens, _, _, perm_idx = self._encode_cached(
+                    xs, x_lens, utt_ids, is_multi_task=True)
             elif task_index == 1:
-                _, _, enc_out, x_lens, perm_idx = self._encode(
-                    xs, x_lens, is_multi_task=True)
+                _, _, enc_out, x_lens, perm_idx = self._encode_cached(
+                    xs, x_lens, utt_ids, is_multi_task=True)
             else:
                 raise NotImplementedError
 
@@ -576,7 +557,7 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
                         beam_width, max_decode_len, min_decode_len,
                         length_penalty, coverage_penalty,
                         space_index, oov_index, word2char, score_sub_weight,
-                        idx2word, idx2char)
+                        idx2word, idx2char, return_attention)
                 elif joint_decoding == 'rescoring':
                     best_hyps, aw, best_hyps_sub, aw_sub, = self._decode_infer_joint_rescoring(
                         enc_out, x_lens,
@@ -584,7 +565,7 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
                         beam_width, max_decode_len, min_decode_len,
                         length_penalty, coverage_penalty,
                         space_index, oov_index, word2char, score_sub_weight,
-                        idx2word, idx2char)
+                        idx2word, idx2char, return_attention)
                 else:
                     raise ValueError(joint_decoding)
 
@@ -596,16 +577,20 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
 
                 return best_hyps, aw, best_hyps_sub, aw_sub, perm_idx
             else:
-                if beam_width == 1:
+                is_greedy = beam_width == 1 and ctc_weight == 0
+                if is_greedy:
                     best_hyps, aw = self._decode_infer_greedy(
-                        enc_out, x_lens, max_decode_len, task_index, dir)
+                        enc_out, x_lens, max_decode_len, task_index, dir,
+                        return_attention=return_attention)
                 else:
                     best_hyps, aw = self._decode_infer_beam(
                         enc_out, x_lens, beam_width, max_decode_len, min_decode_len,
-                        length_penalty, coverage_penalty, task_index, dir)
+                        length_penalty, coverage_penalty, task_index, dir,
+                        return_attention=return_attention,
+                        ctc_weight=ctc_weight)
 
             # TODO: fix this
-            if beam_width == 1:
+            if is_greedy and return_attention:
                 aw = aw[:, :, :, 0]
 
             # Permutate indices to the original order
@@ -620,7 +605,7 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
                                     beam_width, max_decode_len, min_decode_len,
                                     length_penalty, coverage_penalty,
                                     space_index, oov_index, word2char, score_sub_weight,
-                                    idx2word, idx2char):
+                                    idx2word, idx2char, return_attention=True):
         """Joint decoding (one-pass).
         Args:
             enc_out (torch.FloatTensor): A tensor of size
@@ -640,6 +625,8 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
             score_sub_weight (float):
             idx2word (): for debug
             idx2char (): for debug
+            return_attention (bool): if False, attention weights are not
+                collected
         Returns:
             best_hyps (np.ndarray): A tensor of size `[B, T_out]`
             aw (np.ndarray): A tensor of size `[B, T_out, T_in]`
@@ -680,8 +667,10 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
                 (1,  1, enc_out_sub.size(-1)), fill_value=0., volatile=True)
 
             complete = []
-            beam = [{'hyp': [self.sos_0],
-                     'hyp_sub': [self.sos_1],
+            history = BeamHistory()
+            beam = [{'y': self.sos_0,
+                     'y_sub': self.sos_1,
+                     'hyp_len': 1,
                      'score': 0,  # log1
                      'score_sub': 0,  # log 1
                      'dec_state': dec_state,
@@ -690,13 +679,16 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
                      'dec_out_sub': dec_out_sub,
                      'context_vec': context_vec,
                      'context_vec_sub': context_vec_sub,
-                     'aw_steps': [aw_step],
-                     'aw_steps_sub':[aw_step_sub]}]
+                     'aw_step': aw_step,
+                     'aw_step_sub': aw_step_sub,
+                     'aw_sum': aw_step,
+                     'step': -1,
+                     'index': -1}]
             for t in range(max_decode_len):
                 new_beam = []
                 for i_beam in range(len(beam)):
                     y = self._create_var(
-                        (1, 1), fill_value=beam[i_beam]['hyp'][-1], dtype='long')
+                        (1, 1), fill_value=beam[i_beam]['y'], dtype='long')
                     y = self.embed_0(y)
 
                     if self.decoding_order == 'bahdanau':
@@ -713,7 +705,7 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
                             enc_out[b:b + 1, :x_lens.data[b]],
                             enc_out_a[b:b + 1, :x_lens.data[b]],
                             x_lens[b:b + 1],
-                            dec_out, beam[i_beam]['aw_steps'][-1])
+                            dec_out, beam[i_beam]['aw_step'])
 
                     elif self.decoding_order == 'luong':
                         # Recurrency
@@ -727,7 +719,7 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
                             enc_out[b:b + 1, :x_lens.data[b]],
                             enc_out_a[b:b + 1, :x_lens.data[b]],
                             x_lens[b:b + 1],
-                            dec_out, beam[i_beam]['aw_steps'][-1])
+                            dec_out, beam[i_beam]['aw_step'])
 
                     elif self.decoding_order == 'conditional':
                         # Recurrency of the first decoder
@@ -739,7 +731,7 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
                             enc_out[b:b + 1, :x_lens.data[b]],
                             enc_out_a[b:b + 1, :x_lens.data[b]],
                             x_lens[b:b + 1],
-                            _dec_out, beam[i_beam]['aw_steps'][-1])
+                            _dec_out, beam[i_beam]['aw_step'])
 
                         # Recurrency of the second decoder
                         dec_out, dec_state = self.decoder_second_0_fwd(
@@ -762,7 +754,7 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
 
                     for k in range(beam_width):
                         # Exclude short hypotheses
-                        if indices_topk[0, k].data[0] == self.eos_0 and len(beam[i_beam]['hyp']) < min_decode_len:
+                        if indices_topk[0, k].data[0] == self.eos_0 and beam[i_beam]['hyp_len'] < min_decode_len:
                             continue
                         # if indices_topk[0, k].data[0] == self.eos_0 and len(beam[i_beam]['hyp']) < x_lens[b].data[0] * min_decode_len_ratio:
                         #     continue
@@ -774,8 +766,8 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
                         # Add coverage penalty
                         if coverage_penalty > 0:
                             threshold = 0.5
-                            aw_steps = torch.cat(
-                                beam[i_beam]['aw_steps'], dim=0).sum(0).squeeze(1)
+                            aw_steps = beam[i_beam]['aw_sum'].sum(
+                                0).squeeze(1)
 
                             # Google NMT
                             # cov_sum = torch.where(
@@ -804,7 +796,7 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
                                 dec_states_sub = [
                                     beam[i_beam]['dec_state_sub']]
                                 aw_steps_sub = [
-                                    beam[i_beam]['aw_steps_sub'][-1]]
+                                    beam[i_beam]['aw_step_sub']]
                                 charseq = []
                                 # TODO: add max OOV len
                                 while True:
@@ -879,7 +871,7 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
                                                   :x_lens_sub.data[b]],
                                     x_lens_sub[b:b + 1],
                                     beam[i_beam]['dec_out_sub'],
-                                    beam[i_beam]['aw_steps_sub'][-1])
+                                    beam[i_beam]['aw_step_sub'])
 
                                 # Generate
                                 logits_step_sub = self.fc_1_fwd(F.tanh(
@@ -910,7 +902,7 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
 
                                 dec_out_sub = beam[i_beam]['dec_out_sub']
                                 dec_state_sub = beam[i_beam]['dec_state_sub']
-                                aw_step_sub = beam[i_beam]['aw_steps_sub'][-1]
+                                aw_step_sub = beam[i_beam]['aw_step_sub']
                                 aw_steps_sub = []
                                 for t_sub in range(len(charseq)):
                                     # Score
@@ -958,7 +950,7 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
                                 dec_states_sub_tmp = [
                                     beam[i_beam]['dec_state_sub']]
                                 aw_steps_sub = [
-                                    beam[i_beam]['aw_steps_sub'][-1]]
+                                    beam[i_beam]['aw_step_sub']]
                                 context_vecs_sub_tmp = [
                                     beam[i_beam]['coontext_vec_sub']]
                                 charseq = []
@@ -971,7 +963,7 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
                                                 (1, 1), fill_value=self.sos_1, dtype='long')
                                         else:
                                             # the last character of the previous word
-                                            last_char = beam[i_beam]['hyp_sub'][-1]
+                                            last_char = beam[i_beam]['y_sub']
                                             y_sub = self._create_var(
                                                 (1, 1), fill_value=last_char, dtype='long')
                                     elif t_sub == 1 and t > 0:
@@ -1062,7 +1054,7 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
 
                             elif eos_flag:
                                 # teacher-forcing
-                                last_char = beam[i_beam]['hyp_sub'][-1]
+                                last_char = beam[i_beam]['y_sub']
                                 y_sub = self._create_var(
                                     (1, 1), fill_value=last_char, dtype='long')
                                 y_sub = self.embed_1(y_sub)
@@ -1081,7 +1073,7 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
                                         enc_out_sub_a[b:b + 1,
                                                       :x_lens_sub.data[b]],
                                         x_lens_sub[b:b + 1],
-                                        dec_out_sub, beam[i_beam]['aw_steps_sub'][-1])
+                                        dec_out_sub, beam[i_beam]['aw_step_sub'])
 
                                 elif self.decoding_order == 'conditional':
                                     # Recurrency of the first decoder
@@ -1095,7 +1087,7 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
                                         enc_out_sub_a[b:b + 1,
                                                       :x_lens_sub.data[b]],
                                         x_lens_sub[b:b + 1],
-                                        _dec_out_sub, beam[i_beam]['aw_steps_sub'][-1])
+                                        _dec_out_sub, beam[i_beam]['aw_step_sub'])
 
                                     # Recurrency of the second decoder
                                     dec_out_sub, dec_state_sub = self.decoder_second_1_fwd(
@@ -1125,7 +1117,7 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
                                 if t == 0:
                                     charseq = [self.sos_1] + charseq
                                 elif t > 0:
-                                    last_char = beam[i_beam]['hyp_sub'][-1]
+                                    last_char = beam[i_beam]['y_sub']
                                     charseq = [last_char,
                                                space_index] + charseq
 
@@ -1135,7 +1127,7 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
                                 dec_out_sub = beam[i_beam]['dec_out_sub']
                                 dec_state_sub = beam[i_beam]['dec_state_sub']
                                 context_vec_sub = beam[i_beam]['context_vec_sub']
-                                aw_step_sub = beam[i_beam]['aw_steps_sub'][-1]
+                                aw_step_sub = beam[i_beam]['aw_step_sub']
                                 aw_steps_sub = []
                                 for t_sub in range(len(charseq) - 1):
                                     # teacher-forcing
@@ -1199,8 +1191,10 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
                             score_sub_weight
 
                         new_beam.append(
-                            {'hyp': beam[i_beam]['hyp'] + [indices_topk.data[0, k]],
-                             'hyp_sub': beam[i_beam]['hyp_sub'] + charseq,
+                            {'y': indices_topk.data[0, k],
+                             'y_sub': charseq[-1] if len(charseq) > 0 else beam[i_beam]['y_sub'],
+                             'charseq': charseq,
+                             'hyp_len': beam[i_beam]['hyp_len'] + 1,
                              'score': score,
                              'score_sub': score_c2w,
                              'dec_state': copy.deepcopy(dec_state),
@@ -1209,16 +1203,31 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
                              'dec_out_sub': dec_out_sub,
                              'context_vec': context_vec,
                              'context_vec_sub': context_vec_sub,
-                             'aw_steps': beam[i_beam]['aw_steps'] + [aw_step],
-                             'aw_steps_sub': beam[i_beam]['aw_steps_sub'] + aw_steps_sub})
+                             'aw_step': aw_step,
+                             'aw_step_sub': aw_steps_sub[-1] if len(aw_steps_sub) > 0 else beam[i_beam]['aw_step_sub'],
+                             'aw_steps_sub': aw_steps_sub,
+                             'aw_sum': beam[i_beam]['aw_sum'] + aw_step,
+                             'parent': beam[i_beam]['index']})
 
                 new_beam = sorted(
                     new_beam, key=lambda x: x['score'], reverse=True)
+                new_beam = new_beam[:beam_width]
+
+                # Store back-pointers
+                # NOTE: a word can emit a variable number of characters
+                step = history.append(
+                    back_pointers=[cand['parent'] for cand in new_beam],
+                    token=[cand['y'] for cand in new_beam],
+                    aw=[cand['aw_step'] for cand in new_beam],
+                    charseq=[cand['charseq'] for cand in new_beam],
+                    aw_sub=[cand['aw_steps_sub'] for cand in new_beam])
+                for j, cand in enumerate(new_beam):
+                    cand['step'], cand['index'] = step, j
 
                 # Remove complete hypotheses
                 not_complete = []
-                for cand in new_beam[:beam_width]:
-                    if cand['hyp'][-1] == self.eos_0:
+                for cand in new_beam:
+                    if cand['y'] == self.eos_0:
                         complete.append(cand)
                     else:
                         not_complete.append(cand)
@@ -1232,25 +1241,33 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
 
             complete = sorted(
                 complete, key=lambda x: x['score'], reverse=True)
-            best_hyps.append(np.array(complete[0]['hyp'][1:]))
-            aw.append(complete[0]['aw_steps'][1:])
+
+            # Recover the best hypothesis from back-pointers
+            trace = history.backtrack(
+                complete[0]['step'], complete[0]['index'])
+            best_hyps.append(np.array(trace['token']))
+            aw.append(trace['aw'])
 
             best_hyps_sub.append(
-                np.array(complete[0]['hyp_sub'][1:]))
-            aw_sub.append(complete[0]['aw_steps_sub'][1:])
+                np.array([c for charseq in trace['charseq'] for c in charseq]))
+            aw_sub.append(
+                [a for aw_steps_sub in trace['aw_sub'] for a in aw_steps_sub])
 
         # Concatenate in T_out dimension
-        for t_sub in range(len(aw)):
-            for k in range(len(aw_sub[t_sub])):
-                # TODO: fix for MHA
-                aw_sub[t_sub][k] = aw_sub[t_sub][k][:, :, 0]
-            aw_sub[t_sub] = self.var2np(
-                torch.stack(aw_sub[t_sub], dim=1).squeeze(0))
-
-            for k in range(len(aw[t_sub])):
-                aw[t_sub][k] = aw[t_sub][k][:, :, 0]  # TODO: fix for MHA
-            aw[t_sub] = self.var2np(
-                torch.stack(aw[t_sub], dim=1).squeeze(0))
+        if return_attention:
+            for t_sub in range(len(aw)):
+                for k in range(len(aw_sub[t_sub])):
+                    # TODO: fix for MHA
+                    aw_sub[t_sub][k] = aw_sub[t_sub][k][:, :, 0]
+                aw_sub[t_sub] = self.var2np(
+                    torch.stack(aw_sub[t_sub], dim=1).squeeze(0))
+
+                for k in range(len(aw[t_sub])):
+                    aw[t_sub][k] = aw[t_sub][k][:, :, 0]  # TODO: fix for MHA
+                aw[t_sub] = self.var2np(
+                    torch.stack(aw[t_sub], dim=1).squeeze(0))
+        else:
+            aw, aw_sub = None, None
 
         return best_hyps, aw, best_hyps_sub, aw_sub
 
@@ -1258,7 +1275,7 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
                                       beam_width, max_decode_len, min_decode_len,
                                       length_penalty, coverage_penalty,
                                       space_index, oov_index, word2char, score_sub_weight,
-                                      idx2word, idx2char):
+                                      idx2word, idx2char, return_attention=True):
         """Joint decoding (rescoring).
         Args:
             enc_out (torch.FloatTensor): A tensor of size
@@ -1278,6 +1295,8 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
             score_sub_weight (float):
             idx2word (): for debug
             idx2char (): for debug
+            return_attention (bool): if False, attention weights are not
+                collected
         Returns:
             best_hyps (np.ndarray): A tensor of size `[B, T_out]`
             aw (np.ndarray): A tensor of size `[B, T_out, T_in]`
@@ -1310,18 +1329,23 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
                 (1,  1, enc_out.size(-1)), fill_value=0., volatile=True)
 
             complete = []
-            beam = [{'hyp': [self.sos_0],
+            history = BeamHistory()
+            beam = [{'y': self.sos_0,
+                     'hyp_len': 1,
                      'score': 0,  # log1
                      'dec_state': dec_state,
                      'dec_out': dec_out,
                      'context_vec': context_vec,
-                     'aw_steps': [aw_step]}]
+                     'aw_step': aw_step,
+                     'aw_sum': aw_step,
+                     'step': -1,
+                     'index': -1}]
 
             for t in range(max_decode_len):
                 new_beam = []
                 for i_beam in range(len(beam)):
                     y = self._create_var(
-                        (1, 1), fill_value=beam[i_beam]['hyp'][-1], dtype='long')
+                        (1, 1), fill_value=beam[i_beam]['y'], dtype='long')
                     y = self.embed_0(y)
 
                     if self.decoding_order == 'bahdanau':
@@ -1339,7 +1363,7 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
                             enc_out[b:b + 1, :x_lens.data[b]],
                             enc_out_a[b:b + 1, :x_lens.data[b]],
                             x_lens[b:b + 1],
-                            dec_out, beam[i_beam]['aw_steps'][-1])
+                            dec_out, beam[i_beam]['aw_step'])
 
                     elif self.decoding_order == 'luong':
                         # Recurrency
@@ -1353,7 +1377,7 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
                             enc_out[b:b + 1, :x_lens.data[b]],
                             enc_out_a[b:b + 1, :x_lens.data[b]],
                             x_lens[b:b + 1],
-                            dec_out, beam[i_beam]['aw_steps'][-1])
+                            dec_out, beam[i_beam]['aw_step'])
 
                     elif self.decoding_order == 'conditional':
                         # Recurrency of the first decoder
@@ -1365,7 +1389,7 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
                             enc_out[b:b + 1, :x_lens.data[b]],
                             enc_out_a[b:b + 1, :x_lens.data[b]],
                             x_lens[b:b + 1],
-                            _dec_out, beam[i_beam]['aw_steps'][-1])
+                            _dec_out, beam[i_beam]['aw_step'])
 
                         # Recurrency of the second decoder
                         dec_out, dec_state = self.decoder_second_0_fwd(
@@ -1388,7 +1412,7 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
 
                     for k in range(beam_width):
                         # Exclude short hypotheses
-                        if indices_topk[0, k].data[0] == self.eos_0 and len(beam[i_beam]['hyp']) < min_decode_len:
+                        if indices_topk[0, k].data[0] == self.eos_0 and beam[i_beam]['hyp_len'] < min_decode_len:
                             continue
                         # if indices_topk[0, k].data[0] == self.eos_0 and len(beam[i_beam]['hyp']) < x_lens[b].data[0] * min_decode_len_ratio:
                         #     continue
@@ -1400,8 +1424,8 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
                         # Add coverage penalty
                         if coverage_penalty > 0:
                             threshold = 0.5
-                            aw_steps = torch.cat(
-                                beam[i_beam]['aw_steps'], dim=0).sum(0).squeeze(1)
+                            aw_steps = beam[i_beam]['aw_sum'].sum(
+                                0).squeeze(1)
 
                             # Google NMT
                             # cov_sum = torch.where(
@@ -1414,20 +1438,32 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
                             score += cov_sum * coverage_penalty
 
                         new_beam.append(
-                            {'hyp': beam[i_beam]['hyp'] + [indices_topk.data[0, k]],
+                            {'y': indices_topk.data[0, k],
+                             'hyp_len': beam[i_beam]['hyp_len'] + 1,
                              'score': score,
                              'dec_state': copy.deepcopy(dec_state),
                              'dec_out': dec_out,
                              'context_vec': context_vec,
-                             'aw_steps': beam[i_beam]['aw_steps'] + [aw_step]})
+                             'aw_step': aw_step,
+                             'aw_sum': beam[i_beam]['aw_sum'] + aw_step,
+                             'parent': beam[i_beam]['index']})
 
                 new_beam = sorted(
                     new_beam, key=lambda x: x['score'], reverse=True)
+                new_beam = new_beam[:beam_width]
+
+                # Store back-pointers
+                step = history.append(
+                    back_pointers=[cand['parent'] for cand in new_beam],
+                    token=[cand['y'] for cand in new_beam],
+                    aw=[cand['aw_step'] for cand in new_beam])
+                for j, cand in enumerate(new_beam):
+                    cand['step'], cand['index'] = step, j
 
                 # Remove complete hypotheses
                 not_complete = []
-                for cand in new_beam[:beam_width]:
-                    if cand['hyp'][-1] == self.eos_0:
+                for cand in new_beam:
+                    if cand['y'] == self.eos_0:
                         complete.append(cand)
                     else:
                         not_complete.append(cand)
@@ -1443,6 +1479,12 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
             # NOTE: Resocre by the second decoder's score
             #######################################################
             for i_beam in range(len(complete)):
+                # Recover the hypothesis from back-pointers
+                trace = history.backtrack(
+                    complete[i_beam]['step'], complete[i_beam]['index'])
+                complete[i_beam]['hyp'] = trace['token']
+                complete[i_beam]['aw_steps'] = trace['aw']
+
                 # Initialization for the character model per utterance
                 dec_state_sub, dec_out_sub = self._init_dec_state(
                     enc_out_sub[b: b + 1], x_lens_sub[b:b + 1], task=1, dir='fwd')
@@ -1456,10 +1498,10 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
                 score_c2w_until_space = 0  # log 1
                 charseq = [self.sos_1]
 
-                for t in range(len(complete[i_beam]['hyp']) - 1):
-                    oov_flag = complete[i_beam]['hyp'][t + 1] == oov_index
-                    eos_flag = complete[i_beam]['hyp'][t + 1] == self.eos_0
-                    word_idx = complete[i_beam]['hyp'][t + 1]
+                for t in range(len(complete[i_beam]['hyp'])):
+                    oov_flag = complete[i_beam]['hyp'][t] == oov_index
+                    eos_flag = complete[i_beam]['hyp'][t] == self.eos_0
+                    word_idx = complete[i_beam]['hyp'][t]
 
                     if self.decoding_order == 'bahdanau':
                         if oov_flag:
@@ -1629,7 +1671,7 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
                                             (1, 1), fill_value=self.sos_1, dtype='long')
                                     else:
                                         # the last character of the previous word
-                                        last_char = beam[i_beam]['hyp_sub'][-1]
+                                        last_char = beam[i_beam]['y_sub']
                                         y_sub = self._create_var(
                                             (1, 1), fill_value=last_char, dtype='long')
                                 elif t_sub == 1 and t > 0:
@@ -1721,7 +1763,7 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
 
                         elif eos_flag:
                             # teacher-forcing
-                            last_char = beam[i_beam]['hyp_sub'][-1]
+                            last_char = beam[i_beam]['y_sub']
                             y_sub = self._create_var(
                                 (1, 1), fill_value=last_char, dtype='long')
                             y_sub = self.embed_1(y_sub)
@@ -1784,7 +1826,7 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
                             if t == 0:
                                 charseq_tmp = [self.sos_1] + charseq_tmp
                             elif t > 0:
-                                last_char = beam[i_beam]['hyp_sub'][-1]
+                                last_char = beam[i_beam]['y_sub']
                                 charseq_tmp = [last_char,
                                                space_index] + charseq_tmp
 
@@ -1858,24 +1900,27 @@ class HierarchicalAttentionSeq2seq(AttentionSeq2seq):
 
             complete = sorted(
                 complete, key=lambda x: x['score'], reverse=True)
-            best_hyps.append(np.array(complete[0]['hyp'][1:]))
-            aw.append(complete[0]['aw_steps'][1:])
+            best_hyps.append(np.array(complete[0]['hyp']))
+            aw.append(complete[0]['aw_steps'])
 
             best_hyps_sub.append(
                 np.array(complete[0]['hyp_sub'][1:]))
             aw_sub.append(complete[0]['aw_steps_sub'][1:])
 
         # Concatenate in T_out dimension
-        for t_sub in range(len(aw)):
-            for k in range(len(aw_sub[t_sub])):
-                # TODO: fix for MHA
-                aw_sub[t_sub][k] = aw_sub[t_sub][k][:, :, 0]
-            aw_sub[t_sub] = self.var2np(
-                torch.stack(aw_sub[t_sub], dim=1).squeeze(0))
-
-            for k in range(len(aw[t_sub])):
-                aw[t_sub][k] = aw[t_sub][k][:, :, 0]  # TODO: fix for MHA
-            aw[t_sub] = self.var2np(
-                torch.stack(aw[t_sub], dim=1).squeeze(0))
+        if return_attention:
+            for t_sub in range(len(aw)):
+                for k in range(len(aw_sub[t_sub])):
+                    # TODO: fix for MHA
+                    aw_sub[t_sub][k] = aw_sub[t_sub][k][:, :, 0]
+                aw_sub[t_sub] = self.var2np(
+                    torch.stack(aw_sub[t_sub], dim=1).squeeze(0))
+
+                for k in range(len(aw[t_sub])):
+                    aw[t_sub][k] = aw[t_sub][k][:, :, 0]  # TODO: fix for MHA
+                aw[t_sub] = self.var2np(
+                    torch.stack(aw[t_sub], dim=1).squeeze(0))
+        else:
+            aw, aw_sub = None, None
 
         return best_hyps, aw, best_hyps_sub, aw_sub
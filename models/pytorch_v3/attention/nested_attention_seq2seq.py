@@ -19,6 +19,7 @@ from models.pytorch_v3.linear import LinearND, Embedding, Embedding_LS
 from models.pytorch_v3.encoders.load_encoder import load
 from models.pytorch_v3.attention.rnn_decoder import RNNDecoder
 from models.pytorch_v3.attention.attention_layer import AttentionMechanism
+from models.pytorch_v3.attention.beam_history import BeamHistory
 from models.pytorch_v3.criterion import cross_entropy_label_smoothing
 from models.pytorch_v3.ctc.decoders.greedy_decoder import GreedyDecoder
 from models.pytorch_v3.ctc.decoders.beam_search_decoder import BeamSearchDecoder
@@ -463,7 +464,16 @@ class NestedAttentionSeq2seq(AttentionSeq2seq):
         if init_forget_gate_bias_with_one:
             self.init_forget_gate_bias_with_one()
 
-    def forward(self, xs, ys, x_lens, y_lens, ys_sub=None, y_lens_sub=None, is_eval=False):
+    @property
+    def target_dirs(self):
+        return ['fwd']
+
+    @property
+    def target_dirs_sub(self):
+        return ['bwd' if self.backward_1 else 'fwd']
+
+    def forward(self, xs, ys, x_lens, y_lens, ys_sub=None, y_lens_sub=None, is_eval=False,
+                targets=None):
         """Forward computation.
         Args:
             xs (np.ndarray): A tensor of size `[B, T_in, input_size]`
@@ -474,6 +484,9 @@ class NestedAttentionSeq2seq(AttentionSeq2seq):
             y_lens_sub (np.ndarray): A tensor of size `[B]`
             is_eval (bool): if True, the history will not be saved.
                 This should be used in inference model for memory efficiency.
+            targets (dict, optional): inputs and outputs of decoders made by
+                the data loader (ys_in_fwd, ys_out_fwd, ys_in_sub_bwd, ...).
+                If not given, they are made from ys and ys_sub here.
         Returns:
             loss (torch.autograd.Variable(float) or float): A tensor of size `[1]`
             loss_main (torch.autograd.Variable(float) or float): A tensor of size `[1]`
@@ -494,47 +507,12 @@ class NestedAttentionSeq2seq(AttentionSeq2seq):
             y_lens_sub = y_lens
             second_pass = True
 
-        # Reverse the order
-        if self.backward_1:
-            ys_sub_tmp = copy.deepcopy(ys_sub)
-            for b in range(len(xs)):
-                ys_sub_tmp[b, :y_lens_sub[b]] = ys_sub[b, :y_lens_sub[b]][::-1]
-        else:
-            ys_sub_tmp = ys_sub
-
-        # NOTE: ys and ys_sub are padded with -1 here
-        # ys_in and ys_in_sub are padded with <EOS> in order to convert to
-        # one-hot vector, and added <SOS> before the first token
-        # ys_out and ys_out_sub are padded with -1, and added <EOS>
-        # after the last token
-        ys_in = self._create_var((ys.shape[0], ys.shape[1] + 1),
-                                 fill_value=self.eos_0, dtype='long')
-        ys_in_sub = self._create_var((ys_sub.shape[0], ys_sub.shape[1] + 1),
-                                     fill_value=self.eos_1, dtype='long')
-        ys_out = self._create_var((ys.shape[0], ys.shape[1] + 1),
-                                  fill_value=-1, dtype='long')
-        ys_out_sub = self._create_var((ys_sub.shape[0], ys_sub.shape[1] + 1),
-                                      fill_value=-1, dtype='long')
-
-        ys_in.data[:, 0] = self.sos_0
-        ys_in_sub.data[:, 0] = self.sos_1
-        for b in range(len(xs)):
-            ys_in.data[b, 1:y_lens[b] + 1] = torch.from_numpy(
-                ys[b, :y_lens[b]])
-            ys_in_sub.data[b, 1:y_lens_sub[b] + 1] = torch.from_numpy(
-                ys_sub_tmp[b, :y_lens_sub[b]])
-
-            ys_out.data[b, :y_lens[b]] = torch.from_numpy(ys[b, :y_lens[b]])
-            ys_out.data[b, y_lens[b]] = self.eos_0
-            ys_out_sub.data[b, :y_lens_sub[b]] = torch.from_numpy(
-                ys_sub_tmp[b, :y_lens_sub[b]])
-            ys_out_sub.data[b, y_lens_sub[b]] = self.eos_1
-
-        if self.use_cuda:
-            ys_in = ys_in.cuda()
-            ys_in_sub = ys_in_sub.cuda()
-            ys_out = ys_out.cuda()
-            ys_out_sub = ys_out_sub.cuda()
+        ys_in, ys_out = self._make_decoder_targets(
+            ys, y_lens, task=0, dir='fwd', targets=targets)
+        ys_in_sub, ys_out_sub = self._make_decoder_targets(
+            ys_sub, y_lens_sub, task=1,
+            dir='bwd' if self.backward_1 else 'fwd',
+            targets=None if second_pass else targets)
 
         # Wrap by Variable
         xs = self.np2var(xs)
@@ -1007,7 +985,8 @@ class NestedAttentionSeq2seq(AttentionSeq2seq):
     def decode(self, xs, x_lens, beam_width, max_decode_len, min_decode_len=0,
                beam_width_sub=1, max_decode_len_sub=None, min_decode_len_sub=0,
                length_penalty=0, coverage_penalty=0, task_index=0,
-               teacher_forcing=False, ys_sub=None, y_lens_sub=None):
+               teacher_forcing=False, ys_sub=None, y_lens_sub=None,
+               return_attention=True, utt_ids=None):
         """Decoding in the inference stage.
         Args:
             xs (np.ndarray): A tensor of size `[B, T_in, input_size]`
@@ -1024,6 +1003,10 @@ class NestedAttentionSeq2seq(AttentionSeq2seq):
             teacher_forcing (bool):
             ys_sub ():
             y_lens_sub ():
+            return_attention (bool): if False, attention weights are not
+                collected and None is returned instead
+            utt_ids (list, optional): utterance ids to look up the encoder
+                output cache
         Returns:
             best_hyps (np.ndarray): A tensor of size `[B]`
             aw ():
@@ -1035,40 +1018,21 @@ class NestedAttentionSeq2seq(AttentionSeq2seq):
         self.eval()
 
         if teacher_forcing:
-            # Reverse the order
-            if self.backward_1:
-                ys_sub_tmp = copy.deepcopy(ys_sub)
-                for b in range(len(xs)):
-                    ys_sub_tmp[b, :y_lens_sub[b]
-                               ] = ys_sub[b, :y_lens_sub[b]][::-1]
-            else:
-                ys_sub_tmp = ys_sub
-
-            ys_in_sub = self._create_var((ys_sub.shape[0], ys_sub.shape[1] + 1),
-                                         fill_value=self.eos_1, dtype='long')
-            ys_in_sub.data[:, 0] = self.sos_1
-            for b in range(len(xs)):
-                ys_in_sub.data[b, 1:y_lens_sub[b] + 1] = torch.from_numpy(
-                    ys_sub_tmp[b, :y_lens_sub[b]])
-
-            if self.use_cuda:
-                ys_in_sub = ys_in_sub.cuda()
+            ys_in_sub, _ = self._make_decoder_targets(
+                ys_sub, y_lens_sub, task=1,
+                dir='bwd' if self.backward_1 else 'fwd')
 
             # Wrap by Variable
             y_lens_sub = self.np2var(y_lens_sub, dtype='int')
         else:
             ys_in_sub = None
 
-        # Wrap by Variable
-        xs = self.np2var(xs)
-        x_lens = self.np2var(x_lens, dtype='int')
-
         dir = 'bwd'if self.backward_1 else 'fwd'
 
         # Encode acoustic features
         if task_index == 0:
-            enc_out, x_lens, enc_out_sub, x_lens_sub, perm_idx = self._encode(
-                xs, x_lens, is_multi_task=True)
+            enc_out, x_lens, enc_out_sub, x_lens_sub, perm_idx = self._encode_cached(
+                xs, x_lens, utt_ids, is_multi_task=True)
 
             # Next, decode by word-based decoder with character outputs
             if teacher_forcing:
@@ -1085,19 +1049,22 @@ class NestedAttentionSeq2seq(AttentionSeq2seq):
                 length_penalty=length_penalty,
                 coverage_penalty=coverage_penalty,
                 teacher_forcing=teacher_forcing,
-                ys_sub=ys_in_sub)
+                ys_sub=ys_in_sub,
+                return_attention=return_attention)
 
         elif task_index == 1:
-            _, _, enc_out, x_lens, perm_idx = self._encode(
-                xs, x_lens, is_multi_task=True)
+            _, _, enc_out, x_lens, perm_idx = self._encode_cached(
+                xs, x_lens, utt_ids, is_multi_task=True)
 
             if beam_width == 1:
                 best_hyps, aw = self._decode_infer_greedy(
-                    enc_out, x_lens, max_decode_len, task=1, dir=dir)
+                    enc_out, x_lens, max_decode_len, task=1, dir=dir,
+                    return_attention=return_attention)
             else:
                 best_hyps, aw = self._decode_infer_beam(
-                    enc_out, x_lens, beam_width, max_decode_len,
-                    length_penalty, coverage_penalty, task=1, dir=dir)
+                    enc_out, x_lens, beam_width, max_decode_len, min_decode_len,
+                    length_penalty, coverage_penalty, task=1, dir=dir,
+                    return_attention=return_attention)
         else:
             raise ValueError
 
@@ -1122,7 +1089,7 @@ class NestedAttentionSeq2seq(AttentionSeq2seq):
                             beam_width_sub, max_decode_len_sub, min_decode_len_sub,
                             length_penalty, coverage_penalty,
                             teacher_forcing=False, ys_sub=None,
-                            reverse_backward=True):
+                            reverse_backward=True, return_attention=True):
         """Greedy decoding in the inference stage.
         Args:
             enc_out (torch.autograd.Variable, float): A tensor of size
@@ -1142,12 +1109,15 @@ class NestedAttentionSeq2seq(AttentionSeq2seq):
             teacher_forcing (bool):
             ys_sub ():
             reverse_backward (bool):
+            return_attention (bool): if False, attention weights are not
+                collected
         Returns:
             best_hyps (np.ndarray): A tensor of size `[B, T_out]`
             aw (np.ndarray): A tensor of size `[B, T_out, T_in]`
             best_hyps_sub (np.ndarray): A tensor of size `[B, T_out_sub]`
             aw_sub (np.ndarray): A tensor of size `[B, T_out_sub, T_in]`
             aw_dec (np.ndarray): A tensor of size `[B, T_out, T_out_sub]`
+            NOTE: aw, aw_sub, and aw_dec are None if return_attention is False
         """
         batch_size, max_time = enc_out.size()[:2]
         dir = 'bwd' if self.backward_1 else 'fwd'
@@ -1184,13 +1154,17 @@ class NestedAttentionSeq2seq(AttentionSeq2seq):
                 (1,  1, enc_out_sub.size(-1)), fill_value=0., volatile=True)
 
             complete_sub = []
-            beam_sub = [{'hyp': [self.sos_1],
+            history_sub = BeamHistory()
+            beam_sub = [{'y': self.sos_1,
+                         'hyp_len': 1,
                          'score': 0,  # log 1
                          'dec_state': dec_state_sub,
-                         'dec_outs': [dec_out_sub],  # NOTE: keep all outputs
+                         'dec_out': dec_out_sub,
                          'context_vec': context_vec_sub,
-                         'aw_steps': [aw_step_sub],
-                         'probs_sub': []}]
+                         'aw_step': aw_step_sub,
+                         'aw_sum': aw_step_sub,
+                         'step': -1,
+                         'index': -1}]
             for t in range(max_decode_len_sub):
                 new_beam_sub = []
                 for i_beam in range(len(beam_sub)):
@@ -1198,12 +1172,12 @@ class NestedAttentionSeq2seq(AttentionSeq2seq):
                         y_sub = ys_sub[:, t:t + 1]
                     else:
                         y_sub = self._create_var(
-                            (1, 1), fill_value=beam_sub[i_beam]['hyp'][-1], dtype='long')
+                            (1, 1), fill_value=beam_sub[i_beam]['y'], dtype='long')
                     y_sub = self.embed_1(y_sub)
 
                     if self.decoding_order == 'bahdanau':
                         if t == 0:
-                            dec_out_sub = beam_sub[i_beam]['dec_outs'][-1]
+                            dec_out_sub = beam_sub[i_beam]['dec_out']
                         else:
                             # Recurrency
                             dec_in_sub = torch.cat(
@@ -1216,7 +1190,7 @@ class NestedAttentionSeq2seq(AttentionSeq2seq):
                             enc_out_sub[b:b + 1, :x_lens_sub.data[b]],
                             enc_out_sub_a[b:b + 1, :x_lens_sub.data[b]],
                             x_lens_sub[b:b + 1],
-                            dec_out_sub, beam_sub[i_beam]['aw_steps'][-1])
+                            dec_out_sub, beam_sub[i_beam]['aw_step'])
 
                     elif self.decoding_order == 'luong':
                         # Recurrency
@@ -1230,7 +1204,7 @@ class NestedAttentionSeq2seq(AttentionSeq2seq):
                             enc_out_sub[b:b + 1, :x_lens_sub.data[b]],
                             enc_out_sub_a[b:b + 1, :x_lens_sub.data[b]],
                             x_lens_sub[b:b + 1],
-                            dec_out_sub, beam_sub[i_beam]['aw_steps'][-1])
+                            dec_out_sub, beam_sub[i_beam]['aw_step'])
 
                     elif self.decoding_order == 'conditional':
                         # Recurrency of the first decoder
@@ -1242,7 +1216,7 @@ class NestedAttentionSeq2seq(AttentionSeq2seq):
                             enc_out_sub[b:b + 1, :x_lens_sub.data[b]],
                             enc_out_sub_a[b:b + 1, :x_lens_sub.data[b]],
                             x_lens_sub[b:b + 1],
-                            _dec_out_sub, beam_sub[i_beam]['aw_steps'][-1])
+                            _dec_out_sub, beam_sub[i_beam]['aw_step'])
 
                         # Recurrency of the second decoder
                         dec_out_sub, dec_state_sub = getattr(self, 'decoder_second_1_' + dir)(
@@ -1267,7 +1241,7 @@ class NestedAttentionSeq2seq(AttentionSeq2seq):
 
                     for k in range(beam_width_sub):
                         # Exclude short hypotheses
-                        if indices_sub_topk[0, k].data[0] == self.eos_1 and len(beam_sub[i_beam]['hyp']) < min_decode_len_sub:
+                        if indices_sub_topk[0, k].data[0] == self.eos_1 and beam_sub[i_beam]['hyp_len'] < min_decode_len_sub:
                             continue
                         # if indices_sub_topk[0, k].data[0] == self.eos_1 and len(beam_sub[i_beam]['hyp']) < x_lens_sub[b].data[0] * min_decode_len_ratio:
                         #     continue
@@ -1279,8 +1253,8 @@ class NestedAttentionSeq2seq(AttentionSeq2seq):
                         # Add coverage penalty
                         if coverage_penalty > 0:
                             threshold = 0.5
-                            aw_steps_sub = torch.cat(
-                                beam_sub[i_beam]['aw_steps'], dim=0).sum(0).squeeze(1)
+                            aw_steps_sub = beam_sub[i_beam]['aw_sum'].sum(
+                                0).squeeze(1)
 
                             # Google NMT
                             # cov_sum = torch.where(
@@ -1293,21 +1267,35 @@ class NestedAttentionSeq2seq(AttentionSeq2seq):
                             score_sub += cov_sum * coverage_penalty
 
                         new_beam_sub.append(
-                            {'hyp': beam_sub[i_beam]['hyp'] + [indices_sub_topk[0, k].data[0]],
+                            {'y': indices_sub_topk[0, k].data[0],
+                             'hyp_len': beam_sub[i_beam]['hyp_len'] + 1,
                              'score': score_sub,
                              'dec_state': copy.deepcopy(dec_state_sub),
-                             'dec_outs': beam_sub[i_beam]['dec_outs'] + [dec_out_sub],
+                             'dec_out': dec_out_sub,
                              'context_vec': context_vec_sub,
-                             'aw_steps': beam_sub[i_beam]['aw_steps'] + [aw_step_sub],
-                             'probs_sub': beam_sub[i_beam]['probs_sub'] + [logits_step_sub]})
+                             'aw_step': aw_step_sub,
+                             'aw_sum': beam_sub[i_beam]['aw_sum'] + aw_step_sub,
+                             'probs_sub': logits_step_sub,
+                             'parent': beam_sub[i_beam]['index']})
 
                 new_beam_sub = sorted(
                     new_beam_sub, key=lambda x: x['score'], reverse=True)
+                new_beam_sub = new_beam_sub[:beam_width_sub]
+
+                # Store back-pointers
+                step = history_sub.append(
+                    back_pointers=[cand['parent'] for cand in new_beam_sub],
+                    token=[cand['y'] for cand in new_beam_sub],
+                    dec_out=[cand['dec_out'] for cand in new_beam_sub],
+                    aw=[cand['aw_step'] for cand in new_beam_sub],
+                    probs_sub=[cand['probs_sub'] for cand in new_beam_sub])
+                for j, cand in enumerate(new_beam_sub):
+                    cand['step'], cand['index'] = step, j
 
                 # Remove complete hypotheses
                 not_complete_sub = []
-                for cand in new_beam_sub[:beam_width_sub]:
-                    if cand['hyp'][-1] == self.eos_1:
+                for cand in new_beam_sub:
+                    if cand['y'] == self.eos_1:
                         complete_sub.append(cand)
                     else:
                         not_complete_sub.append(cand)
@@ -1324,18 +1312,21 @@ class NestedAttentionSeq2seq(AttentionSeq2seq):
             # Renormalized hypotheses by length
             if length_penalty > 0:
                 for j in range(len(complete_sub)):
-                    complete_sub[j]['score'] += len(complete_sub[j]
-                                                    ['hyp']) * length_penalty
+                    complete_sub[j]['score'] += complete_sub[j]['hyp_len'] * \
+                        length_penalty
 
             complete_sub = sorted(
                 complete_sub, key=lambda x: x['score'], reverse=True)
-            best_hyps_sub.append(np.array(complete_sub[0]['hyp'][1:]))
-            aw_sub.append(complete_sub[0]['aw_steps'][1:])
-            dec_out_sub_seq.append(
-                torch.cat(complete_sub[0]['dec_outs'][1:], dim=1))
-            probs_sub.append(
-                torch.cat(complete_sub[0]['probs_sub'], dim=1))
-            y_lens_sub[b] = len(complete_sub[0]['hyp'][1:])
+
+            # Recover the best hypothesis from back-pointers
+            trace_sub = history_sub.backtrack(
+                complete_sub[0]['step'], complete_sub[0]['index'])
+            best_hyps_sub.append(np.array(trace_sub['token']))
+            if return_attention:
+                aw_sub.append(trace_sub['aw'])
+            dec_out_sub_seq.append(torch.cat(trace_sub['dec_out'], dim=1))
+            probs_sub.append(torch.cat(trace_sub['probs_sub'], dim=1))
+            y_lens_sub[b] = len(trace_sub['token'])
 
         ##################################################
         # Next, decode by the first decoder
@@ -1365,19 +1356,24 @@ class NestedAttentionSeq2seq(AttentionSeq2seq):
                 (1,  1, dec_out.size(-1)), fill_value=0., volatile=True)
 
             complete = []
-            beam = [{'hyp': [self.sos_0],
+            history = BeamHistory()
+            beam = [{'y': self.sos_0,
+                     'hyp_len': 1,
                      'score': 0,  # log 1
                      'dec_state': dec_state,
                      'dec_out': dec_out,
                      'context_vec_enc': context_vec_enc,
                      'context_vec_dec': context_vec_dec,
-                     'aw_steps_enc': [aw_step_enc],
-                     'aw_steps_dec': [aw_step_dec]}]
+                     'aw_step_enc': aw_step_enc,
+                     'aw_step_dec': aw_step_dec,
+                     'aw_sum': aw_step_enc,
+                     'step': -1,
+                     'index': -1}]
             for t in range(max_decode_len):
                 new_beam = []
                 for i_beam in range(len(beam)):
                     y = self._create_var(
-                        (1, 1), fill_value=beam[i_beam]['hyp'][-1], dtype='long')
+                        (1, 1), fill_value=beam[i_beam]['y'], dtype='long')
                     y = self.embed_0(y)
 
                     if self.decoding_order == 'bahdanau':
@@ -1397,7 +1393,7 @@ class NestedAttentionSeq2seq(AttentionSeq2seq):
                             enc_out[b:b + 1, :x_lens.data[b]],
                             enc_out_a[b:b + 1, :x_lens.data[b]],
                             x_lens[b:b + 1],
-                            dec_out, beam[i_beam]['aw_steps_enc'][-1])
+                            dec_out, beam[i_beam]['aw_step_enc'])
 
                         # Score for the second decoder states
                         if self.cold_fusion_like_prob_injection:
@@ -1405,7 +1401,7 @@ class NestedAttentionSeq2seq(AttentionSeq2seq):
                                 dec_out_sub_seq[b][: y_lens_sub.data[b]],
                                 dec_out_sub_seq_a[0:1, :y_lens_sub.data[b]],
                                 y_lens_sub[b:b + 1],
-                                dec_out, beam[i_beam]['aw_steps_dec'][-1])
+                                dec_out, beam[i_beam]['aw_step_dec'])
 
                             context_vec_dec = []
                             for h in range(self.num_heads_dec):
@@ -1431,7 +1427,7 @@ class NestedAttentionSeq2seq(AttentionSeq2seq):
                                 dec_out_sub_seq[b][: y_lens_sub.data[b]],
                                 dec_out_sub_seq_a[0:1, :y_lens_sub.data[b]],
                                 y_lens_sub[b:b + 1],
-                                dec_out, beam[i_beam]['aw_steps_dec'][-1])
+                                dec_out, beam[i_beam]['aw_step_dec'])
                             if self.relax_context_vec_dec:
                                 context_vec_dec = self.W_c_dec_relax(
                                     context_vec_dec)
@@ -1451,7 +1447,7 @@ class NestedAttentionSeq2seq(AttentionSeq2seq):
                             enc_out[b:b + 1, :x_lens.data[b]],
                             enc_out_a[b:b + 1, :x_lens.data[b]],
                             x_lens[b:b + 1],
-                            dec_out, beam[i_beam]['aw_steps_enc'][-1])
+                            dec_out, beam[i_beam]['aw_step_enc'])
 
                         # Score for the second decoder states
                         if self.cold_fusion_like_prob_injection:
@@ -1459,7 +1455,7 @@ class NestedAttentionSeq2seq(AttentionSeq2seq):
                                 dec_out_sub_seq[b][: y_lens_sub.data[b]],
                                 dec_out_sub_seq_a[0:1, :y_lens_sub.data[b]],
                                 y_lens_sub[b:b + 1],
-                                dec_out, beam[i_beam]['aw_steps_dec'][-1])
+                                dec_out, beam[i_beam]['aw_step_dec'])
 
                             context_vec_dec = []
                             for h in range(self.num_heads_dec):
@@ -1485,7 +1481,7 @@ class NestedAttentionSeq2seq(AttentionSeq2seq):
                                 dec_out_sub_seq[b][: y_lens_sub.data[b]],
                                 dec_out_sub_seq_a[0:1, :y_lens_sub.data[b]],
                                 y_lens_sub[b:b + 1],
-                                beam[i_beam]['dec_out'], beam[i_beam]['aw_steps_dec'][-1])
+                                beam[i_beam]['dec_out'], beam[i_beam]['aw_step_dec'])
                             if self.relax_context_vec_dec:
                                 context_vec_dec = self.W_c_dec_relax(
                                     context_vec_dec)
@@ -1500,7 +1496,7 @@ class NestedAttentionSeq2seq(AttentionSeq2seq):
                             enc_out[b:b + 1, :x_lens.data[b]],
                             enc_out_a[b:b + 1, :x_lens.data[b]],
                             x_lens[b:b + 1],
-                            _dec_out, beam[i_beam]['aw_steps_enc'][-1])
+                            _dec_out, beam[i_beam]['aw_step_enc'])
 
                         # Score for the second decoder states
                         if self.cold_fusion_like_prob_injection:
@@ -1508,7 +1504,7 @@ class NestedAttentionSeq2seq(AttentionSeq2seq):
                                 dec_out_sub_seq[b][: y_lens_sub.data[b]],
                                 dec_out_sub_seq_a[0:1, :y_lens_sub.data[b]],
                                 y_lens_sub[b:b + 1],
-                                _dec_out, beam[i_beam]['aw_steps_dec'][-1])
+                                _dec_out, beam[i_beam]['aw_step_dec'])
 
                             context_vec_dec = []
                             for h in range(self.num_heads_dec):
@@ -1534,7 +1530,7 @@ class NestedAttentionSeq2seq(AttentionSeq2seq):
                                 dec_out_sub_seq[b][: y_lens_sub.data[b]],
                                 dec_out_sub_seq_a[0:1, :y_lens_sub.data[b]],
                                 y_lens_sub[b:b + 1],
-                                _dec_out, beam[i_beam]['aw_steps_dec'][-1])
+                                _dec_out, beam[i_beam]['aw_step_dec'])
                             if self.relax_context_vec_dec:
                                 context_vec_dec = self.W_c_dec_relax(
                                     context_vec_dec)
@@ -1567,7 +1563,7 @@ class NestedAttentionSeq2seq(AttentionSeq2seq):
 
                     for k in range(beam_width):
                         # Exclude short hypotheses
-                        if indices_topk[0, k].data[0] == self.eos_0 and len(beam[i_beam]['hyp']) < min_decode_len:
+                        if indices_topk[0, k].data[0] == self.eos_0 and beam[i_beam]['hyp_len'] < min_decode_len:
                             continue
                         # if indices_topk[0, k].data[0] == self.eos_0 and len(beam[i_beam]['hyp']) < x_lens[b].data[0] * min_decode_len_ratio:
                         #     continue
@@ -1579,8 +1575,8 @@ class NestedAttentionSeq2seq(AttentionSeq2seq):
                         # Add coverage penalty
                         if coverage_penalty > 0:
                             threshold = 0.5
-                            aw_steps = torch.cat(
-                                beam[i_beam]['aw_steps'], dim=0).sum(0).squeeze(1)
+                            aw_steps = beam[i_beam]['aw_sum'].sum(
+                                0).squeeze(1)
 
                             # Google NMT
                             # cov_sum = torch.where(
@@ -1593,22 +1589,35 @@ class NestedAttentionSeq2seq(AttentionSeq2seq):
                             score += cov_sum * coverage_penalty
 
                         new_beam.append(
-                            {'hyp': beam[i_beam]['hyp'] + [indices_topk[0, k].data[0]],
+                            {'y': indices_topk[0, k].data[0],
+                             'hyp_len': beam[i_beam]['hyp_len'] + 1,
                              'score': score,
                              'dec_state': copy.deepcopy(dec_state),
                              'dec_out': dec_out,
                              'context_vec_enc': context_vec_enc,
                              'context_vec_dec': context_vec_dec,
-                             'aw_steps_enc': beam[i_beam]['aw_steps_enc'] + [aw_step_enc],
-                             'aw_steps_dec': beam[i_beam]['aw_steps_dec'] + [aw_step_dec]})
+                             'aw_step_enc': aw_step_enc,
+                             'aw_step_dec': aw_step_dec,
+                             'aw_sum': beam[i_beam]['aw_sum'] + aw_step_enc,
+                             'parent': beam[i_beam]['index']})
 
                 new_beam = sorted(
                     new_beam, key=lambda x: x['score'], reverse=True)
+                new_beam = new_beam[:beam_width]
+
+                # Store back-pointers
+                step = history.append(
+                    back_pointers=[cand['parent'] for cand in new_beam],
+                    token=[cand['y'] for cand in new_beam],
+                    aw_enc=[cand['aw_step_enc'] for cand in new_beam],
+                    aw_dec=[cand['aw_step_dec'] for cand in new_beam])
+                for j, cand in enumerate(new_beam):
+                    cand['step'], cand['index'] = step, j
 
                 # Remove complete hypotheses
                 not_complete = []
-                for cand in new_beam[:beam_width]:
-                    if cand['hyp'][-1] == self.eos_0:
+                for cand in new_beam:
+                    if cand['y'] == self.eos_0:
                         complete.append(cand)
                     else:
                         not_complete.append(cand)
@@ -1625,26 +1634,36 @@ class NestedAttentionSeq2seq(AttentionSeq2seq):
             # Renormalized hypotheses by length
             if length_penalty > 0:
                 for j in range(len(complete)):
-                    complete[j]['score'] += len(complete[j]
-                                                ['hyp']) * length_penalty
+                    complete[j]['score'] += complete[j]['hyp_len'] * \
+                        length_penalty
 
             complete = sorted(
                 complete, key=lambda x: x['score'], reverse=True)
-            best_hyps.append(np.array(complete[0]['hyp'][1:]))
-            aw.append(complete[0]['aw_steps_enc'][1:])
-            aw_dec.append(complete[0]['aw_steps_dec'][1:])
+
+            # Recover the best hypothesis from back-pointers
+            trace = history.backtrack(
+                complete[0]['step'], complete[0]['index'])
+            best_hyps.append(np.array(trace['token']))
+            if return_attention:
+                aw.append(trace['aw_enc'])
+                aw_dec.append(trace['aw_dec'])
 
         # Concatenate in T_out dimension
-        for j in range(len(aw)):
-            for k in range(len(aw_sub[j])):
-                aw_sub[j][k] = aw_sub[j][k][:, :, 0]  # TODO: fix for MHA
-            aw_sub[j] = self.var2np(torch.stack(aw_sub[j], dim=1).squeeze(0))
-
-            for k in range(len(aw[j])):
-                aw[j][k] = aw[j][k][:, :, 0]  # TODO: fix for MHA
-                aw_dec[j][k] = aw_dec[j][k][:, :, 0]  # TODO: fix for MHA
-            aw[j] = self.var2np(torch.stack(aw[j], dim=1).squeeze(0))
-            aw_dec[j] = self.var2np(torch.stack(aw_dec[j], dim=1).squeeze(0))
+        if return_attention:
+            for j in range(len(aw)):
+                for k in range(len(aw_sub[j])):
+                    aw_sub[j][k] = aw_sub[j][k][:, :, 0]  # TODO: fix for MHA
+                aw_sub[j] = self.var2np(
+                    torch.stack(aw_sub[j], dim=1).squeeze(0))
+
+                for k in range(len(aw[j])):
+                    aw[j][k] = aw[j][k][:, :, 0]  # TODO: fix for MHA
+                    aw_dec[j][k] = aw_dec[j][k][:, :, 0]  # TODO: fix for MHA
+                aw[j] = self.var2np(torch.stack(aw[j], dim=1).squeeze(0))
+                aw_dec[j] = self.var2np(
+                    torch.stack(aw_dec[j], dim=1).squeeze(0))
+        else:
+            aw, aw_sub, aw_dec = None, None, None
 
         # Reverse the order
         if self.backward_1 and reverse_backward:
@@ -20,6 +20,7 @@ import torch.nn as nn
 import torch.optim as optim
 
 from models.pytorch_v3.tmp.lr_scheduler import ReduceLROnPlateau
+from models.pytorch_v3.encoder_cache import EncoderCache
 from utils.directory import mkdir
 
 OPTIMIZER_CLS_NAMES = {
@@ -138,6 +139,100 @@ class ModelBase(nn.Module):
         else:
             logger.info('CPU mode')
 
+    def train(self, mode=True):
+        """Set the training mode. Cached encoder outputs are invalidated
+            because parameters will be updated.
+        Args:
+            mode (bool, optional):
+        """
+        if mode:
+            self._update_model_version()
+        return super(ModelBase, self).train(mode)
+
+    @property
+    def model_version(self):
+        """The counter of updates of parameters."""
+        return getattr(self, '_model_version', 0)
+
+    def _update_model_version(self):
+        self._model_version = self.model_version + 1
+        if getattr(self, '_encoder_cache', None) is not None:
+            self._encoder_cache.clear()
+
+    def set_encoder_cache(self, max_bytes=1 << 30, spill_path=None):
+        """Cache encoder outputs of each utterance in the inference stage,
+            so that each utterance is encoded only once across decoding
+            passes and tasks. Utterance ids must be passed to decoders.
+        Args:
+            max_bytes (int, optional): the maximum size of encoder outputs
+                kept in the memory
+            spill_path (string, optional): path to the file to which encoder
+                outputs over max_bytes are spilled
+        """
+        self._encoder_cache = EncoderCache(max_bytes=max_bytes,
+                                           spill_path=spill_path)
+
+    def clear_encoder_cache(self):
+        self._encoder_cache = None
+
+    def _encode_cached(self, xs, x_lens, utt_ids=None, is_multi_task=False):
+        """Encode acoustic features through the encoder output cache.
+            Only utterances which are not cached are encoded.
+        Args:
+            xs (np.ndarray): A tensor of size `[B, T_in, input_size]`
+            x_lens (np.ndarray): A tensor of size `[B]`
+            utt_ids (list, optional): the utterance id of each utterance.
+                If None or the cache is not set, all utterances are encoded.
+            is_multi_task (bool):
+        Returns:
+            the same outputs as _encode. Outputs from the cache are sorted
+                by lengths in descending order, and perm_idx is always
+                returned.
+        """
+        cache = getattr(self, '_encoder_cache', None)
+        if utt_ids is None or cache is None or self.training:
+            return self._encode(self.np2var(xs),
+                                self.np2var(x_lens, dtype='int'),
+                                is_multi_task=is_multi_task)
+
+        keys = [(utt_id, self.model_version, is_multi_task)
+                for utt_id in utt_ids]
+        outputs = [cache.get(key) for key in keys]
+
+        # Encode utterances which are not cached
+        miss = [b for b, out in enumerate(outputs) if out is None]
+        if len(miss) > 0:
+            x_lens_miss = np.asarray(x_lens)[miss]
+            xs_miss = np.asarray(xs)[miss, :max(x_lens_miss)]
+            res = self._encode(self.np2var(xs_miss),
+                               self.np2var(x_lens_miss, dtype='int'),
+                               is_multi_task=is_multi_task)
+            perm_idx = res[-1]
+            perm_idx = np.arange(len(miss)) if perm_idx is None \
+                else self.var2np(perm_idx)
+            streams = [(self.var2np(res[i]), self.var2np(res[i + 1]))
+                       for i in range(0, len(res) - 1, 2)]
+            for i, j in enumerate(perm_idx):
+                out = tuple(enc_out[i, :enc_lens[i]]
+                            for enc_out, enc_lens in streams)
+                cache.put(keys[miss[j]], out)
+                outputs[miss[j]] = out
+
+        # Pad cached outputs
+        perm_idx = np.argsort(-np.array([out[0].shape[0] for out in outputs]),
+                              kind='mergesort')
+        res = []
+        for i in range(len(outputs[0])):
+            enc_lens = np.array([outputs[b][i].shape[0] for b in perm_idx],
+                                dtype=np.int32)
+            enc_out = np.zeros(
+                (len(outputs), max(enc_lens)) + outputs[0][i].shape[1:],
+                dtype=np.float32)
+            for j, b in enumerate(perm_idx):
+                enc_out[j, :enc_lens[j]] = outputs[b][i]
+            res += [self.np2var(enc_out), self.np2var(enc_lens, dtype='int')]
+        return tuple(res) + (self.np2var(perm_idx, dtype='long'),)
+
     def set_optimizer(self, optimizer, learning_rate_init,
                       weight_decay=0, clip_grad_norm=5,
                       lr_schedule=True, factor=0.1, patience_epoch=5):
@@ -315,6 +410,7 @@ class ModelBase(nn.Module):
                 logger.info('=> Finished loading.')
             else:
                 self.load_state_dict(checkpoint['state_dict'])
+            self._update_model_version()
 
             # Restore optimizer
             if restart:
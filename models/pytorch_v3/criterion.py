@@ -7,40 +7,46 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import math
 import torch
 import torch.nn.functional as F
 from torch.autograd import Variable
 
 
 def kl_div_label_smoothing(logits, label_smoothing_prob,
-                           distribution='uniform', size_average=False):
+                           distribution='uniform', size_average=False,
+                           y_lens=None):
     """KL divergence loss for label smoothing.
     Args:
         logits (torch.autograd.Variable, float):
-            A tensor of size `[B, T_in, num_classes]`
+            A tensor of size `[B, T, num_classes]`
         label_smoothing_prob (float, optional):
         distribution (string, optional): uniform
         size_average (bool, optional):
+        y_lens (torch.autograd.Variable, int, optional): A tensor of size `[B]`.
+            If None, all time steps are used.
     Returns:
         kl_loss (torch.autograd.Variable, float): A tensor of size `[1]`
     """
     batch_size, label_num, num_classes = logits.size()
     if distribution == 'uniform':
-        dist = Variable(torch.FloatTensor(
-            batch_size, label_num, num_classes).fill_(1 / num_classes * label_smoothing_prob))
+        dist = 1 / num_classes * label_smoothing_prob
     elif distribution == 'normal':
         raise NotImplementedError
     else:
         raise NotImplementedError
 
-    if logits.is_cuda:
-        dist = dist.cuda()
+    log_probs = F.log_softmax(logits, dim=-1)
+
+    # sum_c q_c * (log q_c - log p_c) with a constant q_c
+    # NOTE: the uniform distribution is never materialized
+    kl_loss = dist * math.log(dist) * num_classes - \
+        dist * log_probs.sum(dim=-1)
+    # NOTE: kl_loss: `[B, T]`
 
-    kl_loss = F.kl_div(F.softmax(logits, dim=-1), dist,
-                       size_average=False, reduce=True)
-    # kl_loss = F.kl_div(F.log_softmax(logits, dim=-1), torch.log(dist),
-    #                    size_average=False, reduce=True)
-    # TODO: compute at log-space?
+    if y_lens is not None:
+        kl_loss = kl_loss * _make_pad_mask(logits, y_lens)
+    kl_loss = kl_loss.sum()
 
     if size_average:
         kl_loss /= batch_size
@@ -71,10 +77,29 @@ def cross_entropy_label_smoothing(logits, y_lens, label_smoothing_prob,
 
     log_probs = F.log_softmax(logits, dim=-1)
 
-    xe_loss = sum([(- dist * log_probs[b, :y_lens[b].data[0]]).sum()
-                   for b in range(batch_size)])
+    # Sum over classes first, then mask padded time steps
+    xe_loss = - dist * (log_probs.sum(dim=-1) *
+                        _make_pad_mask(logits, y_lens)).sum()
 
     if size_average:
         xe_loss /= batch_size
 
     return xe_loss
+
+
+def _make_pad_mask(logits, y_lens):
+    """Make a mask for padded time steps on the same device as logits.
+    Args:
+        logits (torch.autograd.Variable, float):
+            A tensor of size `[B, T, num_classes]`
+        y_lens (torch.autograd.Variable, int): A tensor of size `[B]`
+    Returns:
+        mask (torch.autograd.Variable, float): A tensor of size `[B, T]`,
+            where 1 means valid and 0 means padded
+    """
+    batch_size, max_time = logits.size()[:2]
+    steps = Variable(torch.arange(0, max_time).type_as(logits.data),
+                     requires_grad=False)
+    steps = steps.unsqueeze(0).expand(batch_size, max_time)
+    y_lens = y_lens.type_as(logits).unsqueeze(1).expand(batch_size, max_time)
+    return (steps < y_lens).type_as(logits)
@@ -396,7 +396,9 @@ class CTC(ModelBase):
             return logits, x_lens, perm_idx
 
     def decode(self, xs, x_lens, beam_width, max_decode_len=None,
-               min_decode_len=0, length_penalty=0, coverage_penalty=0, task_index=0):
+               min_decode_len=0, length_penalty=0, coverage_penalty=0, task_index=0,
+               return_attention=False, lm=None, lm_weight=0, insertion_bonus=0,
+               utt_ids=None):
         """CTC decoding.
         Args:
             xs (np.ndarray): A tensor of size `[B, T_in, input_size]`
@@ -407,6 +409,13 @@ class CTC(ModelBase):
             length_penalty: not used
             coverage_penalty: not used
             task_index (bool): the index of a task
+            return_attention: not used (to make compatible)
+            lm (optional): the language model for shallow fusion in beam
+                search (`NgramLM` or `RNNLMScorer`)
+            lm_weight (float): the weight of the language model
+            insertion_bonus (float): the bonus per token in beam search
+            utt_ids (list, optional): utterance ids to look up the encoder
+                output cache
         Returns:
             best_hyps (np.ndarray): A tensor of size `[B]`
             None: this corresponds to aw in attention-based models
@@ -415,30 +424,30 @@ class CTC(ModelBase):
         # Change to evaluation mode
         self.eval()
 
-        # Wrap by Variable
-        xs = self.np2var(xs)
-        x_lens = self.np2var(x_lens, dtype='int')
-
         # Encode acoustic features
         if hasattr(self, 'main_loss_weight'):
             if task_index == 0:
-                logits, x_lens, _, _, perm_idx = self._encode(
-                    xs, x_lens, is_multi_task=True)
+                logits, x_lens, _, _, perm_idx = self._encode_cached(
+                    xs, x_lens, utt_ids, is_multi_task=True)
             elif task_index == 1:
-                _, _, logits, x_lens, perm_idx = self._encode(
-                    xs, x_lens, is_multi_task=True)
+                _, _, logits, x_lens, perm_idx = self._encode_cached(
+                    xs, x_lens, utt_ids, is_multi_task=True)
             else:
                 raise NotImplementedError
         else:
-            logits, x_lens, perm_idx = self._encode(xs, x_lens)
+            logits, x_lens, perm_idx = self._encode_cached(xs, x_lens, utt_ids)
 
         if beam_width == 1:
-            best_hyps = self._decode_greedy_np(
-                self.var2np(logits), self.var2np(x_lens))
+            # NOTE: pick up the best path on the device
+            best_hyps, y_lens = self._decode_greedy_np(
+                self.var2np(torch.max(logits, dim=-1)[1]), self.var2np(x_lens))
+            best_hyps = np.array([best_hyps[b, :y_lens[b]]
+                                  for b in range(len(y_lens))])
         else:
             best_hyps = self._decode_beam_np(
                 self.var2np(F.log_softmax(logits, dim=-1)),
-                self.var2np(x_lens), beam_width=beam_width)
+                self.var2np(x_lens), beam_width=beam_width,
+                alpha=lm_weight, beta=insertion_bonus, lm=lm)
 
         # NOTE: index 0 is reserved for the blank class in warpctc_pytorch
         best_hyps -= 1
@@ -452,8 +461,62 @@ class CTC(ModelBase):
         return best_hyps, None, perm_idx
         # NOTE: None corresponds to aw in attention-based models
 
+    def decode_nbest(self, xs, x_lens, beam_width, nbest=None, task_index=0,
+                     lm=None, lm_weight=0, insertion_bonus=0, utt_ids=None):
+        """CTC decoding with N-best outputs.
+        Args:
+            xs (np.ndarray): A tensor of size `[B, T_in, input_size]`
+            x_lens (np.ndarray): A tensor of size `[B]`
+            beam_width (int): the size of beam
+            nbest (int, optional): the number of hypotheses of each
+                utterance. By default, beam_width.
+            task_index (bool): the index of a task
+            lm (optional): the language model for shallow fusion
+            lm_weight (float): the weight of the language model
+            insertion_bonus (float): the bonus per token in beam search
+            utt_ids (list, optional): utterance ids to look up the encoder
+                output cache
+        Returns:
+            nbest_hyps (list): A list of length `[B]`, which contains lists
+                of np.ndarray in the descending order of scores
+            scores (list): A list of length `[B]`, which contains
+                np.ndarray of scores
+            perm_idx (np.ndarray): A tensor of size `[B]`
+        """
+        # Change to evaluation mode
+        self.eval()
+
+        # Encode acoustic features
+        if hasattr(self, 'main_loss_weight'):
+            if task_index == 0:
+                logits, x_lens, _, _, perm_idx = self._encode_cached(
+                    xs, x_lens, utt_ids, is_multi_task=True)
+            elif task_index == 1:
+                _, _, logits, x_lens, perm_idx = self._encode_cached(
+                    xs, x_lens, utt_ids, is_multi_task=True)
+            else:
+                raise NotImplementedError
+        else:
+            logits, x_lens, perm_idx = self._encode_cached(xs, x_lens, utt_ids)
+
+        nbest_hyps, scores = self._decode_beam_np.decode_nbest(
+            self.var2np(F.log_softmax(logits, dim=-1)), self.var2np(x_lens),
+            beam_width=beam_width, nbest=nbest,
+            alpha=lm_weight, beta=insertion_bonus, lm=lm)
+
+        # NOTE: index 0 is reserved for the blank class in warpctc_pytorch
+        nbest_hyps = [[hyp - 1 for hyp in hyps] for hyps in nbest_hyps]
+
+        # Permutate indices to the original order
+        if perm_idx is None:
+            perm_idx = np.arange(0, len(xs), 1)
+        else:
+            perm_idx = self.var2np(perm_idx)
+
+        return nbest_hyps, scores, perm_idx
+
     def posteriors(self, xs, x_lens, temperature=1,
-                   blank_scale=None, task_idx=0):
+                   blank_scale=None, task_idx=0, utt_ids=None):
         """Returns CTC posteriors (after the softmax layer).
         Args:
             xs (np.ndarray): A tensor of size `[B, T_in, input_size]`
@@ -462,6 +525,8 @@ class CTC(ModelBase):
                 softmax layer in the inference stage
             blank_scale (float):
             task_idx (int): the index ofta task
+            utt_ids (list, optional): utterance ids to look up the encoder
+                output cache
         Returns:
             probs (np.ndarray): A tensor of size `[B, T, num_classes]`
             x_lens (np.ndarray): A tensor of size `[B]`
@@ -470,22 +535,18 @@ class CTC(ModelBase):
         # Change to evaluation mode
         self.eval()
 
-        # Wrap by Variable
-        xs = self.np2var(xs)
-        x_lens = self.np2var(x_lens, dtype='int')
-
         # Encode acoustic features
         if hasattr(self, 'main_loss_weight'):
             if task_idx == 0:
-                logits, x_lens, _, _, perm_idx = self._encode(
-                    xs, x_lens, is_multi_task=True)
+                logits, x_lens, _, _, perm_idx = self._encode_cached(
+                    xs, x_lens, utt_ids, is_multi_task=True)
             elif task_idx == 1:
-                _, _, logits, x_lens, perm_idx = self._encode(
-                    xs, x_lens, is_multi_task=True)
+                _, _, logits, x_lens, perm_idx = self._encode_cached(
+                    xs, x_lens, utt_ids, is_multi_task=True)
             else:
                 raise NotImplementedError
         else:
-            logits, x_lens, perm_idx = self._encode(xs, x_lens)
+            logits, x_lens, perm_idx = self._encode_cached(xs, x_lens, utt_ids)
 
         probs = F.softmax(logits / temperature, dim=-1)
 
@@ -502,13 +563,17 @@ class CTC(ModelBase):
         return self.var2np(probs), self.var2np(x_lens), perm_idx
 
     def decode_from_probs(self, probs, x_lens, beam_width=1,
-                          max_decode_len=None):
+                          max_decode_len=None, lm=None, lm_weight=0,
+                          insertion_bonus=0):
         """
         Args:
             probs (np.ndarray):
             x_lens (np.ndarray):
             beam_width (int):
             max_decode_len (int):
+            lm (optional): the language model for shallow fusion
+            lm_weight (float): the weight of the language model
+            insertion_bonus (float): the bonus per token in beam search
         Returns:
             best_hyps (np.ndarray):
         """
@@ -518,10 +583,13 @@ class CTC(ModelBase):
         log_probs = np.log(probs + 1e-10)
 
         if beam_width == 1:
-            best_hyps = self._decode_greedy_np(log_probs, x_lens)
+            best_hyps, y_lens = self._decode_greedy_np(log_probs, x_lens)
+            best_hyps = np.array([best_hyps[b, :y_lens[b]]
+                                  for b in range(len(y_lens))])
         else:
             best_hyps = self._decode_beam_np(
-                log_probs, x_lens, beam_width=beam_width)
+                log_probs, x_lens, beam_width=beam_width,
+                alpha=lm_weight, beta=insertion_bonus, lm=lm)
 
         # NOTE: index 0 is reserved for the blank class in warpctc_pytorch
         best_hyps -= 1
@@ -8,30 +8,40 @@ from __future__ import division
 from __future__ import print_function
 
 import numpy as np
-from collections import defaultdict
 
 LOG_0 = -float("inf")
 LOG_1 = 0
 
 
-def _make_new_beam():
-    def fn(): return (LOG_0, LOG_0)
-    return defaultdict(fn)
-
-
 class BeamSearchDecoder(object):
     """Beam search decoder.
+        All hypotheses in the beam are extended by all candidate classes at
+        once. Prefixes are stored in a trie so that the same prefix always
+        has the same node index, which makes merging prefixes an array
+        comparison. Optionally, scores of the language model are added to
+        rank hypotheses (shallow fusion).
     Arga:
         blank_index (int): the index of the blank label
         space_index (int, optional): the index of the space label
+        cutoff_top_n (int, optional): the maximum number of classes
+            considered at each frame. By default, all classes are considered.
+        cutoff_prob (float, optional): classes are considered in the
+            descending order of probabilities until their cumulative
+            probability reaches this value
+        blank_threshold (float, optional): frames whose blank probability
+            exceeds this value are decoded without extending hypotheses
     """
 
-    def __init__(self, blank_index, space_index=-1):
+    def __init__(self, blank_index, space_index=-1,
+                 cutoff_top_n=None, cutoff_prob=1.0, blank_threshold=1.0):
         self._blank = blank_index
         self._space = space_index
+        self._cutoff_top_n = cutoff_top_n
+        self._cutoff_prob = cutoff_prob
+        self._blank_threshold = blank_threshold
 
     def __call__(self, log_probs, x_lens, beam_width=1,
-                 alpha=0., beta=0.):
+                 alpha=0., beta=0., lm=None):
         """Performs inference for the given output probabilities.
         Args:
             log_probs (np.ndarray): The output log-scale probabilities
@@ -41,84 +51,247 @@ class BeamSearchDecoder(object):
             beam_width (int): the size of beam
             alpha (float): language model weight
             beta (float): insertion bonus
+            lm (optional): the language model for shallow fusion
+                (`NgramLM` or `RNNLMScorer`). Each non-blank class is a word
+                of the language model, whose index is the class index
+                excluding the blank.
         Returns:
             best_hyps (np.ndarray): Best path hypothesis.
                 A tensor of size `[B, labels_max_seq_len]`
-            best_hyps_lens (np.ndarray): Lengths of best path hypothesis.
-                A tensor of size `[B]`
         """
-        batch_size, _, num_classes = log_probs.shape
+        batch_size = log_probs.shape[0]
         best_hyps = []
 
         for b in range(batch_size):
-            # Elements in the beam are (prefix, (p_blank, p_no_blank))
-            # Initialize the beam with the empty sequence, a probability of
-            # 1 for ending in blank and zero for ending in non-blank
-            # (in log space).
-            beam = [(tuple(), (LOG_1, LOG_0))]
-            time = x_lens[b]
-
-            for t in range(time):
-
-                # A default dictionary to store the next step candidates.
-                next_beam = _make_new_beam()
-
-                for c in range(num_classes):
-                    p_t = log_probs[b, t, c]
-
-                    # The variables p_b and p_nb are respectively the
-                    # probabilities for the prefix given that it ends in a
-                    # blank and does not end in a blank at this time step.
-                    for prefix, (p_b, p_nb) in beam:
-
-                        # If we propose a blank the prefix doesn't change.
-                        # Only the probability of ending in blank gets updated.
-                        if c == self._blank:
-                            new_p_b, new_p_nb = next_beam[prefix]
-                            new_p_b = np.logaddexp(
-                                new_p_b, np.logaddexp(p_b + p_t, p_nb + p_t))
-                            # new_p_b = np.logaddexp(p_b + p_t, p_nb + p_t)
-                            next_beam[prefix] = (new_p_b, new_p_nb)
-                            continue
-
-                        # Extend the prefix by the new character c and it to the
-                        # beam. Only the probability of not ending in blank gets
-                        # updated.
-                        prefix_end = prefix[-1] if prefix else None
-                        new_prefix = prefix + (c,)
-                        new_p_b, new_p_nb = next_beam[new_prefix]
-                        if c != prefix_end:
-                            new_p_nb = np.logaddexp(
-                                new_p_nb, np.logaddexp(p_b + p_t, p_nb + p_t))
-                            # new_p_nb = np.logaddexp(p_b + p_t, p_nb + p_t)
-                        else:
-                            # We don't include the previous probability of not ending
-                            # in blank (p_nb) if c is repeated at the end. The CTC
-                            # algorithm merges characters not separated by a
-                            # blank.
-                            new_p_nb = np.logaddexp(new_p_nb, p_b + p_t)
-                            # new_p_nb = p_b + p_t
-
-                        next_beam[new_prefix] = (new_p_b, new_p_nb)
-
-                        # TODO: add LM score here
-
-                        # If c is repeated at the end we also update the unchanged
-                        # prefix. This is the merging case.
-                        if c == prefix_end:
-                            new_p_b, new_p_nb = next_beam[prefix]
-                            new_p_nb = np.logaddexp(new_p_nb, p_nb + p_t)
-                            # new_p_nb = p_nb + p_t
-                            next_beam[prefix] = (new_p_b, new_p_nb)
-
-                # Sort and trim the beam before moving on to the
-                # next time-step.
-                beam = sorted(next_beam.items(),
-                              key=lambda x: np.logaddexp(*x[1]),
-                              reverse=True)
-                beam = beam[:beam_width]
-
-            best_hyp = beam[0][0]
-            best_hyps.append(np.array(list(best_hyp)))
+            hyps, _ = self._decode(
+                log_probs[b, :x_lens[b]].astype(np.float64), beam_width,
+                alpha, beta, lm, nbest=1)
+            best_hyps.append(hyps[0])
 
         return np.array(best_hyps)
+
+    def decode_nbest(self, log_probs, x_lens, beam_width, nbest=None,
+                     alpha=0., beta=0., lm=None):
+        """Performs inference and returns N-best hypotheses.
+        Args:
+            log_probs (np.ndarray): A tensor of size `[B, T, num_classes]`
+            x_lens (np.ndarray): A tensor of size `[B]`
+            beam_width (int): the size of beam
+            nbest (int, optional): the number of hypotheses of each
+                utterance. By default, all hypotheses in the beam.
+            alpha (float): language model weight
+            beta (float): insertion bonus
+            lm (optional): the language model for shallow fusion
+        Returns:
+            nbest_hyps (list): A list of length `[B]`, which contains lists
+                of np.ndarray in the descending order of scores
+            scores (list): A list of length `[B]`, which contains
+                np.ndarray of scores (including LM scores and the bonus)
+        """
+        nbest_hyps, scores = [], []
+        for b in range(log_probs.shape[0]):
+            hyps, scores_b = self._decode(
+                log_probs[b, :x_lens[b]].astype(np.float64), beam_width,
+                alpha, beta, lm, nbest=beam_width if nbest is None else nbest)
+            nbest_hyps.append(hyps)
+            scores.append(scores_b)
+        return nbest_hyps, scores
+
+    def _prune(self, log_probs):
+        """Select candidate classes to extend hypotheses at each frame.
+        Args:
+            log_probs (np.ndarray): A tensor of size `[T, num_classes]`
+        Returns:
+            candidates (list): non-blank classes considered at each frame.
+                Each element is a np.ndarray.
+        """
+        max_time, num_classes = log_probs.shape
+        top_n = num_classes
+        if self._cutoff_top_n is not None:
+            top_n = min(self._cutoff_top_n, num_classes)
+
+        if top_n == num_classes and self._cutoff_prob >= 1:
+            cands = np.tile(np.arange(num_classes), (max_time, 1))
+            num_cands = np.full((max_time,), num_classes, dtype=np.int64)
+        else:
+            rows = np.arange(max_time)[:, None]
+            if top_n < num_classes:
+                cands = np.argpartition(
+                    -log_probs, top_n - 1, axis=1)[:, :top_n]
+            else:
+                cands = np.tile(np.arange(num_classes), (max_time, 1))
+            order = np.argsort(-log_probs[rows, cands], axis=1,
+                               kind='mergesort')
+            cands = cands[rows, order]
+            # NOTE: in the descending order of probabilities
+
+            num_cands = np.full((max_time,), top_n, dtype=np.int64)
+            if self._cutoff_prob < 1:
+                cum_probs = np.cumsum(np.exp(log_probs[rows, cands]), axis=1)
+                num_cands = np.minimum(
+                    np.sum(cum_probs < self._cutoff_prob, axis=1) + 1, top_n)
+
+        # Skip frames dominated by the blank
+        if self._blank_threshold < 1:
+            num_cands[log_probs[:, self._blank] >
+                      np.log(self._blank_threshold)] = 0
+
+        candidates = []
+        for t in range(max_time):
+            c = cands[t, :num_cands[t]]
+            candidates.append(c[c != self._blank])
+        return candidates
+
+    def _decode(self, log_probs, beam_width, alpha=0., beta=0., lm=None,
+                nbest=1):
+        """Prefix search of a single utterance.
+        Args:
+            log_probs (np.ndarray): A tensor of size `[T, num_classes]`
+            beam_width (int): the size of beam
+            alpha (float): language model weight
+            beta (float): insertion bonus
+            lm (optional): the language model for shallow fusion
+            nbest (int): the number of hypotheses to return
+        Returns:
+            hyps (list): N-best hypotheses. Each element is np.ndarray.
+            scores (np.ndarray): A tensor of size `[N]`
+        """
+        # Trie of prefixes
+        # NOTE: node 0 is the empty sequence
+        trie_parents = [-1]
+        trie_labels = [-1]
+        trie_children = {}
+
+        # Hypotheses in the beam
+        node = np.zeros((1,), dtype=np.int64)
+        parent = np.full((1,), -1, dtype=np.int64)
+        last = np.full((1,), -1, dtype=np.int64)
+        # NOTE: -1 means the empty sequence
+        p_b = np.array([LOG_1], dtype=np.float64)
+        p_nb = np.array([LOG_0], dtype=np.float64)
+        length = np.zeros((1,), dtype=np.int64)
+        lm_score = np.zeros((1,), dtype=np.float64)
+        lm_state = lm.initial_state(1) if lm is not None else None
+        # NOTE: each hypothesis keeps the LM state after its prefix, so that
+        # extensions are scored only with the last label
+
+        for t, cands in enumerate(self._prune(log_probs)):
+            lp = log_probs[t]
+            p = np.logaddexp(p_b, p_nb)
+
+            # The prefix doesn't change if we propose a blank or repeat the
+            # last label (the merging case)
+            new_p_b = p + lp[self._blank]
+            new_p_nb = np.where(last >= 0, p_nb + lp[np.maximum(last, 0)],
+                                LOG_0)
+
+            # Extensions which result in a prefix already in the beam
+            src, dst = np.nonzero(node[:, None] == parent[None, :])
+            if len(src) > 0:
+                c = last[dst]
+                # NOTE: we don't include the probability of not ending in
+                # blank (p_nb) if c is repeated at the end
+                new_p_nb[dst] = np.logaddexp(
+                    new_p_nb[dst],
+                    np.where(c == last[src], p_b[src], p[src]) + lp[c])
+
+            # Scores to rank hypotheses
+            fused = alpha * lm_score + beta * length
+
+            if len(cands) == 0:
+                # Only re-sort the beam
+                order = np.argsort(-(np.logaddexp(new_p_b, new_p_nb) + fused),
+                                   kind='mergesort')
+                node, parent, last = node[order], parent[order], last[order]
+                p_b, p_nb = new_p_b[order], new_p_nb[order]
+                length, lm_score = length[order], lm_score[order]
+                if lm is not None:
+                    lm_state = lm.select_state(lm_state, order)
+                continue
+
+            # Extend the prefix by candidate classes
+            # NOTE: `[num_cands, beam]` so that the order of extensions is
+            # class-major
+            ext_p_nb = np.where(cands[:, None] == last[None, :],
+                                p_b[None, :], p[None, :]) + lp[cands][:, None]
+            ext_p_nb = ext_p_nb.reshape(-1)
+            ext_src = np.tile(np.arange(len(node)), len(cands))
+            ext_labels = np.repeat(cands, len(node))
+            if len(src) > 0:
+                is_new = np.ones(len(ext_p_nb), dtype=bool)
+                col = np.full((log_probs.shape[1],), -1, dtype=np.int64)
+                col[cands] = np.arange(len(cands))
+                j = col[last[dst]]
+                is_new[j[j >= 0] * len(node) + src[j >= 0]] = False
+                ext_p_nb = ext_p_nb[is_new]
+                ext_src = ext_src[is_new]
+                ext_labels = ext_labels[is_new]
+
+            # Score extensions by the language model
+            ext_lm_score = lm_score[ext_src]
+            if lm is not None:
+                ext_lm, ext_lm_state = lm.score(
+                    lm.select_state(lm_state, ext_src),
+                    ext_labels - (ext_labels > self._blank))
+                ext_lm_score = ext_lm_score + ext_lm
+
+            # Sort and trim the beam before moving on to the next time-step
+            scores = np.concatenate(
+                [np.logaddexp(new_p_b, new_p_nb) + fused,
+                 ext_p_nb + alpha * ext_lm_score +
+                 beta * (length[ext_src] + 1)])
+            if len(scores) > beam_width:
+                top = np.sort(np.argpartition(-scores, beam_width - 1)[
+                    :beam_width])
+            else:
+                top = np.arange(len(scores))
+            top = top[np.argsort(-scores[top], kind='mergesort')]
+
+            is_ext = top >= len(node)
+            keep_idx = top[~is_ext]
+            ext_idx = top[is_ext] - len(node)
+
+            # Add new prefixes to the trie
+            ext_nodes = np.empty((len(ext_idx),), dtype=np.int64)
+            for i, (n, c) in enumerate(zip(node[ext_src[ext_idx]],
+                                           ext_labels[ext_idx])):
+                key = (int(n), int(c))
+                if key not in trie_children:
+                    trie_children[key] = len(trie_parents)
+                    trie_parents.append(key[0])
+                    trie_labels.append(key[1])
+                ext_nodes[i] = trie_children[key]
+
+            new_node = np.empty((len(top),), dtype=np.int64)
+            new_node[~is_ext] = node[keep_idx]
+            new_node[is_ext] = ext_nodes
+            new_parent = np.empty((len(top),), dtype=np.int64)
+            new_parent[~is_ext] = parent[keep_idx]
+            new_parent[is_ext] = node[ext_src[ext_idx]]
+            new_last = np.empty((len(top),), dtype=np.int64)
+            new_last[~is_ext] = last[keep_idx]
+            new_last[is_ext] = ext_labels[ext_idx]
+            p_b = np.full((len(top),), LOG_0, dtype=np.float64)
+            p_b[~is_ext] = new_p_b[keep_idx]
+            p_nb = np.empty((len(top),), dtype=np.float64)
+            p_nb[~is_ext] = new_p_nb[keep_idx]
+            p_nb[is_ext] = ext_p_nb[ext_idx]
+            node, parent, last = new_node, new_parent, new_last
+            length = np.concatenate([length, length[ext_src] + 1])[top]
+            lm_score = np.concatenate([lm_score, ext_lm_score])[top]
+            if lm is not None:
+                lm_state = np.concatenate([lm_state, ext_lm_state])[top]
+
+        # Backtrack the N-best prefixes
+        if lm is not None:
+            lm_score = lm_score + lm.final_score(lm_state)
+        scores = np.logaddexp(p_b, p_nb) + alpha * lm_score + beta * length
+        order = np.argsort(-scores, kind='mergesort')[:nbest]
+        hyps = []
+        for n in node[order]:
+            hyp = []
+            while n > 0:
+                hyp.append(trie_labels[n])
+                n = trie_parents[n]
+            hyps.append(np.array(hyp[::-1], dtype=np.int64))
+        return hyps, scores[order]
@@ -0,0 +1,124 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""CTC prefix scorer for joint CTC/attention decoding (numpy implementation)."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+
+LOG_0 = -float("inf")
+
+
+class CTCPrefixScorer(object):
+    """Compute CTC prefix scores of all candidates of all hypotheses at once.
+        The prefix score is the log probability of all CTC paths whose label
+        sequence starts with the prefix. Frames after the end of each
+        utterance are filled with blanks of the probability 1, so that
+        forward variables at the last frame are the total probability.
+    Args:
+        log_probs (np.ndarray): CTC posteriors in log-scale.
+            A tensor of size `[B, T, num_classes]`
+        x_lens (np.ndarray): A tensor of size `[B]`
+        blank_index (int): the index of the blank class
+    """
+
+    def __init__(self, log_probs, x_lens, blank_index):
+        self._blank = blank_index
+        self._eos = log_probs.shape[-1]
+
+        log_probs = log_probs.astype(np.float32)
+        is_pad = np.arange(log_probs.shape[1])[None, :] >= x_lens[:, None]
+        log_probs[is_pad] = LOG_0
+        log_probs[:, :, blank_index][is_pad] = 0
+        self._x = log_probs.transpose(1, 0, 2)
+        # NOTE: `[T, B, num_classes]`
+
+    @property
+    def eos(self):
+        """The index of <EOS> in candidates, which is next to the last
+            CTC class."""
+        return self._eos
+
+    def initial_state(self, utt_idx):
+        """
+        Args:
+            utt_idx (np.ndarray): the utterance of each hypothesis.
+                A tensor of size `[N]`
+        Returns:
+            state (tuple):
+                r (np.ndarray): forward variables of paths ending with
+                    non-blank and blank. A tensor of size `[T, 2, N]`
+                psi (np.ndarray): prefix scores. A tensor of size `[N]`
+                last (np.ndarray): the last labels. A tensor of size `[N]`
+        """
+        r = np.full((self._x.shape[0], 2, len(utt_idx)), LOG_0,
+                    dtype=np.float32)
+        r[:, 1] = np.cumsum(self._x[:, utt_idx, self._blank], axis=0)
+        return (r, np.zeros((len(utt_idx),), dtype=np.float32),
+                np.full((len(utt_idx),), -1, dtype=np.int64))
+
+    def score(self, state, utt_idx, labels, length):
+        """Compute prefix scores of hypotheses extended by candidates.
+        Args:
+            state (tuple): states of hypotheses
+            utt_idx (np.ndarray): the utterance of each hypothesis.
+                A tensor of size `[N]`
+            labels (np.ndarray): CTC classes of candidates (or <EOS>).
+                A tensor of size `[N, K]`
+            length (int): the length of prefixes of hypotheses
+        Returns:
+            scores (np.ndarray): the difference of prefix scores from
+                hypotheses. A tensor of size `[N, K]`
+            new_state (tuple): states of candidates, which is passed to
+                select_state
+        """
+        r_prev, psi_prev, last = state
+        max_time = r_prev.shape[0]
+        num_hyps, num_cands = labels.shape
+        is_eos = labels == self._eos
+
+        # `[T, N, K]`
+        x_c = self._x[:, utt_idx[:, None], np.where(is_eos, self._blank, labels)]
+
+        r_sum = np.logaddexp(r_prev[:, 0], r_prev[:, 1])
+        log_phi = np.repeat(r_sum[:, :, None], num_cands, axis=2)
+        is_repeat = labels == last[:, None]
+        log_phi[:, is_repeat] = r_prev[:, 1][:, np.nonzero(is_repeat)[0]]
+        # NOTE: the same label as the last one must be separated by blanks
+
+        r = np.full((max_time, 2, num_hyps, num_cands), LOG_0,
+                    dtype=np.float32)
+        if length == 0:
+            r[0, 0] = x_c[0]
+        start = max(length, 1)
+        # NOTE: forward variables are -inf before the length of prefixes
+
+        x_blank = self._x[:, utt_idx, self._blank][:, :, None]
+        for t in range(start, max_time):
+            r[t, 0] = np.logaddexp(r[t - 1, 0], log_phi[t - 1]) + x_c[t]
+            r[t, 1] = np.logaddexp(r[t - 1, 0], r[t - 1, 1]) + x_blank[t]
+
+        psi = r[start - 1, 0]
+        if start < max_time:
+            psi = np.logaddexp(psi, np.logaddexp.reduce(
+                log_phi[start - 1:-1] + x_c[start:], axis=0))
+
+        # <EOS> is the probability of the whole label sequence
+        psi = np.where(is_eos, r_sum[-1][:, None], psi)
+
+        return psi - psi_prev[:, None], (r, psi, labels)
+
+    def select_state(self, new_state, rows, cols):
+        """Select states of candidates.
+        Args:
+            new_state (tuple): the output of score
+            rows (np.ndarray): the index of hypotheses. A tensor of size `[M]`
+            cols (np.ndarray): the index of candidates. A tensor of size `[M]`
+        Returns:
+            state (tuple): states of hypotheses
+        """
+        r, psi, labels = new_state
+        return r[:, :, rows, cols], psi[rows, cols], labels[rows, cols]
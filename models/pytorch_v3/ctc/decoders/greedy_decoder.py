@@ -8,7 +8,6 @@ from __future__ import division
 from __future__ import print_function
 
 import numpy as np
-from itertools import groupby
 
 
 class GreedyDecoder(object):
@@ -16,32 +15,40 @@ class GreedyDecoder(object):
     def __init__(self, blank_index):
         self._blank = blank_index
 
-    def __call__(self, logits, x_lens):
+    def __call__(self, logits, x_lens, padding_value=-1):
         """
         Args:
-            logits (np.ndarray): A tensor of size `[B, T, num_classes]`
+            logits (np.ndarray): A tensor of size `[B, T, num_classes]`,
+                or the best path (argmax classes) of size `[B, T]`
             x_lens (np.ndarray): A tensor of size `[B]`
+            padding_value (int): the value to pad best_hyps with
         Returns:
             best_hyps (np.ndarray): Best path hypothesis.
                 A tensor of size `[B, labels_max_seq_len]`
+            y_lens (np.ndarray): Lengths of best path hypothesis.
+                A tensor of size `[B]`
         """
-        batch_size = logits.shape[0]
-        best_hyps = []
-
         # Pickup argmax class
-        for b in range(batch_size):
-            indices = []
-            time = x_lens[b]
-            for t in range(time):
-                argmax = np.argmax(logits[b, t], axis=0)
-                indices.append(argmax)
-
-            # Step 1. Collapse repeated labels
-            collapsed_indices = [x[0] for x in groupby(indices)]
-
-            # Step 2. Remove all blank labels
-            best_hyp = [x for x in filter(
-                lambda x: x != self._blank, collapsed_indices)]
-            best_hyps.append(np.array(best_hyp))
-
-        return np.array(best_hyps)
+        if logits.ndim == 3:
+            best_paths = np.argmax(logits, axis=-1)
+        else:
+            best_paths = logits
+        batch_size, max_time = best_paths.shape
+
+        # Step 1. Collapse repeated labels
+        is_new = np.ones((batch_size, max_time), dtype=bool)
+        is_new[:, 1:] = best_paths[:, 1:] != best_paths[:, :-1]
+
+        # Step 2. Remove all blank labels (and padded frames)
+        is_new &= best_paths != self._blank
+        is_new &= np.arange(max_time)[None, :] < np.asarray(x_lens)[:, None]
+
+        y_lens = np.sum(is_new, axis=1).astype(np.int32)
+        max_len = int(y_lens.max()) if batch_size > 0 else 0
+        best_hyps = np.full((batch_size, max_len), padding_value,
+                            dtype=np.int64)
+        batch_idx, _ = np.nonzero(is_new)
+        best_hyps[batch_idx, np.cumsum(is_new, axis=1)[is_new] - 1] = \
+            best_paths[is_new]
+
+        return best_hyps, y_lens
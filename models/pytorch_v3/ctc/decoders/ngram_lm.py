@@ -0,0 +1,289 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""N-gram language model for shallow fusion (numpy implementation)."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import re
+import gzip
+import codecs
+import hashlib
+import numpy as np
+
+from utils.io.labels.vocabulary import Vocabulary
+
+LOG_10 = np.log(10)
+LOG10_0 = -99.
+# NOTE: the log10 probability of unseen words in the ARPA format
+
+
+class NgramLM(object):
+    """N-gram language model loaded from the ARPA file.
+        N-grams are stored in a trie of sorted integer arrays. Node 0 is the
+        empty history and the other nodes are sorted by (parent, word), so
+        that a child is found by a binary search over `parent * W + word`,
+        where W is the number of words including `<s>` and `</s>`.
+        Words are mapped to the indices of the vocabulary file of the model,
+        and words which are not in the vocabulary are dropped.
+    Args:
+        arpa_path (string): path to the ARPA file (can be gzipped)
+        vocab_file_path (string): path to the vocabulary file of the model
+        unk_symbol (string, optional): the word in the vocabulary which
+            corresponds to `<unk>` in the ARPA file
+        cache_path (string, optional): path to the binary cache (.npz) of
+            the trie. By default, `arpa_path + '.npz'`. The cache is rebuilt
+            when the ARPA file or the vocabulary is changed.
+    """
+
+    def __init__(self, arpa_path, vocab_file_path, unk_symbol='OOV',
+                 cache_path=None):
+        # Load the vocabulary file
+        vocab = Vocabulary.load(vocab_file_path)
+        vocab = vocab.tokens[:vocab.eos].tolist()
+        # NOTE: <EOS> of the model is replaced with </s>
+        self.vocab_size = len(vocab)
+        self.bos = self.vocab_size
+        self.eos = self.vocab_size + 1
+        self._num_words = self.vocab_size + 2
+
+        vocab_hash = hashlib.md5(
+            u'\n'.join(vocab + [unk_symbol]).encode('utf-8')).hexdigest()
+        if cache_path is None:
+            cache_path = arpa_path + '.npz'
+
+        # Load the binary cache if it is not stale
+        if os.path.isfile(cache_path) and \
+                os.path.getmtime(cache_path) >= os.path.getmtime(arpa_path):
+            with np.load(cache_path) as cache:
+                is_valid = str(cache['vocab_hash']) == vocab_hash
+                if is_valid:
+                    for k in ['keys', 'prob', 'bow', 'suffix', 'next_state']:
+                        setattr(self, '_' + k, cache[k])
+                    self._order = int(cache['order'])
+                    self._unk_prob = float(cache['unk_prob'])
+            if is_valid:
+                return
+
+        word2idx = dict((w, i) for i, w in enumerate(vocab))
+        word2idx['<s>'] = self.bos
+        word2idx['</s>'] = self.eos
+        if unk_symbol in word2idx:
+            word2idx['<unk>'] = word2idx[unk_symbol]
+        self._build(self._read_arpa(arpa_path, word2idx))
+
+        np.savez(cache_path, vocab_hash=np.array(vocab_hash),
+                 order=np.array(self._order), keys=self._keys,
+                 prob=self._prob, bow=self._bow, suffix=self._suffix,
+                 next_state=self._next_state,
+                 unk_prob=np.array(self._unk_prob))
+
+    @property
+    def order(self):
+        return self._order
+
+    def _read_arpa(self, arpa_path, word2idx):
+        """Read the ARPA file.
+        Args:
+            arpa_path (string): path to the ARPA file
+            word2idx (dict): mapping from words to indices
+        Returns:
+            ngrams (list): Each element is a tuple of
+                `(words [N_n, n], log10 probs [N_n], log10 back-off weights
+                [N_n])` of the n-th order.
+        """
+        if arpa_path.endswith('.gz'):
+            f = codecs.getreader('utf-8')(gzip.open(arpa_path, 'rb'))
+        else:
+            f = codecs.open(arpa_path, 'r', 'utf-8')
+
+        ngrams = []
+        self._unk_prob = LOG10_0
+        n = 0
+        with f:
+            for line in f:
+                line = line.strip()
+                if len(line) == 0 or line == '\\data\\' or \
+                        line.startswith('ngram '):
+                    continue
+                if line == '\\end\\':
+                    break
+                m = re.match(r'\\(\d+)-grams:', line)
+                if m is not None:
+                    n = int(m.group(1))
+                    ngrams.append(([], [], []))
+                    continue
+
+                fields = line.split()
+                if n == 1 and fields[1] == '<unk>':
+                    self._unk_prob = float(fields[0])
+                words = [word2idx.get(w, -1) for w in fields[1:n + 1]]
+                if min(words) < 0:
+                    continue
+                ngrams[-1][0].append(words)
+                ngrams[-1][1].append(float(fields[0]))
+                ngrams[-1][2].append(
+                    float(fields[n + 1]) if len(fields) > n + 1 else 0.)
+
+        return [(np.array(words, dtype=np.int64).reshape(-1, n + 1),
+                 np.array(probs, dtype=np.float64),
+                 np.array(bows, dtype=np.float64))
+                for n, (words, probs, bows) in enumerate(ngrams)]
+
+    def _build(self, ngrams):
+        """Build the trie.
+        Args:
+            ngrams (list): the output of `_read_arpa`
+        """
+        self._order = len(ngrams)
+        self._keys = np.zeros((0,), dtype=np.int64)
+        keys, probs, bows, suffixes = [], [], [], []
+
+        for n, (words, prob, bow) in enumerate(ngrams):
+            # Find the history of each n-gram
+            parents = np.zeros((len(words),), dtype=np.int64)
+            for i in range(n):
+                parents = self._find(parents, words[:, i])
+            is_valid = parents > 0 if n > 0 else parents == 0
+            # NOTE: n-grams whose history was dropped are also dropped
+
+            key = parents[is_valid] * self._num_words + words[is_valid, n]
+            key, idx = np.unique(key, return_index=True)
+            self._keys = np.concatenate([self._keys, key])
+            # NOTE: the parents of n-grams have larger node indices than
+            # those of (n-1)-grams, so the keys are still sorted
+
+            # Suffix links (the longest proper suffix in the trie)
+            if n == 0:
+                suffix = np.zeros((len(key),), dtype=np.int64)
+            else:
+                suffix_prev = np.concatenate([[0]] + suffixes).astype(np.int64)
+                suffix = self._find_longest(
+                    suffix_prev[key // self._num_words],
+                    key % self._num_words, suffix_prev)
+            keys.append(key)
+            probs.append(prob[is_valid][idx] * LOG_10)
+            bows.append(bow[is_valid][idx] * LOG_10)
+            suffixes.append(suffix)
+
+        self._prob = np.concatenate([[0.]] + probs)
+        self._bow = np.concatenate([[0.]] + bows)
+        self._suffix = np.concatenate([[0]] + suffixes).astype(np.int64)
+        self._unk_prob *= LOG_10
+
+        # The highest order n-grams have no children, so the history is
+        # shortened after them
+        num_nodes = len(self._prob)
+        self._next_state = np.arange(num_nodes, dtype=np.int64)
+        num_top = len(keys[-1])
+        self._next_state[num_nodes - num_top:] = \
+            self._suffix[num_nodes - num_top:]
+
+    def _find(self, parents, words):
+        """Find children in the trie.
+        Args:
+            parents (np.ndarray): A tensor of size `[N]`
+            words (np.ndarray): A tensor of size `[N]`
+        Returns:
+            nodes (np.ndarray): A tensor of size `[N]`.
+                0 means that the child is not found.
+        """
+        key = parents * self._num_words + words
+        if len(self._keys) == 0:
+            return np.zeros_like(key)
+        idx_clip = np.minimum(np.searchsorted(self._keys, key),
+                              len(self._keys) - 1)
+        return np.where(self._keys[idx_clip] == key, idx_clip + 1, 0)
+
+    def _find_longest(self, histories, words, suffix):
+        """Find the longest n-grams ending with words by following suffix
+            links of histories.
+        Args:
+            histories (np.ndarray): A tensor of size `[N]`
+            words (np.ndarray): A tensor of size `[N]`
+            suffix (np.ndarray): suffix links of nodes of histories
+        Returns:
+            nodes (np.ndarray): A tensor of size `[N]`
+        """
+        nodes = np.zeros((len(words),), dtype=np.int64)
+        active = np.arange(len(words))
+        histories = histories.copy()
+        while len(active) > 0:
+            found = self._find(histories[active], words[active])
+            nodes[active] = found
+            active = active[(found == 0) & (histories[active] > 0)]
+            histories[active] = suffix[histories[active]]
+        return nodes
+
+    def initial_state(self, batch_size):
+        """
+        Args:
+            batch_size (int): the number of states
+        Returns:
+            states (np.ndarray): the states after `<s>`.
+                A tensor of size `[batch_size]`
+        """
+        return np.full((batch_size,), self._find(
+            np.zeros((1,), dtype=np.int64),
+            np.array([self.bos], dtype=np.int64))[0], dtype=np.int64)
+
+    def select_state(self, states, indices):
+        """
+        Args:
+            states (np.ndarray): A tensor of size `[N]`
+            indices (np.ndarray): A tensor of size `[M]`
+        Returns:
+            states (np.ndarray): A tensor of size `[M]`
+        """
+        return states[indices]
+
+    def score(self, states, words):
+        """Compute log-scale probabilities of the next words.
+        Args:
+            states (np.ndarray): A tensor of size `[N]`
+            words (np.ndarray): indices in the vocabulary.
+                A tensor of size `[N]`
+        Returns:
+            scores (np.ndarray): natural log probabilities.
+                A tensor of size `[N]`
+            new_states (np.ndarray): A tensor of size `[N]`
+        """
+        states = np.asarray(states, dtype=np.int64)
+        words = np.asarray(words, dtype=np.int64)
+        scores = np.zeros((len(words),), dtype=np.float64)
+        new_states = np.zeros((len(words),), dtype=np.int64)
+
+        # Back off until the n-gram is found
+        histories = states.copy()
+        active = np.arange(len(words))
+        while len(active) > 0:
+            found = self._find(histories[active], words[active])
+            is_found = found > 0
+            idx = active[is_found]
+            scores[idx] += self._prob[found[is_found]]
+            new_states[idx] = self._next_state[found[is_found]]
+
+            active = active[~is_found]
+            is_root = histories[active] == 0
+            scores[active[is_root]] += self._unk_prob
+            # NOTE: new_states of unknown words remain the empty history
+
+            active = active[~is_root]
+            scores[active] += self._bow[histories[active]]
+            histories[active] = self._suffix[histories[active]]
+
+        return scores, new_states
+
+    def final_score(self, states):
+        """
+        Args:
+            states (np.ndarray): A tensor of size `[N]`
+        Returns:
+            scores (np.ndarray): log-scale probabilities of `</s>`.
+                A tensor of size `[N]`
+        """
+        return self.score(states, np.full((len(states),), self.eos,
+                                          dtype=np.int64))[0]
@@ -0,0 +1,106 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""LRU cache of encoder outputs of each utterance."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+from collections import OrderedDict
+
+
+class EncoderCache(object):
+    """Cache encoder outputs of each utterance in the memory.
+        The least recently used entries are evicted when the total size
+        exceeds max_bytes. If spill_path is given, evicted entries are
+        appended to the file and read back by memory mapping instead of
+        being discarded.
+    Args:
+        max_bytes (int): the maximum size of arrays kept in the memory
+        spill_path (string, optional): path to the file to spill arrays
+    """
+
+    def __init__(self, max_bytes=1 << 30, spill_path=None):
+        self.max_bytes = max_bytes
+        self.spill_path = spill_path
+
+        self._entries = OrderedDict()
+        self._num_bytes = 0
+        self._spilled = {}
+        self._spill_offset = 0
+        if spill_path is not None:
+            open(spill_path, 'wb').close()
+
+    def __len__(self):
+        return len(self._entries) + len(self._spilled)
+
+    def __contains__(self, key):
+        return key in self._entries or key in self._spilled
+
+    @property
+    def num_bytes(self):
+        """The size of arrays kept in the memory."""
+        return self._num_bytes
+
+    def get(self, key):
+        """
+        Args:
+            key (tuple): the utterance id and the model version etc.
+        Returns:
+            arrays (tuple): A tuple of np.ndarray, or None if not cached
+        """
+        if key in self._entries:
+            arrays = self._entries.pop(key)
+            self._entries[key] = arrays
+            # NOTE: move to the end as the most recently used
+            return arrays
+
+        if key in self._spilled:
+            return tuple(np.memmap(self.spill_path, dtype=dtype, mode='r',
+                                   offset=offset, shape=shape)
+                         for offset, shape, dtype in self._spilled[key])
+
+        return None
+
+    def put(self, key, arrays):
+        """
+        Args:
+            key (tuple): the utterance id and the model version etc.
+            arrays (tuple): A tuple of np.ndarray
+        """
+        if key in self._entries:
+            self._num_bytes -= sum(a.nbytes for a in self._entries.pop(key))
+        self._spilled.pop(key, None)
+
+        arrays = tuple(np.ascontiguousarray(a) for a in arrays)
+        self._entries[key] = arrays
+        self._num_bytes += sum(a.nbytes for a in arrays)
+
+        while self._num_bytes > self.max_bytes and len(self._entries) > 0:
+            self._evict()
+
+    def clear(self):
+        self._entries.clear()
+        self._num_bytes = 0
+        self._spilled.clear()
+        self._spill_offset = 0
+        if self.spill_path is not None:
+            open(self.spill_path, 'wb').close()
+
+    def _evict(self):
+        """Evict the least recently used entry."""
+        key, arrays = self._entries.popitem(last=False)
+        self._num_bytes -= sum(a.nbytes for a in arrays)
+
+        if self.spill_path is None:
+            return
+
+        spilled = []
+        with open(self.spill_path, 'ab') as f:
+            for a in arrays:
+                f.write(a.tobytes())
+                spilled.append((self._spill_offset, a.shape, a.dtype))
+                self._spill_offset += a.nbytes
+        self._spilled[key] = spilled
@@ -14,6 +14,7 @@ import torch.nn as nn
 from torch.autograd import Variable
 import torch.nn.functional as F
 from torch.nn.utils.rnn import pack_padded_sequence, pad_packed_sequence
+from torch.nn.utils.rnn import PackedSequence
 
 from models.pytorch_v3.linear import LinearND
 from models.pytorch_v3.encoders.cnn import CNNEncoder
@@ -323,7 +324,8 @@ class RNNEncoder(nn.Module):
             # NOTE: must be descending order for pack_padded_sequence
         else:
             perm_idx = None
-        x_lens = x_lens.data.cpu().numpy().tolist()
+        x_lens_list = x_lens.data.cpu().tolist()
+        # NOTE: lengths are transferred to the host only once for packing
 
         if not self.batch_first:
             # Convert to the time-major
@@ -343,7 +345,7 @@ class RNNEncoder(nn.Module):
             if self.pack_sequence:
                 if not isinstance(xs, torch.nn.utils.rnn.PackedSequence):
                     xs = pack_padded_sequence(
-                        xs, x_lens, batch_first=self.batch_first)
+                        xs, x_lens_list, batch_first=self.batch_first)
 
             # Path through RNN
             xs, _ = getattr(self, self.rnn_type)(xs, hx=h_0)
@@ -370,24 +372,29 @@ class RNNEncoder(nn.Module):
             res_outputs_list = []
             for l in range(self.num_layers):
 
-                if use_cuda:
-                    torch.cuda.empty_cache()
-
                 # Pack l-th encoder xs
                 if self.pack_sequence:
                     if not isinstance(xs, torch.nn.utils.rnn.PackedSequence):
                         xs = pack_padded_sequence(
-                            xs, x_lens, batch_first=self.batch_first)
+                            xs, x_lens_list, batch_first=self.batch_first)
 
                 # Path through RNN
                 xs, _ = getattr(self, self.rnn_type + '_l' +
                                 str(l))(xs, hx=h_0)
 
+                # Keep outputs packed if the next layer can consume them as is
+                if self.pack_sequence and not self._need_padded_outputs(l):
+                    # Dropout for hidden-hidden connection
+                    xs = PackedSequence(
+                        getattr(self, 'dropout_l' + str(l))(xs.data),
+                        xs.batch_sizes)
+                    continue
+
                 # Unpack l-th encoder outputs
                 if self.pack_sequence:
                     xs, unpacked_seq_len = pad_packed_sequence(
                         xs, batch_first=self.batch_first, padding_value=0)
-                    # assert x_lens == unpacked_seq_len
+                    # assert x_lens_list == unpacked_seq_len
 
                 # Dropout for hidden-hidden or hidden-output connection
                 xs = getattr(self, 'dropout_l' + str(l))(xs)
@@ -395,12 +402,7 @@ class RNNEncoder(nn.Module):
                 # Pick up outputs in the sub task before the projection layer
                 if self.num_layers_sub >= 1 and l == self.num_layers_sub - 1:
                     xs_sub = xs
-
-                    # Wrap by Variable again
-                    x_lens_sub = Variable(
-                        torch.from_numpy(np.array(x_lens)).int(), requires_grad=False)
-                    if use_cuda:
-                        x_lens_sub = x_lens_sub.cuda()
+                    x_lens_sub = x_lens
 
                 # NOTE: Exclude the last layer
                 if l != self.num_layers - 1:
@@ -412,31 +414,15 @@ class RNNEncoder(nn.Module):
 
                         # Subsampling
                         if self.subsample_list[l]:
-                            if self.subsample_type == 'drop':
-                                if self.batch_first:
-                                    xs = xs[:, 1::2, :]
-                                else:
-                                    xs = xs[1::2, :, :]
-                                # NOTE: Pick up features at EVEN time step
-
-                            # Concatenate the successive frames
-                            elif self.subsample_type == 'concat':
-                                if self.batch_first:
-                                    xs = [torch.cat([xs[:, t - 1:t, :], xs[:, t:t + 1, :]], dim=2)
-                                          for t in range(xs.size(1)) if (t + 1) % 2 == 0]
-                                    xs = torch.cat(xs, dim=1)
-                                else:
-                                    xs = [torch.cat([xs[t - 1:t, :, :], xs[t:t + 1, :, :]], dim=2)
-                                          for t in range(xs.size(0)) if (t + 1) % 2 == 0]
-                                    xs = torch.cat(xs, dim=0)
-                                # NOTE: Exclude the last frame if the length of xs is odd
+                            xs = self._subsample(xs)
 
                             # Update x_lens
-                            if self.batch_first:
-                                x_lens = np.array([x.size(0) for x in xs])
-                            else:
-                                x_lens = np.array([xs[:, i].size(0)
-                                                   for i in range(xs.size(1))])
+                            x_lens_list = [max(x_len // 2, 1)
+                                           for x_len in x_lens_list]
+                            x_lens = (x_lens.float() / 2).floor().clamp(
+                                min=1).int()
+                            # NOTE: both drop and concat keep floor(T / 2) frames
+                            # NOTE: keep at least 1 frame for packing
 
                         # NiN
                         if self.nin > 0:
@@ -464,12 +450,6 @@ class RNNEncoder(nn.Module):
                                     res_outputs_list.append(xs)
                         # NOTE: Exclude residual connection from the raw inputs
 
-        # Wrap by Variable again
-        x_lens = Variable(torch.from_numpy(
-            np.array(x_lens)).int(), requires_grad=False)
-        if use_cuda:
-            x_lens = x_lens.cuda()
-
         # Sum bidirectional outputs
         if self.bidirectional and self.merge_bidirectional:
             xs = xs[:, :, :self.num_units] + xs[:, :, self.num_units:]
@@ -486,6 +466,59 @@ class RNNEncoder(nn.Module):
         else:
             return xs, x_lens, perm_idx
 
+    def _need_padded_outputs(self, l):
+        """Check whether outputs of the l-th layer must be unpacked.
+        Args:
+            l (int): the index of a layer
+        Returns:
+            (bool): if False, outputs can be fed to the next layer
+                as a PackedSequence
+        """
+        if l == self.num_layers - 1:
+            return True
+        if self.num_layers_sub >= 1 and l == self.num_layers_sub - 1:
+            return True
+        if self.residual or self.dense_residual or self.num_proj > 0 or self.subsample_list[l]:
+            return True
+        return False
+
+    def _subsample(self, xs):
+        """Subsample encoder outputs in the time dimension.
+        Args:
+            xs (torch.autograd.Variable, float):
+                if batch_first is True, a tensor of size `[B, T, dim]`
+                else `[T, B, dim]`
+        Returns:
+            xs (torch.autograd.Variable, float):
+                if batch_first is True, a tensor of size `[B, T // 2, dim']`
+                else `[T // 2, B, dim']`, where dim' is dim for drop
+                and 2 * dim for concat
+        """
+        if self.subsample_type == 'drop':
+            if self.batch_first:
+                xs = xs[:, 1::2, :]
+            else:
+                xs = xs[1::2, :, :]
+            # NOTE: Pick up features at EVEN time step
+
+        # Concatenate the successive frames
+        elif self.subsample_type == 'concat':
+            if self.batch_first:
+                batch_size, max_time, dim = xs.size()
+                max_time = max_time // 2 * 2
+                xs = xs[:, :max_time].contiguous().view(
+                    batch_size, max_time // 2, dim * 2)
+            else:
+                max_time, batch_size, dim = xs.size()
+                max_time = max_time // 2 * 2
+                xs = xs[:max_time].contiguous().view(
+                    max_time // 2, 2, batch_size, dim)
+                xs = xs.transpose(1, 2).contiguous().view(
+                    max_time // 2, batch_size, dim * 2)
+            # NOTE: Exclude the last frame if the length of xs is odd
+
+        return xs
+
 
 def to2d(xs, size):
     return xs.contiguous().view(
@@ -100,20 +100,33 @@ class Embedding_LS(nn.Module):
 
     def forward(self, y):
         """Forward computation.
+            A smoothed one-hot vector multiplied by the weight matrix is
+            equivalent to a row lookup plus a uniform bias, so the one-hot
+            tensor is never built.
         Args:
             y (torch.autograd.Variable, long): A tensor of size
-                `[B, 1]`
+                `[B, T]`
         Returns:
             y (torch.autograd.Variable, float): A tensor of size
-                `[B, 1, embedding_dim]`
+                `[B, T, embedding_dim]`
         """
-        # Convert to one-hot labels
-        y = to_onehot(y, self.num_classes, self.label_smoothing_prob)
-        # y: `[B, 1, num_classes]`
+        batch_size, max_time = y.size()
+        weight = self.embed.fc.weight
+        # NOTE: weight: `[embedding_dim, num_classes]`
 
-        y = self.embed(y)
+        # Row lookup
+        y_emb = weight.index_select(1, y.contiguous().view(-1)).t()
+        # NOTE: y_emb: `[B * T, embedding_dim]`
 
-        return y
+        # Label smoothing
+        if self.label_smoothing_prob > 0:
+            y_emb = y_emb * (1 - self.label_smoothing_prob) + \
+                weight.sum(dim=1).unsqueeze(0) * \
+                (self.label_smoothing_prob / self.num_classes)
+
+        y_emb = self.embed.dropout(y_emb)
+
+        return y_emb.view(batch_size, max_time, -1)
 
 
 def to_onehot(y, num_classes, label_smoothing_prob=0):
@@ -124,23 +137,20 @@ def to_onehot(y, num_classes, label_smoothing_prob=0):
         num_classes (int): the number of classes
         label_smoothing_prob (float, optional):
     Returns:
-        y (torch.autograd.Variable, float): A tensor of size
+        y_onehot (torch.autograd.Variable, float): A tensor of size
             `[B, 1, num_classes]`
     """
     batch_size = y.size(0)
-    y_onehot = torch.FloatTensor(batch_size, num_classes).zero_()
-    y_onehot.scatter_(1, y.data.cpu(), 1)
-    y_onehot = torch.autograd.Variable(y_onehot).unsqueeze(1)
-    if y.is_cuda:
-        y_onehot = y_onehot.cuda()
+    y_onehot = y.data.new(batch_size, num_classes).float().zero_()
+    y_onehot.scatter_(1, y.data, 1)
+    # NOTE: build on the same device as y
 
     # Label smoothing
     if label_smoothing_prob > 0:
-        y = y * (1 - label_smoothing_prob) + 1 / \
-            num_classes * label_smoothing_prob
+        y_onehot = y_onehot * (1 - label_smoothing_prob) + \
+            1 / num_classes * label_smoothing_prob
 
-    # TODO: fix bugs
-    # if y.volatile:
-    #     y_onehot.volatile = True
+    y_onehot = torch.autograd.Variable(
+        y_onehot, volatile=y.volatile).unsqueeze(1)
 
     return y_onehot
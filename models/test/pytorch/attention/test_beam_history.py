@@ -0,0 +1,61 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Test back-pointers of hypotheses in beam search (pytorch)."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+import unittest
+import numpy as np
+
+sys.path.append('../../../../')
+from models.pytorch_v3.attention.beam_history import BeamHistory
+
+
+class TestBeamHistory(unittest.TestCase):
+
+    def test(self):
+        print("Beam history Working check.")
+
+        self.check(beam_width=1)
+        self.check(beam_width=4)
+        self.check(beam_width=4, num_steps=50)
+
+    def check(self, beam_width, num_steps=10, vocab=20):
+
+        print('==================================================')
+        print('  beam_width: %d' % beam_width)
+        print('  num_steps: %d' % num_steps)
+        print('==================================================')
+
+        rs = np.random.RandomState(0)
+
+        # Keep whole hypotheses as the reference
+        hyps = [[]]
+        history = BeamHistory()
+        for t in range(num_steps):
+            parents = rs.randint(0, len(hyps), size=beam_width)
+            tokens = rs.randint(0, vocab, size=beam_width)
+            hyps = [hyps[p] + [tokens[j]] for j, p in enumerate(parents)]
+
+            back_pointers = parents if t > 0 else -np.ones_like(parents)
+            step = history.append(back_pointers=back_pointers, token=tokens,
+                                  pos=[t] * beam_width)
+            self.assertEqual(step, t)
+        self.assertEqual(len(history), num_steps)
+
+        for j in range(beam_width):
+            trace = history.backtrack(num_steps - 1, j)
+            self.assertEqual(list(trace['token']), hyps[j])
+            self.assertEqual(trace['pos'], list(range(num_steps)))
+
+        # Hypotheses which ended in the middle
+        trace = history.backtrack(0, 0)
+        self.assertEqual(len(trace['token']), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
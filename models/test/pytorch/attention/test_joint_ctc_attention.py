@@ -0,0 +1,87 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Test joint CTC/attention decoding with short utterances (pytorch)."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+import unittest
+import numpy as np
+
+import torch
+torch.manual_seed(1623)
+torch.cuda.manual_seed_all(1623)
+
+sys.path.append('../../../../')
+from models.pytorch_v3.attention.attention_seq2seq import AttentionSeq2seq
+
+
+class TestJointCTCAttention(unittest.TestCase):
+
+    def test(self):
+        print("Joint CTC/attention decoding Working check.")
+
+        self.check(beam_width=1, ctc_weight=0.5)
+        self.check(beam_width=3, ctc_weight=0.5)
+        self.check(beam_width=3, ctc_weight=1)
+        self.check(beam_width=3, ctc_weight=0.3, max_decode_len=None)
+
+    def check(self, beam_width, ctc_weight, max_decode_len=20,
+              min_decode_len=10, num_classes=5):
+
+        print('==================================================')
+        print('  beam_width: %d' % beam_width)
+        print('  ctc_weight: %s' % str(ctc_weight))
+        print('  max_decode_len: %s' % str(max_decode_len))
+        print('==================================================')
+
+        model = AttentionSeq2seq(
+            input_size=8,
+            encoder_type='lstm',
+            encoder_bidirectional=True,
+            encoder_num_units=16,
+            encoder_num_proj=0,
+            encoder_num_layers=1,
+            attention_type='location',
+            attention_dim=8,
+            decoder_type='lstm',
+            decoder_num_units=16,
+            decoder_num_layers=1,
+            embedding_dim=8,
+            dropout_input=0,
+            dropout_encoder=0,
+            dropout_decoder=0,
+            dropout_embedding=0,
+            num_classes=num_classes,
+            ctc_loss_weight=0.3,
+            attention_conv_num_channels=2,
+            attention_conv_width=3)
+
+        # Utterances shorter than min_decode_len
+        rs = np.random.RandomState(0)
+        xs = rs.randn(4, 12, 8).astype(np.float32)
+        x_lens = np.array([12, 5, 2, 1])
+
+        best_hyps, _, perm_idx = model.decode(
+            xs, x_lens, beam_width=beam_width, max_decode_len=max_decode_len,
+            min_decode_len=min_decode_len, ctc_weight=ctc_weight)
+        self.assertEqual(len(best_hyps), len(xs))
+
+        nbest_hyps, scores, perm_idx = model.decode_nbest(
+            xs, x_lens, beam_width=beam_width, max_decode_len=max_decode_len,
+            min_decode_len=min_decode_len, ctc_weight=ctc_weight)
+        for b in range(len(xs)):
+            # Every utterance has a hypothesis with a finite score
+            self.assertGreater(len(nbest_hyps[b]), 0)
+            self.assertTrue(np.all(np.isfinite(scores[b])))
+
+            # CTC can not emit more tokens than frames
+            for hyp in nbest_hyps[b]:
+                self.assertLessEqual(len(hyp), x_lens[perm_idx[b]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Test rescoring of N-best hypotheses with the encoder output cache
+   (pytorch)."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+import unittest
+import numpy as np
+
+import torch
+torch.manual_seed(1623)
+torch.cuda.manual_seed_all(1623)
+
+sys.path.append('../../../../')
+from models.pytorch_v3.attention.attention_seq2seq import AttentionSeq2seq
+
+
+class TestScoreNbest(unittest.TestCase):
+
+    def test(self):
+        print("N-best rescoring Working check.")
+
+        self.check(dir='fwd')
+        self.check(dir='bwd')
+
+    def check(self, dir, num_classes=4, beam_width=3, max_decode_len=20):
+
+        print('==================================================')
+        print('  dir: %s' % dir)
+        print('==================================================')
+
+        model = AttentionSeq2seq(
+            input_size=8,
+            encoder_type='lstm',
+            encoder_bidirectional=True,
+            encoder_num_units=16,
+            encoder_num_proj=0,
+            encoder_num_layers=1,
+            attention_type='location',
+            attention_dim=8,
+            decoder_type='lstm',
+            decoder_num_units=16,
+            decoder_num_layers=1,
+            embedding_dim=8,
+            dropout_input=0,
+            dropout_encoder=0,
+            dropout_decoder=0,
+            dropout_embedding=0,
+            num_classes=num_classes,
+            backward_loss_weight=0.5,
+            attention_conv_num_channels=2,
+            attention_conv_width=3)
+
+        rs = np.random.RandomState(0)
+        xs = rs.randn(3, 12, 8).astype(np.float32)
+        x_lens = np.array([9, 12, 5])
+        utt_ids = ['utt%d' % b for b in range(len(xs))]
+
+        nbest_hyps, _, _ = model.decode_nbest(
+            xs, x_lens, beam_width=beam_width, max_decode_len=max_decode_len)
+        scores = model.score_nbest(xs, x_lens, nbest_hyps, dir=dir)
+
+        # Count calls of the encoder
+        num_encoded = [0]
+        encode = model._encode
+
+        def _encode(*args, **kwargs):
+            num_encoded[0] += 1
+            return encode(*args, **kwargs)
+        model._encode = _encode
+
+        model.set_encoder_cache()
+        nbest_hyps_cache, _, _ = model.decode_nbest(
+            xs, x_lens, beam_width=beam_width, max_decode_len=max_decode_len,
+            utt_ids=utt_ids)
+        scores_cache = model.score_nbest(
+            xs, x_lens, nbest_hyps_cache, dir=dir, utt_ids=utt_ids)
+        model.clear_encoder_cache()
+
+        # Each utterance is encoded only once
+        self.assertEqual(num_encoded[0], 1)
+        for b in range(len(xs)):
+            self.assertEqual([list(hyp) for hyp in nbest_hyps[b]],
+                             [list(hyp) for hyp in nbest_hyps_cache[b]])
+            self.assertTrue(np.allclose(scores[b], scores_cache[b],
+                                        atol=1e-5))
+
+
+if __name__ == '__main__':
+    unittest.main()
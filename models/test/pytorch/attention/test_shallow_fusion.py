@@ -0,0 +1,135 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Test shallow fusion with RNNLM in beam search of attention-based models
+   (pytorch)."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+import unittest
+import numpy as np
+
+import torch
+torch.manual_seed(1623)
+torch.cuda.manual_seed_all(1623)
+
+sys.path.append('../../../../')
+from models.pytorch_v3.attention.attention_seq2seq import AttentionSeq2seq
+from models.pytorch.lm.rnnlm import RNNLM, RNNLMScorer
+
+
+class TestShallowFusion(unittest.TestCase):
+
+    def test(self):
+        print("Shallow fusion Working check.")
+
+        self.check(beam_width=1)
+        self.check(beam_width=3)
+        self.check(beam_width=3, length_penalty=0.5)
+
+    def check(self, beam_width, length_penalty=0, num_classes=4,
+              max_decode_len=20):
+
+        print('==================================================')
+        print('  beam_width: %d' % beam_width)
+        print('  length_penalty: %s' % str(length_penalty))
+        print('==================================================')
+
+        model = AttentionSeq2seq(
+            input_size=8,
+            encoder_type='lstm',
+            encoder_bidirectional=True,
+            encoder_num_units=16,
+            encoder_num_proj=0,
+            encoder_num_layers=1,
+            attention_type='location',
+            attention_dim=8,
+            decoder_type='lstm',
+            decoder_num_units=16,
+            decoder_num_layers=1,
+            embedding_dim=8,
+            dropout_input=0,
+            dropout_encoder=0,
+            dropout_decoder=0,
+            dropout_embedding=0,
+            num_classes=num_classes,
+            attention_conv_num_channels=2,
+            attention_conv_width=3)
+        lm = RNNLM(
+            num_classes,
+            embedding_dim=8,
+            rnn_type='lstm',
+            bidirectional=False,
+            num_units=16,
+            num_layers=1,
+            dropout_embedding=0,
+            dropout_hidden=0,
+            dropout_output=0)
+        lm.eval()
+        scorer = RNNLMScorer(lm)
+
+        rs = np.random.RandomState(0)
+        xs = rs.randn(3, 12, 8).astype(np.float32)
+        x_lens = np.array([12, 9, 5])
+
+        # No effect without the LM weight
+        nbest_hyps, scores, perm_idx = model.decode_nbest(
+            xs, x_lens, beam_width=beam_width, max_decode_len=max_decode_len,
+            length_penalty=length_penalty)
+        nbest_hyps_lm, scores_lm, _ = model.decode_nbest(
+            xs, x_lens, beam_width=beam_width, max_decode_len=max_decode_len,
+            length_penalty=length_penalty, lm=scorer, lm_weight=0)
+        for b in range(len(xs)):
+            self.assertEqual([list(hyp) for hyp in nbest_hyps[b]],
+                             [list(hyp) for hyp in nbest_hyps_lm[b]])
+            self.assertTrue(np.allclose(scores[b], scores_lm[b]))
+
+        # Scores are shifted by exactly the LM scores
+        lm_weight = 0.5
+        nbest_hyps, scores, _ = model.decode_nbest(
+            xs, x_lens, beam_width=beam_width, max_decode_len=max_decode_len,
+            length_penalty=length_penalty, lm=scorer, lm_weight=lm_weight)
+        scores_att = model.score_nbest(
+            xs[perm_idx], x_lens[perm_idx], nbest_hyps, dir='fwd')
+        num_checked = 0
+        for b in range(len(xs)):
+            for hyp, score, score_att in zip(nbest_hyps[b], scores[b],
+                                             scores_att[b]):
+                if len(hyp) == max_decode_len:
+                    # NOTE: <EOS> is not scored without the end of the beam
+                    continue
+                state = scorer.initial_state(1)
+                score_lm = 0.
+                for w in hyp:
+                    s, state = scorer.score(state, np.array([w]))
+                    score_lm += s[0]
+                score_lm += scorer.final_score(state)[0]
+                self.assertAlmostEqual(
+                    score, score_att + lm_weight * score_lm +
+                    length_penalty * (len(hyp) + 1), places=4)
+                num_checked += 1
+        self.assertGreater(num_checked, 0)
+
+        # The vocabulary must be shared
+        lm_other = RNNLM(
+            num_classes + 1,
+            embedding_dim=8,
+            rnn_type='lstm',
+            bidirectional=False,
+            num_units=16,
+            num_layers=1,
+            dropout_embedding=0,
+            dropout_hidden=0,
+            dropout_output=0)
+        with self.assertRaises(AssertionError):
+            model.decode_nbest(
+                xs, x_lens, beam_width=beam_width,
+                max_decode_len=max_decode_len, lm=RNNLMScorer(lm_other),
+                lm_weight=lm_weight)
+
+
+if __name__ == '__main__':
+    unittest.main()
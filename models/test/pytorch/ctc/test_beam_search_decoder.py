@@ -0,0 +1,178 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Test CTC beam search decoders (numpy)."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+import time
+import unittest
+import numpy as np
+from collections import defaultdict
+
+sys.path.append('../../../../')
+from models.pytorch_v3.ctc.decoders.beam_search_decoder import BeamSearchDecoder
+from models.pytorch_v3.ctc.decoders.beam_search_decoder2 import BeamSearchDecoder as BeamSearchDecoder2
+
+LOG_0 = -float("inf")
+
+
+def _beam_search_loop(log_probs, x_lens, beam_width, blank_index=0,
+                      nbest=None):
+    """The previous implementation: loop over all classes and all
+        hypotheses at every frame. If nbest is given, return N-best
+        hypotheses and their scores of each utterance.
+    """
+    best_hyps = []
+    for b in range(log_probs.shape[0]):
+        beam = [(tuple(), (0, LOG_0))]
+        for t in range(x_lens[b]):
+            next_beam = defaultdict(lambda: (LOG_0, LOG_0))
+            for c in range(log_probs.shape[-1]):
+                p_t = log_probs[b, t, c]
+                for prefix, (p_b, p_nb) in beam:
+                    if c == blank_index:
+                        new_p_b, new_p_nb = next_beam[prefix]
+                        new_p_b = np.logaddexp(
+                            new_p_b, np.logaddexp(p_b + p_t, p_nb + p_t))
+                        next_beam[prefix] = (new_p_b, new_p_nb)
+                        continue
+                    prefix_end = prefix[-1] if prefix else None
+                    new_prefix = prefix + (c,)
+                    new_p_b, new_p_nb = next_beam[new_prefix]
+                    if c != prefix_end:
+                        new_p_nb = np.logaddexp(
+                            new_p_nb, np.logaddexp(p_b + p_t, p_nb + p_t))
+                    else:
+                        new_p_nb = np.logaddexp(new_p_nb, p_b + p_t)
+                    next_beam[new_prefix] = (new_p_b, new_p_nb)
+                    if c == prefix_end:
+                        new_p_b, new_p_nb = next_beam[prefix]
+                        new_p_nb = np.logaddexp(new_p_nb, p_nb + p_t)
+                        next_beam[prefix] = (new_p_b, new_p_nb)
+            beam = sorted(next_beam.items(),
+                          key=lambda x: np.logaddexp(*x[1]), reverse=True)
+            beam = beam[:beam_width]
+        if nbest is None:
+            best_hyps.append(np.array(list(beam[0][0])))
+        else:
+            best_hyps.append([(list(prefix), np.logaddexp(*p))
+                              for prefix, p in beam[:nbest]])
+    return best_hyps
+
+
+def _generate_log_probs(batch_size, max_time, num_classes, blank_prob, seed):
+    """Generate peaky CTC posteriors like trained models."""
+    rs = np.random.RandomState(seed)
+    logits = rs.randn(batch_size, max_time, num_classes) * 3
+    is_blank = rs.rand(batch_size, max_time) < blank_prob
+    logits[:, :, 0] += is_blank * 10
+    log_probs = logits - np.log(np.sum(np.exp(logits), axis=-1,
+                                       keepdims=True))
+    x_lens = rs.randint(max_time // 2, max_time + 1, size=batch_size)
+    x_lens[0] = max_time
+    return log_probs.astype(np.float32), x_lens
+
+
+class TestBeamSearchDecoder(unittest.TestCase):
+
+    def test(self):
+        print("CTC beam search decoder Working check.")
+
+        # Equivalence to the previous implementation
+        self.check_equal(num_classes=5, beam_width=1)
+        self.check_equal(num_classes=5, beam_width=4)
+        self.check_equal(num_classes=30, beam_width=1)
+        self.check_equal(num_classes=30, beam_width=10)
+        self.check_equal(num_classes=30, beam_width=10, blank_prob=0)
+
+        # N-best outputs
+        self.check_nbest(num_classes=5, beam_width=4, nbest=4)
+        self.check_nbest(num_classes=30, beam_width=10, nbest=3)
+
+        # Speed
+        self.check_speed(num_classes=30, beam_width=10)
+        self.check_speed(num_classes=500, beam_width=10)
+
+    def check_equal(self, num_classes, beam_width, blank_prob=0.7,
+                    batch_size=4, max_time=40):
+
+        print('==================================================')
+        print('  num_classes: %d' % num_classes)
+        print('  beam_width: %d' % beam_width)
+        print('  blank_prob: %.1f' % blank_prob)
+        print('==================================================')
+
+        decoder = BeamSearchDecoder(blank_index=0)
+        for seed in range(5):
+            log_probs, x_lens = _generate_log_probs(
+                batch_size, max_time, num_classes, blank_prob, seed)
+            best_hyps = decoder(log_probs, x_lens, beam_width=beam_width)
+            best_hyps_ref = _beam_search_loop(log_probs, x_lens, beam_width)
+            for b in range(batch_size):
+                self.assertEqual(list(best_hyps[b]), list(best_hyps_ref[b]))
+
+    def check_nbest(self, num_classes, beam_width, nbest, blank_prob=0.7,
+                    batch_size=4, max_time=40):
+
+        print('==================================================')
+        print('  num_classes: %d' % num_classes)
+        print('  beam_width: %d' % beam_width)
+        print('  nbest: %d' % nbest)
+        print('==================================================')
+
+        decoder = BeamSearchDecoder(blank_index=0)
+        for seed in range(5):
+            log_probs, x_lens = _generate_log_probs(
+                batch_size, max_time, num_classes, blank_prob, seed)
+            best_hyps = decoder(log_probs, x_lens, beam_width=beam_width)
+            nbest_hyps, scores = decoder.decode_nbest(
+                log_probs, x_lens, beam_width=beam_width, nbest=nbest)
+            nbest_ref = _beam_search_loop(
+                log_probs.astype(np.float64), x_lens, beam_width,
+                nbest=nbest)
+            for b in range(batch_size):
+                self.assertEqual(list(nbest_hyps[b][0]), list(best_hyps[b]))
+                self.assertEqual(len(nbest_hyps[b]), len(nbest_ref[b]))
+                self.assertTrue(np.all(np.diff(scores[b]) <= 0))
+                for hyp, score, (hyp_ref, score_ref) in zip(
+                        nbest_hyps[b], scores[b], nbest_ref[b]):
+                    self.assertEqual(list(hyp), hyp_ref)
+                    self.assertAlmostEqual(score, score_ref, places=5)
+
+    def check_speed(self, num_classes, beam_width, blank_prob=0.7,
+                    batch_size=4, max_time=50):
+
+        print('==================================================')
+        print('  num_classes: %d' % num_classes)
+        print('  beam_width: %d' % beam_width)
+        print('==================================================')
+
+        log_probs, x_lens = _generate_log_probs(
+            batch_size, max_time, num_classes, blank_prob, seed=0)
+        num_frames = np.sum(x_lens)
+
+        decoders = [
+            ('loop', None),
+            ('loop (no merging)', BeamSearchDecoder2(blank_index=0)),
+            ('vectorized', BeamSearchDecoder(blank_index=0)),
+            ('vectorized (top-10, 0.99)', BeamSearchDecoder(
+                blank_index=0, cutoff_top_n=10, cutoff_prob=0.99)),
+            ('vectorized (top-10, 0.99, blank 0.999)', BeamSearchDecoder(
+                blank_index=0, cutoff_top_n=10, cutoff_prob=0.99,
+                blank_threshold=0.999))]
+        for name, decoder in decoders:
+            start = time.time()
+            if decoder is None:
+                _beam_search_loop(log_probs, x_lens, beam_width)
+            else:
+                decoder(log_probs, x_lens, beam_width=beam_width)
+            print('%s: %.3f msec/frame' %
+                  (name, (time.time() - start) / num_frames * 1000))
+
+
+if __name__ == "__main__":
+    unittest.main()
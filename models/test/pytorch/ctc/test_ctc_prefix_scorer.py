@@ -0,0 +1,118 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Test the CTC prefix scorer (numpy)."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+import unittest
+import numpy as np
+
+sys.path.append('../../../../')
+from models.pytorch_v3.ctc.decoders.ctc_prefix_scorer import CTCPrefixScorer
+
+LOG_0 = -float("inf")
+
+
+def _prefix_score_loop(log_probs, x_len, prefix, c, blank_index=0):
+    """The reference implementation: compute the prefix score of
+        prefix + [c] (or the probability of prefix if c is None) of a
+        single utterance with loops over frames.
+    """
+    # Forward variables of the prefix
+    r_nb = [LOG_0] * x_len
+    r_b = [LOG_0] * x_len
+    if len(prefix) == 0:
+        r_b[0] = log_probs[0, blank_index]
+        for t in range(1, x_len):
+            r_b[t] = r_b[t - 1] + log_probs[t, blank_index]
+    else:
+        labels = [blank_index]
+        for label in prefix:
+            labels += [label, blank_index]
+        alpha = np.full((x_len, len(labels)), LOG_0)
+        alpha[0, 0] = log_probs[0, labels[0]]
+        alpha[0, 1] = log_probs[0, labels[1]]
+        for t in range(1, x_len):
+            for s in range(len(labels)):
+                a = alpha[t - 1, s]
+                if s > 0:
+                    a = np.logaddexp(a, alpha[t - 1, s - 1])
+                if s > 1 and labels[s] != blank_index and \
+                        labels[s] != labels[s - 2]:
+                    a = np.logaddexp(a, alpha[t - 1, s - 2])
+                alpha[t, s] = a + log_probs[t, labels[s]]
+        r_nb = list(alpha[:, -2])
+        r_b = list(alpha[:, -1])
+
+    if c is None:
+        return np.logaddexp(r_nb[-1], r_b[-1])
+
+    # The probability of all paths which emit c first at each frame
+    psi = log_probs[0, c] if len(prefix) == 0 else LOG_0
+    for t in range(1, x_len):
+        if len(prefix) > 0 and c == prefix[-1]:
+            phi = r_b[t - 1]
+        else:
+            phi = np.logaddexp(r_nb[t - 1], r_b[t - 1])
+        psi = np.logaddexp(psi, phi + log_probs[t, c])
+    return psi
+
+
+class TestCTCPrefixScorer(unittest.TestCase):
+
+    def test(self):
+        print("CTC prefix scorer Working check.")
+
+        self.check(num_classes=5)
+        self.check(num_classes=30)
+
+    def check(self, num_classes, batch_size=3, max_time=12, num_steps=4):
+
+        print('==================================================')
+        print('  num_classes: %d' % num_classes)
+        print('==================================================')
+
+        rs = np.random.RandomState(0)
+        logits = rs.randn(batch_size, max_time, num_classes)
+        log_probs = logits - np.log(np.sum(np.exp(logits), axis=-1,
+                                           keepdims=True))
+        x_lens = np.array([max_time, max_time - 3, 3])
+
+        scorer = CTCPrefixScorer(log_probs, x_lens, blank_index=0)
+        utt_idx = np.arange(batch_size)
+        state = scorer.initial_state(utt_idx)
+        prefixes = [[] for _ in range(batch_size)]
+        prefix_scores = np.zeros((batch_size,))
+        for step in range(num_steps):
+            labels = np.tile(np.append(np.arange(1, num_classes), scorer.eos),
+                             (batch_size, 1))
+            scores, new_state = scorer.score(state, utt_idx, labels, step)
+
+            for b in range(batch_size):
+                for k, c in enumerate(labels[b]):
+                    score_ref = _prefix_score_loop(
+                        log_probs[b], x_lens[b], prefixes[b],
+                        None if c == scorer.eos else c)
+                    score = prefix_scores[b] + scores[b, k]
+                    if score_ref == LOG_0:
+                        self.assertEqual(score, LOG_0)
+                    else:
+                        self.assertAlmostEqual(score, score_ref, places=3)
+
+            # Extend each prefix by a random label (including repetition)
+            cols = rs.randint(0, num_classes - 1, size=batch_size)
+            cols[0] = 0 if step == 0 else cols[0]
+            for b in range(batch_size):
+                if scores[b, cols[b]] == LOG_0:
+                    cols[b] = np.argmax(scores[b, :-1])
+                prefixes[b].append(labels[b, cols[b]])
+                prefix_scores[b] += scores[b, cols[b]]
+            state = scorer.select_state(new_state, utt_idx, cols)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Test CTC greedy decoder (numpy)."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+import time
+import unittest
+import numpy as np
+from itertools import groupby
+
+sys.path.append('../../../../')
+from models.pytorch_v3.ctc.decoders.greedy_decoder import GreedyDecoder
+
+
+def _greedy_loop(logits, x_lens, blank_index=0):
+    """The previous implementation: argmax per frame and groupby."""
+    best_hyps = []
+    for b in range(logits.shape[0]):
+        indices = [np.argmax(logits[b, t], axis=0) for t in range(x_lens[b])]
+        collapsed_indices = [x[0] for x in groupby(indices)]
+        best_hyps.append([x for x in collapsed_indices if x != blank_index])
+    return best_hyps
+
+
+class TestGreedyDecoder(unittest.TestCase):
+
+    def test(self):
+        print("CTC greedy decoder Working check.")
+
+        self.check(batch_size=1, num_classes=5)
+        self.check(batch_size=8, num_classes=5)
+        self.check(batch_size=8, num_classes=1000)
+        self.check(batch_size=32, num_classes=1000, max_time=500)
+
+    def check(self, batch_size, num_classes, max_time=100):
+
+        print('==================================================')
+        print('  batch_size: %d' % batch_size)
+        print('  num_classes: %d' % num_classes)
+        print('==================================================')
+
+        rs = np.random.RandomState(0)
+        logits = rs.randn(batch_size, max_time, num_classes).astype(np.float32)
+        logits[:, :, 0] += rs.rand(batch_size, max_time, 1)[:, :, 0] * 3
+        # NOTE: repeat frames
+        logits = np.repeat(logits, 2, axis=1)
+        x_lens = rs.randint(0, max_time * 2 + 1, size=batch_size)
+        x_lens[0] = max_time * 2
+
+        decoder = GreedyDecoder(blank_index=0)
+        start = time.time()
+        best_hyps, y_lens = decoder(logits, x_lens)
+        time_vec = time.time() - start
+        start = time.time()
+        best_hyps_ref = _greedy_loop(logits, x_lens)
+        time_loop = time.time() - start
+
+        self.assertEqual(best_hyps.shape[0], batch_size)
+        for b in range(batch_size):
+            self.assertEqual(y_lens[b], len(best_hyps_ref[b]))
+            self.assertEqual(list(best_hyps[b, :y_lens[b]]), best_hyps_ref[b])
+            self.assertTrue(np.all(best_hyps[b, y_lens[b]:] == -1))
+
+        # Best paths computed in advance
+        best_hyps_path, y_lens_path = decoder(np.argmax(logits, axis=-1),
+                                              x_lens)
+        self.assertTrue(np.array_equal(best_hyps_path, best_hyps))
+        self.assertTrue(np.array_equal(y_lens_path, y_lens))
+
+        print('vectorized: %.3f msec' % (time_vec * 1000))
+        print('loop: %.3f msec' % (time_loop * 1000))
+
+
+if __name__ == "__main__":
+    unittest.main()
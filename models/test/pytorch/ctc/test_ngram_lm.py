@@ -0,0 +1,198 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Test n-gram language model and shallow fusion in CTC beam search (numpy)."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import time
+import shutil
+import codecs
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.append('../../../../')
+from models.pytorch_v3.ctc.decoders.ngram_lm import NgramLM
+from models.pytorch_v3.ctc.decoders.beam_search_decoder import BeamSearchDecoder
+
+ARPA = """
+\\data\\
+ngram 1=8
+ngram 2=8
+ngram 3=4
+
+\\1-grams:
+-1.0\t<unk>
+-99\t<s>\t-0.5
+-0.8\t</s>
+-0.7\ta\t-0.3
+-0.9\tb\t-0.2
+-1.1\tc\t-0.4
+-1.3\tq\t-0.1
+-1.5\td
+
+\\2-grams:
+-0.2\t<s> a\t-0.1
+-0.6\t<s> b
+-0.3\ta b\t-0.2
+-0.5\tb c\t-0.3
+-0.4\tc </s>
+-0.7\ta a
+-0.4\tq a
+-0.2\tb </s>
+
+\\3-grams:
+-0.1\t<s> a b
+-0.2\ta b c
+-0.3\tb c </s>
+-0.1\tq a b
+
+\\end\\
+"""
+
+VOCAB = ['a', 'b', 'c', 'd', 'e', 'OOV']
+# NOTE: 'q' is not in the vocabulary, and 'e' is not in the ARPA file
+
+
+def _read_arpa_ref(arpa):
+    ngrams = {}
+    for line in arpa.split('\n'):
+        fields = line.strip().split('\t')
+        if len(fields) < 2:
+            continue
+        words = tuple(fields[1].split())
+        ngrams[words] = (float(fields[0]),
+                         float(fields[2]) if len(fields) > 2 else 0.)
+    return ngrams
+
+
+def _score_ref(ngrams, order, history, w):
+    """Back-off with n-grams in a dict (log10)."""
+    if w == 'OOV':
+        w = '<unk>'
+    h = tuple(history[-(order - 1):])
+    score = 0.
+    while True:
+        if h + (w,) in ngrams:
+            return score + ngrams[h + (w,)][0]
+        if len(h) == 0:
+            return score + ngrams[('<unk>',)][0]
+        score += ngrams.get(h, (0., 0.))[1]
+        h = h[1:]
+
+
+class TestNgramLM(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.arpa_path = os.path.join(self.tmp_dir, 'lm.arpa')
+        self.vocab_file_path = os.path.join(self.tmp_dir, 'vocab.txt')
+        with codecs.open(self.arpa_path, 'w', 'utf-8') as f:
+            f.write(ARPA)
+        with codecs.open(self.vocab_file_path, 'w', 'utf-8') as f:
+            f.write('\n'.join(VOCAB) + '\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test(self):
+        print("N-gram LM Working check.")
+
+        self.check_score()
+        self.check_cache()
+        self.check_fusion()
+
+    def check_score(self):
+        lm = NgramLM(self.arpa_path, self.vocab_file_path)
+        ngrams = _read_arpa_ref(ARPA)
+        self.assertEqual(lm.order, 3)
+
+        # Hand-computed back-off
+        state = lm.initial_state(1)
+        score, state = lm.score(state, [VOCAB.index('a')])
+        self.assertAlmostEqual(score[0], -0.2 * np.log(10))
+        score, state = lm.score(state, [VOCAB.index('b')])
+        self.assertAlmostEqual(score[0], -0.1 * np.log(10))
+        score, _ = lm.score(state, [VOCAB.index('a')])
+        # NOTE: bow(a b) + bow(b) + p(a)
+        self.assertAlmostEqual(score[0], (-0.2 - 0.2 - 0.7) * np.log(10))
+
+        # Compare with the reference for random sentences
+        rs = np.random.RandomState(0)
+        histories = [['<s>'] for _ in range(100)]
+        states = lm.initial_state(len(histories))
+        for t in range(10):
+            words = rs.randint(0, len(VOCAB), size=len(histories))
+            scores, states = lm.score(states, words)
+            for i, w in enumerate(words):
+                self.assertAlmostEqual(
+                    scores[i],
+                    _score_ref(ngrams, 3, histories[i], VOCAB[w]) * np.log(10))
+                histories[i].append(VOCAB[w])
+            final_scores = lm.final_score(states)
+            for i in range(len(histories)):
+                self.assertAlmostEqual(
+                    final_scores[i],
+                    _score_ref(ngrams, 3, histories[i], '</s>') * np.log(10))
+
+    def check_cache(self):
+        lm = NgramLM(self.arpa_path, self.vocab_file_path)
+        self.assertTrue(os.path.isfile(self.arpa_path + '.npz'))
+
+        start = time.time()
+        lm_cached = NgramLM(self.arpa_path, self.vocab_file_path)
+        print('load from cache: %.3f msec' % ((time.time() - start) * 1000))
+
+        rs = np.random.RandomState(1)
+        states = rs.randint(0, len(lm._keys) + 1, size=100)
+        words = rs.randint(0, len(VOCAB), size=100)
+        scores, new_states = lm.score(states, words)
+        scores_cached, new_states_cached = lm_cached.score(states, words)
+        self.assertTrue(np.allclose(scores, scores_cached))
+        self.assertTrue(np.array_equal(new_states, new_states_cached))
+
+        # The cache is rebuilt for another vocabulary
+        # NOTE: each vocabulary file is read only once
+        vocab_file_path_rev = os.path.join(self.tmp_dir, 'vocab_rev.txt')
+        with codecs.open(vocab_file_path_rev, 'w', 'utf-8') as f:
+            f.write('\n'.join(VOCAB[::-1]) + '\n')
+        lm_rev = NgramLM(self.arpa_path, vocab_file_path_rev)
+        score, _ = lm_rev.score(lm_rev.initial_state(1),
+                                [VOCAB[::-1].index('a')])
+        self.assertAlmostEqual(score[0], -0.2 * np.log(10))
+
+    def check_fusion(self):
+        lm = NgramLM(self.arpa_path, self.vocab_file_path)
+        decoder = BeamSearchDecoder(blank_index=0)
+
+        rs = np.random.RandomState(0)
+        logits = rs.randn(4, 30, len(VOCAB) + 1) * 3
+        logits[:, :, 0] += (rs.rand(4, 30) < 0.6) * 10
+        log_probs = logits - np.log(np.sum(np.exp(logits), axis=-1,
+                                           keepdims=True))
+        x_lens = np.array([30, 25, 20, 10])
+
+        # No effect without the LM weight
+        for b in range(len(x_lens)):
+            best_hyps = decoder(log_probs[b:b + 1], x_lens[b:b + 1],
+                                beam_width=10)
+            best_hyps_lm = decoder(log_probs[b:b + 1], x_lens[b:b + 1],
+                                   beam_width=10, alpha=0, lm=lm)
+            self.assertEqual(list(best_hyps[0]), list(best_hyps_lm[0]))
+
+        # The LM is dominant with a large weight
+        log_probs_flat = np.full((1, 3, len(VOCAB) + 1), np.log(0.1))
+        log_probs_flat[:, :, 0] = np.log(0.4)
+        best_hyps_lm = decoder(log_probs_flat, np.array([3]), beam_width=20,
+                               alpha=10, lm=lm)
+        self.assertEqual([VOCAB[c - 1] for c in best_hyps_lm[0]],
+                         ['a', 'b'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Test the encoder output cache (numpy)."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.append('../../../../')
+from models.pytorch_v3.encoder_cache import EncoderCache
+
+
+class TestEncoderCache(unittest.TestCase):
+
+    def test(self):
+        print("Encoder output cache Working check.")
+
+        self.check(spill=False)
+        self.check(spill=True)
+
+    def check(self, spill):
+
+        print('==================================================')
+        print('  spill: %s' % str(spill))
+        print('==================================================')
+
+        spill_path = None
+        if spill:
+            fd, spill_path = tempfile.mkstemp()
+            os.close(fd)
+
+        rs = np.random.RandomState(0)
+        arrays = [(rs.randn(10 + i, 8).astype(np.float32),
+                   rs.randn(5 + i, 4).astype(np.float32)) for i in range(5)]
+        num_bytes = sum(a.nbytes for a in arrays[0])
+
+        # Keep 2 utterances in the memory
+        cache = EncoderCache(max_bytes=num_bytes * 2 + num_bytes // 2,
+                             spill_path=spill_path)
+        for i in range(3):
+            cache.put(('utt' + str(i), 0), arrays[i])
+        self.assertLessEqual(cache.num_bytes, cache.max_bytes)
+
+        # The least recently used one is evicted
+        self.assertEqual(('utt0', 0) in cache, spill)
+        self.assertIsNone(cache.get(('utt0', 1)))
+
+        # Access to utt1 makes utt2 the least recently used one
+        cache.get(('utt1', 0))
+        cache.put(('utt3', 0), arrays[3])
+        self.assertIsNotNone(cache.get(('utt1', 0)))
+        self.assertEqual(('utt2', 0) in cache, spill)
+
+        for i in range(4):
+            out = cache.get(('utt' + str(i), 0))
+            if out is None:
+                self.assertFalse(spill)
+                continue
+            for a, a_ref in zip(out, arrays[i]):
+                self.assertTrue(np.array_equal(a, a_ref))
+
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+        if spill:
+            os.remove(spill_path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Test subsampling in RNN encoders with short utterances (pytorch)."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+import unittest
+import numpy as np
+import torch
+from torch.autograd import Variable
+
+sys.path.append('../../../../')
+from models.pytorch_v3.encoders.rnn import RNNEncoder
+
+
+class TestRNNEncoderSubsampling(unittest.TestCase):
+
+    def test(self):
+        print("RNN Encoder subsampling Working check.")
+
+        for subsample_type in ['drop', 'concat']:
+            for batch_first in [True, False]:
+                # Shorter than 2 ** (the number of subsampling layers)
+                self.check(subsample_type=subsample_type,
+                           batch_first=batch_first, x_lens=[9, 3, 1])
+                self.check(subsample_type=subsample_type,
+                           batch_first=batch_first, x_lens=[4, 2, 1])
+
+    def check(self, subsample_type, batch_first, x_lens):
+
+        print('==================================================')
+        print('  subsample_type: %s' % subsample_type)
+        print('  batch_first: %s' % str(batch_first))
+        print('  x_lens: %s' % str(x_lens))
+        print('==================================================')
+
+        input_size = 8
+        batch_size = len(x_lens)
+        xs = np.random.randn(
+            batch_size, max(x_lens), input_size).astype(np.float32)
+        xs = Variable(torch.from_numpy(xs))
+        x_lens_var = Variable(torch.IntTensor(x_lens))
+
+        encoder = RNNEncoder(
+            input_size=input_size,
+            rnn_type='lstm',
+            bidirectional=True,
+            num_units=16,
+            num_proj=0,
+            num_layers=3,
+            dropout_input=0,
+            dropout_hidden=0,
+            subsample_list=[True, True, False],
+            subsample_type=subsample_type,
+            batch_first=batch_first)
+
+        xs, x_lens_out, _ = encoder(xs, x_lens_var)
+
+        # Lengths are halved twice, but never reach 0
+        expected = [max(max(x_len // 2, 1) // 2, 1) for x_len in x_lens]
+        self.assertEqual(x_lens_out.data.cpu().tolist(), expected)
+        time_axis = 1 if batch_first else 0
+        self.assertEqual(xs.size(time_axis), max(expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
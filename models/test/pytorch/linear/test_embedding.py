@@ -0,0 +1,88 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Test embedding layers with label smoothing (pytorch)."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+import time
+import unittest
+
+import torch
+from torch.autograd import Variable
+torch.manual_seed(1623)
+torch.cuda.manual_seed_all(1623)
+
+sys.path.append('../../../../')
+from models.pytorch_v3.linear import Embedding_LS
+
+
+def _embed_onehot_host(model, y):
+    """The previous implementation: build a one-hot tensor on the host,
+        copy it to the device, and multiply it by the weight matrix.
+    """
+    num_classes = model.num_classes
+    ls_prob = model.label_smoothing_prob
+    y_onehot = torch.FloatTensor(y.size(0), num_classes).zero_()
+    y_onehot.scatter_(1, y.data.cpu(), 1)
+    y_onehot = y_onehot * (1 - ls_prob) + 1 / num_classes * ls_prob
+    y_onehot = Variable(y_onehot).unsqueeze(1)
+    if y.is_cuda:
+        y_onehot = y_onehot.cuda()
+    return model.embed(y_onehot)
+
+
+class TestEmbedding(unittest.TestCase):
+
+    def test(self):
+        print("Embedding (label smoothing) Working check.")
+
+        self.check(num_classes=30, beam_width=1)
+        self.check(num_classes=30, beam_width=10)
+        self.check(num_classes=10000, beam_width=1)
+        self.check(num_classes=10000, beam_width=10)
+
+    def check(self, num_classes, beam_width, embedding_dim=32,
+              label_smoothing_prob=0.1, num_steps=200):
+
+        print('==================================================')
+        print('  num_classes: %d' % num_classes)
+        print('  beam_width: %d' % beam_width)
+        print('==================================================')
+
+        model = Embedding_LS(num_classes=num_classes,
+                             embedding_dim=embedding_dim,
+                             dropout=0,
+                             label_smoothing_prob=label_smoothing_prob)
+        model.eval()
+
+        y = Variable(torch.LongTensor(beam_width, 1).random_(0, num_classes))
+        if torch.cuda.is_available():
+            model = model.cuda()
+            y = y.cuda()
+
+        # Check equivalence
+        y_emb = model(y)
+        y_emb_ref = _embed_onehot_host(model, y)
+        self.assertEqual(y_emb.size(), y_emb_ref.size())
+        self.assertTrue((y_emb - y_emb_ref).abs().max().data[0] < 1e-5)
+
+        # Per-step latency
+        for name, fn in [('row lookup', model),
+                         ('one-hot (host)', lambda y: _embed_onehot_host(model, y))]:
+            if torch.cuda.is_available():
+                torch.cuda.synchronize()
+            start = time.time()
+            for _ in range(num_steps):
+                fn(y)
+            if torch.cuda.is_available():
+                torch.cuda.synchronize()
+            print('%s: %.3f msec/step' %
+                  (name, (time.time() - start) / num_steps * 1000))
+
+
+if __name__ == "__main__":
+    unittest.main()
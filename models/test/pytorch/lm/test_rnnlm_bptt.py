@@ -0,0 +1,184 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Test truncated BPTT of RNNLM (pytorch)."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import time
+import shutil
+import codecs
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+
+import torch
+torch.manual_seed(1623)
+torch.cuda.manual_seed_all(1623)
+
+sys.path.append('../../../../')
+from models.pytorch.lm.rnnlm import RNNLM
+from utils.dataset.loader_lm import BPTTDataset
+
+
+class TestRNNLMBPTT(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.dataset_path = os.path.join(self.tmp_dir, 'word.csv')
+        self.vocab_file_path = os.path.join(self.tmp_dir, 'word.txt')
+        self.num_classes = 50
+
+        rs = np.random.RandomState(0)
+        self.sentences = [rs.randint(0, self.num_classes,
+                                     size=rs.randint(5, 30))
+                          for _ in range(200)]
+        df = pd.DataFrame({'transcript': [' '.join(map(str, s))
+                                          for s in self.sentences]})
+        df.to_csv(self.dataset_path, encoding='utf-8')
+        with codecs.open(self.vocab_file_path, 'w', 'utf-8') as f:
+            for i in range(self.num_classes):
+                f.write('w%d\n' % i)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test(self):
+        print("RNNLM truncated BPTT Working check.")
+
+        self.check_loader(batch_size=1, bptt=7)
+        self.check_loader(batch_size=4, bptt=35)
+        self.check_bptt(rnn_type='lstm')
+        self.check_bptt(rnn_type='gru')
+        self.check_speed()
+
+    def check_loader(self, batch_size, bptt):
+
+        print('==================================================')
+        print('  batch_size: %d' % batch_size)
+        print('  bptt: %d' % bptt)
+        print('==================================================')
+
+        dataset = BPTTDataset(self.dataset_path, self.vocab_file_path,
+                              batch_size=batch_size, bptt=bptt, max_epoch=2)
+        eos = self.num_classes
+        tokens = np.concatenate(
+            [[eos]] + [np.concatenate([s, [eos]]) for s in self.sentences])
+
+        streams = [[] for _ in range(batch_size)]
+        num_windows = 0
+        for batch, is_new_epoch in dataset:
+            self.assertEqual(batch['is_new_stream'], num_windows == 0)
+            for b in range(batch_size):
+                # NOTE: the first token is the last one of the previous window
+                if len(streams[b]) > 0:
+                    self.assertEqual(batch['ys'][b, 0], streams[b][-1])
+                    streams[b] += list(batch['ys'][b, 1:])
+                else:
+                    streams[b] += list(batch['ys'][b])
+            num_windows += 1
+            if is_new_epoch:
+                break
+        self.assertEqual(num_windows, len(dataset))
+
+        stream_len = (len(tokens) - 1) // batch_size
+        self.assertEqual(list(np.concatenate(streams)),
+                         list(tokens[:batch_size * stream_len + 1]
+                              [np.concatenate([
+                                  np.arange(stream_len + 1) + b * stream_len
+                                  for b in range(batch_size)])]))
+
+    def check_bptt(self, rnn_type):
+
+        print('==================================================')
+        print('  rnn_type: %s' % rnn_type)
+        print('==================================================')
+
+        model = RNNLM(self.num_classes,
+                      embedding_dim=16,
+                      rnn_type=rnn_type,
+                      bidirectional=False,
+                      num_units=32,
+                      num_layers=2,
+                      dropout_embedding=0.1,
+                      dropout_hidden=0.1,
+                      dropout_output=0.1)
+
+        # Carrying hidden states is equivalent to the whole window
+        ys = np.random.RandomState(1).randint(
+            0, self.num_classes + 1, size=(4, 21))
+        loss_all, _ = model.forward_bptt(ys, is_eval=True)
+        loss_1, hidden = model.forward_bptt(ys[:, :11], is_eval=True)
+        loss_2, _ = model.forward_bptt(ys[:, 10:], hidden, is_eval=True)
+        self.assertAlmostEqual(loss_all, (loss_1 + loss_2) / 2, places=5)
+
+        # Training
+        model.set_optimizer('adam', learning_rate_init=1e-3)
+        dataset = BPTTDataset(self.dataset_path, self.vocab_file_path,
+                              batch_size=4, bptt=10)
+        hidden = None
+        for step in range(20):
+            batch, _ = dataset.next()
+            if batch['is_new_stream']:
+                hidden = None
+            model.optimizer.zero_grad()
+            loss, hidden = model.forward_bptt(batch['ys'], hidden)
+            loss.backward()
+            model.optimizer.step()
+            self.assertFalse(hidden[0].requires_grad if rnn_type == 'lstm'
+                             else hidden.requires_grad)
+
+    def check_speed(self, batch_size=32, bptt=35):
+        model = RNNLM(self.num_classes,
+                      embedding_dim=64,
+                      rnn_type='lstm',
+                      bidirectional=False,
+                      num_units=128,
+                      num_layers=1,
+                      dropout_embedding=0.1,
+                      dropout_hidden=0.1,
+                      dropout_output=0.1)
+        model.set_optimizer('adam', learning_rate_init=1e-3)
+        eos = self.num_classes
+
+        # Padded sentences
+        start = time.time()
+        num_tokens = 0
+        for i in range(0, len(self.sentences), batch_size):
+            sentences = self.sentences[i:i + batch_size]
+            y_lens = np.array([len(s) + 2 for s in sentences])
+            ys = np.full((len(sentences), max(y_lens)), -1, dtype=np.int64)
+            for b, s in enumerate(sentences):
+                ys[b, :y_lens[b]] = np.concatenate([[eos], s, [eos]])
+            model.optimizer.zero_grad()
+            loss = model(ys, y_lens)
+            loss.backward()
+            model.optimizer.step()
+            num_tokens += np.sum(y_lens - 1)
+        print('padded sentences: %.1f tokens/sec' %
+              (num_tokens / (time.time() - start)))
+
+        # Contiguous BPTT windows
+        dataset = BPTTDataset(self.dataset_path, self.vocab_file_path,
+                              batch_size=batch_size, bptt=bptt)
+        start = time.time()
+        hidden = None
+        while True:
+            batch, is_new_epoch = dataset.next()
+            model.optimizer.zero_grad()
+            loss, hidden = model.forward_bptt(batch['ys'], hidden)
+            loss.backward()
+            model.optimizer.step()
+            if is_new_epoch:
+                break
+        print('BPTT windows: %.1f tokens/sec' %
+              (dataset.num_tokens / (time.time() - start)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,208 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Test incremental scoring with RNNLM (pytorch)."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+import unittest
+import numpy as np
+
+import torch
+torch.manual_seed(1623)
+torch.cuda.manual_seed_all(1623)
+
+sys.path.append('../../../../')
+from models.pytorch.lm.rnnlm import RNNLM, RNNLMScorer
+from models.pytorch_v3.ctc.decoders.beam_search_decoder import BeamSearchDecoder
+
+
+def _ctc_log_prob(log_probs, labels, blank_index=0):
+    """The log-likelihood of labels by the CTC forward algorithm."""
+    ext = [blank_index]
+    for label in labels:
+        ext += [label, blank_index]
+    alpha = np.full((len(ext),), -np.inf)
+    alpha[0] = log_probs[0, ext[0]]
+    if len(ext) > 1:
+        alpha[1] = log_probs[0, ext[1]]
+    for t in range(1, len(log_probs)):
+        prev = alpha.copy()
+        for s in range(len(ext)):
+            a = prev[s]
+            if s > 0:
+                a = np.logaddexp(a, prev[s - 1])
+            if s > 1 and ext[s] != blank_index and ext[s] != ext[s - 2]:
+                a = np.logaddexp(a, prev[s - 2])
+            alpha[s] = a + log_probs[t, ext[s]]
+    if len(ext) == 1:
+        return alpha[0]
+    return np.logaddexp(alpha[-1], alpha[-2])
+
+
+class TestRNNLMScorer(unittest.TestCase):
+
+    def test(self):
+        print("RNNLM scorer Working check.")
+
+        self.check(rnn_type='lstm')
+        self.check(rnn_type='gru')
+        self.check(rnn_type='lstm', num_layers=2)
+        self.check_sequence(rnn_type='lstm')
+        self.check_sequence(rnn_type='gru', num_layers=2)
+        self.check_ctc_fusion(rnn_type='lstm')
+
+    def check(self, rnn_type, num_layers=1, num_classes=11, batch_size=6):
+
+        print('==================================================')
+        print('  rnn_type: %s' % rnn_type)
+        print('  num_layers: %d' % num_layers)
+        print('==================================================')
+
+        model = RNNLM(
+            num_classes,
+            embedding_dim=16,
+            rnn_type=rnn_type,
+            bidirectional=False,
+            num_units=32,
+            num_layers=num_layers,
+            dropout_embedding=0.1,
+            dropout_hidden=0.1,
+            dropout_output=0.1)
+        model.eval()
+        scorer = RNNLMScorer(model)
+        eos = num_classes
+
+        def score_full(prefix):
+            # NOTE: run the RNN from the beginning of the sentence
+            hidden = None
+            with torch.no_grad():
+                for y in [eos] + prefix:
+                    log_probs, hidden = model.predict(
+                        model.np2tensor(np.array([y]), dtype=torch.long),
+                        hidden)
+            return model.tensor2np(log_probs[0])
+
+        rs = np.random.RandomState(0)
+        states = scorer.initial_state(batch_size)
+        prefixes = [[] for _ in range(batch_size)]
+        for t in range(5):
+            words = rs.randint(0, num_classes, size=batch_size)
+            scores, new_states = scorer.score(states, words)
+            for b in range(batch_size):
+                self.assertAlmostEqual(
+                    scores[b], score_full(prefixes[b])[words[b]], places=5)
+
+            # Reorder hypotheses like beam search
+            src = rs.randint(0, batch_size, size=batch_size)
+            states = scorer.select_state(new_states, src)
+            prefixes = [prefixes[k] + [words[k]] for k in src]
+
+        # The same prefix has the same state
+        for b in range(batch_size):
+            for b_other in range(batch_size):
+                self.assertEqual(states[b] == states[b_other],
+                                 prefixes[b] == prefixes[b_other])
+
+        final_scores = scorer.final_score(states)
+        log_probs = model.tensor2np(scorer.log_probs(states))
+        for b in range(batch_size):
+            self.assertAlmostEqual(
+                final_scores[b], score_full(prefixes[b])[eos], places=5)
+            self.assertTrue(np.allclose(
+                log_probs[b], score_full(prefixes[b]), atol=1e-5))
+
+    def check_sequence(self, rnn_type, num_layers=1, num_classes=11):
+
+        print('==================================================')
+        print('  rnn_type: %s' % rnn_type)
+        print('  num_layers: %d' % num_layers)
+        print('==================================================')
+
+        model = RNNLM(
+            num_classes,
+            embedding_dim=16,
+            rnn_type=rnn_type,
+            bidirectional=False,
+            num_units=32,
+            num_layers=num_layers,
+            dropout_embedding=0.1,
+            dropout_hidden=0.1,
+            dropout_output=0.1)
+        model.eval()
+        scorer = RNNLMScorer(model)
+
+        rs = np.random.RandomState(1)
+        ys_list = [rs.randint(0, num_classes, size=rs.randint(0, 8))
+                   for _ in range(20)]
+        scores = model.sequence_log_probs(ys_list, batch_size=7)
+
+        # Compare with incremental scoring of each sentence
+        for y, score in zip(ys_list, scores):
+            state = scorer.initial_state(1)
+            score_ref = 0.
+            for w in y:
+                s, state = scorer.score(state, np.array([w]))
+                score_ref += s[0]
+            score_ref += scorer.final_score(state)[0]
+            self.assertAlmostEqual(score, score_ref, places=4)
+
+    def check_ctc_fusion(self, rnn_type, num_classes=3):
+
+        print('==================================================')
+        print('  rnn_type: %s' % rnn_type)
+        print('  CTC beam search')
+        print('==================================================')
+
+        model = RNNLM(
+            num_classes,
+            embedding_dim=16,
+            rnn_type=rnn_type,
+            bidirectional=False,
+            num_units=32,
+            num_layers=1,
+            dropout_embedding=0.1,
+            dropout_hidden=0.1,
+            dropout_output=0.1)
+        model.eval()
+        scorer = RNNLMScorer(model)
+        decoder = BeamSearchDecoder(blank_index=0)
+
+        rs = np.random.RandomState(2)
+        logits = rs.randn(2, 4, num_classes + 1) * 2
+        log_probs = logits - np.log(np.sum(np.exp(logits), axis=-1,
+                                           keepdims=True))
+        x_lens = np.array([4, 3])
+
+        # No effect without the LM weight
+        best_hyps = decoder(log_probs, x_lens, beam_width=4)
+        best_hyps_lm = decoder(log_probs, x_lens, beam_width=4,
+                               alpha=0, lm=scorer)
+        for b in range(len(x_lens)):
+            self.assertEqual(list(best_hyps[b]), list(best_hyps_lm[b]))
+
+        # Scores are shifted by exactly the LM scores
+        # NOTE: the beam holds all prefixes, so that CTC scores are exact
+        alpha = 0.5
+        nbest_hyps, scores = decoder.decode_nbest(
+            log_probs, x_lens, beam_width=200, nbest=10, alpha=alpha,
+            lm=scorer)
+        for b in range(len(x_lens)):
+            for hyp, score in zip(nbest_hyps[b], scores[b]):
+                state = scorer.initial_state(1)
+                score_lm = 0.
+                for c in hyp:
+                    # NOTE: the LM index excludes the blank
+                    s, state = scorer.score(state, np.array([c - 1]))
+                    score_lm += s[0]
+                score_lm += scorer.final_score(state)[0]
+                score_ctc = _ctc_log_prob(log_probs[b, :x_lens[b]], hyp)
+                self.assertAlmostEqual(score, score_ctc + alpha * score_lm,
+                                       places=4)
+
+
+if __name__ == "__main__":
+    unittest.main()
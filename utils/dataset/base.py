@@ -14,9 +14,11 @@ import numpy as np
 from struct import unpack
 from torch.multiprocessing import Queue, Process
 import logging
-import codecs
 logger = logging.getLogger('training')
 
+from utils.dataset.targets import make_decoder_targets
+from utils.io.labels.vocabulary import Vocabulary
+
 
 class Base(object):
 
@@ -33,20 +35,19 @@ class Base(object):
         self.queue = Queue()
         self.queue_size = 0
 
+        # Directions of attention-based decoders whose inputs and outputs
+        # are made in make_batch (fwd or bwd)
+        self.target_dirs = []
+        self.target_dirs_sub = []
+
         # Read the vocabulary file
-        vocab_count = 0
-        with codecs.open(kwargs['vocab_file_path'], 'r', 'utf-8') as f:
-            for line in f:
-                if line.strip() != '':
-                    vocab_count += 1
-        self.num_classes = vocab_count
+        # NOTE: the last token is <EOS>
+        vocab = Vocabulary.load(kwargs['vocab_file_path'])
+        self.num_classes = sum(1 for t in vocab.tokens[:-1] if t != '')
 
         if 'vocab_file_path_sub' in kwargs.keys():
-            vocab_count_sub = 0
-            with codecs.open(kwargs['vocab_file_path_sub'], 'r', 'utf-8') as f:
-                for line in f:
-                    vocab_count_sub += 1
-            self.num_classes_sub = vocab_count_sub
+            vocab_sub = Vocabulary.load(kwargs['vocab_file_path_sub'])
+            self.num_classes_sub = len(vocab_sub) - 1
 
     def __len__(self):
         return len(self.df)
@@ -60,6 +61,29 @@ class Base(object):
         """Returns self."""
         return self
 
+    def add_decoder_targets(self, batch):
+        """Add inputs and outputs of attention-based decoders to the
+            mini-batch, such as `ys_in_fwd`, `ys_out_fwd`, `ys_in_sub_bwd`
+            and `ys_out_sub_bwd`.
+        Args:
+            batch (dict): mini-batch made by make_batch
+        Returns:
+            batch (dict)
+        """
+        if self.is_test:
+            return batch
+        for suffix, dirs in [('', self.target_dirs),
+                             ('_sub', self.target_dirs_sub)]:
+            for dir in dirs:
+                eos = getattr(self, 'num_classes' + suffix)
+                # NOTE: <SOS> and <EOS> have the same index
+                ys_in, ys_out = make_decoder_targets(
+                    batch['ys' + suffix], batch['y_lens' + suffix],
+                    sos=eos, eos=eos, reverse=dir == 'bwd')
+                batch['ys_in' + suffix + '_' + dir] = ys_in
+                batch['ys_out' + suffix + '_' + dir] = ys_out
+        return batch
+
     @property
     def pad_value(self):
         return -1 if not self.is_test else None
@@ -203,6 +227,50 @@ class Base(object):
     def select_batch_size(self, batch_size, min_frame_num_batch):
         raise NotImplementedError
 
+    def sorted_batches(self, batch_size=None, max_frames=None):
+        """Generate mini-batches over all utterances once for evaluation.
+            Utterances are sorted by length in the descending order, and
+            each mini-batch holds as many utterances as fit in max_frames
+            padded input frames (at least one). This does not change the
+            data counter used by next().
+        Args:
+            batch_size (int, optional): the average size of mini-batch
+            max_frames (int, optional): the maximum number of padded frames
+                in a mini-batch. By default, batch_size times the average
+                number of frames.
+        Returns:
+            batch (dict): mini-batch made by make_batch
+            is_new_epoch (bool): If true, this is the last mini-batch
+        """
+        if batch_size is None:
+            batch_size = self.batch_size
+
+        frame_nums = np.ceil(
+            self.df['frame_num'].values / self.num_skip).astype(np.int64)
+        order = np.argsort(-frame_nums, kind='mergesort')
+        if max_frames is None:
+            max_frames = int(batch_size * frame_nums.mean())
+
+        start = 0
+        while start < len(order):
+            # NOTE: the first utterance is the longest in the mini-batch
+            num_utt = max(1, max_frames // max(1, frame_nums[order[start]]))
+            data_indices = list(self.df.index[order[start:start + num_utt]])
+            start += num_utt
+            yield self.make_batch(data_indices), bool(start >= len(order))
+
+    def shard(self, index, num_shards):
+        """Keep only one of num_shards subsets of utterances. Utterances
+            are dealt to subsets in the order of length, so that every
+            subset has a similar amount of frames.
+        Args:
+            index (int): the index of the subset to keep
+            num_shards (int): the number of subsets
+        """
+        order = np.argsort(-self.df['frame_num'].values, kind='mergesort')
+        self.df = self.df.iloc[np.sort(order[index::num_shards])]
+        self._reset()
+
     def reset(self):
         self._reset()
 
@@ -42,6 +42,9 @@ class DatasetBase(Base):
                     `[B]`
                 input_names (np.ndarray): file names of input data of size
                     `[B]`
+                ys_in_*, ys_out_* (np.ndarray): inputs and outputs of
+                    attention-based decoders of size `[B, T_out + 1]`.
+                    These are made for directions in target_dirs.
         """
         input_path_list = np.array(self.df['input_path'][data_indices])
         str_indices_list = np.array(self.df['transcript'][data_indices])
@@ -154,4 +157,4 @@ class DatasetBase(Base):
                  'y_lens': y_lens,
                  'input_names': input_names}
 
-        return batch
+        return self.add_decoder_targets(batch)
@@ -52,6 +52,10 @@ class DatasetBase(Base):
                     `[B]`
                 input_names (np.ndarray): file names of input data of size
                     `[B]`
+                ys_in_*, ys_out_* (np.ndarray): inputs and outputs of
+                    attention-based decoders of size `[B, T_out + 1]`.
+                    These are made for directions in target_dirs and
+                    target_dirs_sub.
         """
         # Load dataset in mini-batch
         input_path_list = np.array(self.df['input_path'][data_indices])
@@ -181,4 +185,4 @@ class DatasetBase(Base):
                  'y_lens_sub': y_lens_sub,
                  'input_names': input_names}
 
-        return batch
+        return self.add_decoder_targets(batch)
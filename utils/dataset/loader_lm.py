@@ -0,0 +1,128 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Class for loading dataset for the RNN language model.
+   All sentences are concatenated into one token stream, which is split into
+   `batch_size` streams and cut into windows for truncated BPTT.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import random
+import numpy as np
+import pandas as pd
+
+from utils.io.labels.vocabulary import Vocabulary
+
+
+class BPTTDataset(object):
+    """Dataset for truncated BPTT.
+        The last token of each window is also the first token of the next
+        window, so that the hidden states can be carried over.
+    Args:
+        dataset_path (string): path to the dataset file (.csv) whose
+            `transcript` column is a sequence of indices separated by spaces
+        vocab_file_path (string): path to the vocabulary file.
+            Sentences are separated by <EOS>, whose index is the vocabulary
+            size.
+        batch_size (int): the number of streams
+        bptt (int): the length of windows
+        max_epoch (int, optional): the max epoch. None means infinite loop.
+        shuffle (bool, optional): if True, shuffle sentences every epoch
+    """
+
+    def __init__(self, dataset_path, vocab_file_path, batch_size, bptt,
+                 max_epoch=None, shuffle=False):
+        self.batch_size = batch_size
+        self.bptt = bptt
+        self.max_epoch = max_epoch
+        self.shuffle = shuffle
+        self.epoch = 0
+        self.iteration = 0
+        self.offset = 0
+
+        # Read the vocabulary file
+        vocab = Vocabulary.load(vocab_file_path)
+        self.num_classes = sum(1 for t in vocab.tokens[:-1] if t != '')
+        self.eos = self.num_classes
+
+        # Tokenize all sentences at once
+        df = pd.read_csv(dataset_path, encoding='utf-8')
+        self.sentences = [np.array(str(s).split(' '), dtype=np.int64)
+                          for s in df['transcript'].values]
+        self._make_streams()
+
+    def __len__(self):
+        """The number of windows in each epoch."""
+        return int(np.ceil(self._stream_len / self.bptt))
+
+    def __iter__(self):
+        """Returns self."""
+        return self
+
+    @property
+    def epoch_detail(self):
+        # Floating point version of epoch
+        return self.epoch + self.offset / self._stream_len
+
+    @property
+    def num_tokens(self):
+        return self.batch_size * self._stream_len
+
+    def _make_streams(self):
+        """Concatenate sentences and split into streams."""
+        if self.shuffle:
+            random.shuffle(self.sentences)
+        eos = np.array([self.eos], dtype=np.int64)
+        tokens = np.concatenate(
+            [eos] + [np.concatenate([s, eos]) for s in self.sentences])
+        self._stream_len = (len(tokens) - 1) // self.batch_size
+        if self._stream_len == 0:
+            raise ValueError('The corpus is too small for the batch size.')
+        # NOTE: the remainder is discarded
+
+        # `[B, stream_len + 1]`
+        self._streams = tokens[
+            np.arange(self.batch_size)[:, None] * self._stream_len +
+            np.arange(self._stream_len + 1)[None, :]]
+
+    def __next__(self, batch_size=None):
+        """Generate each mini-batch.
+        Args:
+            batch_size: not used (to make compatible)
+        Returns:
+            batch (dict):
+                ys (np.ndarray): A tensor of size `[B, T + 1]`, where T is
+                    bptt except the last window
+                is_new_stream (bool): if True, the hidden states must be
+                    reset
+            is_new_epoch (bool): If true, 1 epoch is finished
+        """
+        if self.max_epoch is not None and self.epoch >= self.max_epoch:
+            raise StopIteration
+        # NOTE: max_epoch == None means infinite loop
+
+        batch = {'ys': self._streams[
+            :, self.offset:self.offset + self.bptt + 1],
+            'is_new_stream': self.offset == 0}
+        self.offset += self.bptt
+        self.iteration += 1
+
+        is_new_epoch = self.offset >= self._stream_len
+        if is_new_epoch:
+            self.epoch += 1
+            self.offset = 0
+            if self.shuffle:
+                self._make_streams()
+
+        return batch, is_new_epoch
+
+    def next(self, batch_size=None):
+        # For python2
+        return self.__next__(batch_size)
+
+    def reset(self):
+        """Reset data counter and offset."""
+        self.offset = 0
@@ -0,0 +1,45 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Make inputs and outputs of attention-based decoders."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+
+
+def make_decoder_targets(ys, y_lens, sos, eos, reverse=False):
+    """Add <SOS> and <EOS> to labels of the whole mini-batch at once.
+    Args:
+        ys (np.ndarray): A tensor of size `[B, T_out]`, which is padded with -1
+        y_lens (np.ndarray): A tensor of size `[B]`
+        sos (int): the index of <SOS>
+        eos (int): the index of <EOS>
+        reverse (bool, optional): if True, reverse the order of labels
+            for the backward decoder
+    Returns:
+        ys_in (np.ndarray): A tensor of size `[B, T_out + 1]`, which is
+            added <SOS> before the first token and padded with <EOS>
+        ys_out (np.ndarray): A tensor of size `[B, T_out + 1]`, which is
+            added <EOS> after the last token and padded with -1
+    """
+    batch_size, max_len = ys.shape
+    y_lens = np.asarray(y_lens, dtype=np.int64)
+    pos = np.arange(max_len)[None, :]
+    is_token = pos < y_lens[:, None]
+
+    if reverse:
+        ys = ys[np.arange(batch_size)[:, None],
+                np.where(is_token, y_lens[:, None] - 1 - pos, 0)]
+
+    ys_in = np.full((batch_size, max_len + 1), eos, dtype=np.int64)
+    ys_in[:, 0] = sos
+    ys_in[:, 1:] = np.where(is_token, ys, eos)
+
+    ys_out = np.full((batch_size, max_len + 1), -1, dtype=np.int64)
+    ys_out[:, :-1] = np.where(is_token, ys, -1)
+    ys_out[np.arange(batch_size), y_lens] = eos
+
+    return ys_in, ys_out
@@ -64,66 +64,162 @@ def compute_wer(ref, hyp, normalize=False):
         ins (int): the number of insertion
         dele (int): the number of deletion
     """
-    # Initialisation
-    d = np.zeros((len(ref) + 1) * (len(hyp) + 1), dtype=np.uint16)
-    d = d.reshape((len(ref) + 1, len(hyp) + 1))
-    for i in range(len(ref) + 1):
-        for j in range(len(hyp) + 1):
-            if i == 0:
-                d[0][j] = j
-            elif j == 0:
-                d[i][0] = i
-
-    # Computation
-    for i in range(1, len(ref) + 1):
-        for j in range(1, len(hyp) + 1):
-            if ref[i - 1] == hyp[j - 1]:
-                d[i][j] = d[i - 1][j - 1]
-            else:
-                sub_tmp = d[i - 1][j - 1] + 1
-                ins_tmp = d[i][j - 1] + 1
-                del_tmp = d[i - 1][j] + 1
-                d[i][j] = min(sub_tmp, ins_tmp, del_tmp)
+    wer, sub, ins, dele = [int(v[0])
+                           for v in compute_wer_corpus([ref], [hyp])]
+
+    if normalize:
+        wer /= len(ref)
+
+    return wer, sub, ins, dele
+
 
-    wer = d[len(ref)][len(hyp)]
+def compute_wer_corpus(refs, hyps, return_alignments=False, chunk_size=256):
+    """Compute Word Error Rate of all utterances at once.
+        Words are mapped to integers once, and the edit distance tables of
+        utterances with similar lengths are filled together row by row.
+        Insertions within a row are resolved by a cumulative minimum.
+    Args:
+        refs (list): A list of length `[U]` of words in the reference
+            transcripts
+        hyps (list): A list of length `[U]` of words in the predicted
+            transcripts
+        return_alignments (bool, optional): if True, return the alignment
+            of each utterance
+        chunk_size (int, optional): the number of utterances computed
+            at once
+    Returns:
+        wer (np.ndarray): A tensor of size `[U]` of the number of errors
+        sub (np.ndarray): A tensor of size `[U]`
+        ins (np.ndarray): A tensor of size `[U]`
+        dele (np.ndarray): A tensor of size `[U]`
+        alignments (list, optional): A list of length `[U]` of strings of
+            C (correct), S, I and D
+    """
+    assert len(refs) == len(hyps)
+
+    # Build mapping of word to index
+    word2idx = {}
+    refs = [np.array([word2idx.setdefault(w, len(word2idx)) for w in ref],
+                     dtype=np.int64) for ref in refs]
+    hyps = [np.array([word2idx.setdefault(w, len(word2idx)) for w in hyp],
+                     dtype=np.int64) for hyp in hyps]
+    ref_lens = np.array([len(ref) for ref in refs], dtype=np.int64)
+    hyp_lens = np.array([len(hyp) for hyp in hyps], dtype=np.int64)
+
+    num_utt = len(refs)
+    wer = np.zeros((num_utt,), dtype=np.int64)
+    sub = np.zeros((num_utt,), dtype=np.int64)
+    ins = np.zeros((num_utt,), dtype=np.int64)
+    dele = np.zeros((num_utt,), dtype=np.int64)
+    alignments = [None] * num_utt
+
+    # NOTE: utterances with similar lengths are computed together
+    order = np.argsort(np.maximum(ref_lens, hyp_lens), kind='mergesort')
+    for start in range(0, num_utt, chunk_size):
+        utt_indices = order[start:start + chunk_size]
+        outputs = _edit_distance_batch([refs[u] for u in utt_indices],
+                                       [hyps[u] for u in utt_indices],
+                                       ref_lens[utt_indices],
+                                       hyp_lens[utt_indices],
+                                       return_ops=return_alignments)
+        wer[utt_indices], sub[utt_indices], ins[utt_indices], \
+            dele[utt_indices], ops = outputs
+        if return_alignments:
+            for b, u in enumerate(utt_indices):
+                alignments[u] = ops[b]
+
+    if return_alignments:
+        return wer, sub, ins, dele, alignments
+    return wer, sub, ins, dele
+
+
+def _edit_distance_batch(refs, hyps, ref_lens, hyp_lens, return_ops=False):
+    """Fill the edit distance tables of utterances and trace them back.
+    Args:
+        refs (list): A list of length `[B]` of np.ndarray of word indices
+        hyps (list): A list of length `[B]` of np.ndarray of word indices
+        ref_lens (np.ndarray): A tensor of size `[B]`
+        hyp_lens (np.ndarray): A tensor of size `[B]`
+        return_ops (bool, optional): if True, return the manipulation steps
+    Returns:
+        wer (np.ndarray): A tensor of size `[B]`
+        sub (np.ndarray): A tensor of size `[B]`
+        ins (np.ndarray): A tensor of size `[B]`
+        dele (np.ndarray): A tensor of size `[B]`
+        ops (list): A list of length `[B]` of strings of C, S, I and D,
+            or None
+    """
+    batch_size = len(refs)
+    max_ref_len = max(ref_lens)
+    max_hyp_len = max(hyp_lens)
+
+    # NOTE: padded positions never match each other
+    # NOTE: keep at least one column so that the traceback can look up
+    # the previous word even if all references (hypotheses) are empty
+    ref_pad = np.full((batch_size, max(max_ref_len, 1)), -1, dtype=np.int64)
+    hyp_pad = np.full((batch_size, max(max_hyp_len, 1)), -2, dtype=np.int64)
+    for b in range(batch_size):
+        ref_pad[b, :ref_lens[b]] = refs[b]
+        hyp_pad[b, :hyp_lens[b]] = hyps[b]
+
+    steps = np.arange(max_hyp_len + 1, dtype=np.int32)
+    d = np.zeros((batch_size, max_ref_len + 1, max_hyp_len + 1),
+                 dtype=np.int32)
+    d[:, 0] = steps
+    for i in range(1, max_ref_len + 1):
+        mismatch = ref_pad[:, i - 1:i] != hyp_pad[:, :max_hyp_len]
+        row = np.empty((batch_size, max_hyp_len + 1), dtype=np.int32)
+        row[:, 0] = i
+        row[:, 1:] = np.minimum(d[:, i - 1, :-1] + mismatch,
+                                d[:, i - 1, 1:] + 1)
+        d[:, i] = np.minimum.accumulate(row - steps, axis=1) + steps
+
+    batch_indices = np.arange(batch_size)
+    wer = d[batch_indices, ref_lens, hyp_lens].astype(np.int64)
 
     # Find out the manipulation steps
-    x = len(ref)
-    y = len(hyp)
-    error_list = []
+    x = ref_lens.copy()
+    y = hyp_lens.copy()
+    sub = np.zeros((batch_size,), dtype=np.int64)
+    ins = np.zeros((batch_size,), dtype=np.int64)
+    dele = np.zeros((batch_size,), dtype=np.int64)
+    codes = []
     while True:
-        if x == 0 and y == 0:
+        active = (x > 0) | (y > 0)
+        if not active.any():
             break
-        else:
-            if d[x][y] == d[x - 1][y - 1] and ref[x - 1] == hyp[y - 1]:
-                error_list.append("C")
-                x = x - 1
-                y = y - 1
-            elif d[x][y] == d[x][y - 1] + 1:
-                error_list.append("I")
-                x = x
-                y = y - 1
-            elif d[x][y] == d[x - 1][y - 1] + 1:
-                error_list.append("S")
-                x = x - 1
-                y = y - 1
-            else:
-                error_list.append("D")
-                x = x - 1
-                y = y
+        x_prev = np.maximum(x - 1, 0)
+        y_prev = np.maximum(y - 1, 0)
+        cur = d[batch_indices, x, y]
+        diag = d[batch_indices, x_prev, y_prev]
+        has_ref = x > 0
+        has_hyp = y > 0
+        both = has_ref & has_hyp
 
-    sub = error_list.count("S")
-    ins = error_list.count("I")
-    dele = error_list.count("D")
-    corr = error_list.count("C")
+        is_corr = both & (cur == diag) & \
+            (ref_pad[batch_indices, x_prev] == hyp_pad[batch_indices, y_prev])
+        is_ins = active & ~is_corr & has_hyp & \
+            (~has_ref | (cur == d[batch_indices, x, y_prev] + 1))
+        is_sub = active & ~is_corr & ~is_ins & both & (cur == diag + 1)
+        is_del = active & ~is_corr & ~is_ins & ~is_sub
 
-    assert wer == (sub + ins + dele)
-    assert corr == (len(ref) - sub - dele)
+        sub += is_sub
+        ins += is_ins
+        dele += is_del
+        if return_ops:
+            codes.append(is_corr * 1 + is_sub * 2 + is_ins * 3 + is_del * 4)
 
-    if normalize:
-        wer /= len(ref)
+        x -= is_corr | is_sub | is_del
+        y -= is_corr | is_sub | is_ins
 
-    return wer, sub, ins, dele
+    ops = None
+    if return_ops:
+        # NOTE: steps are traced from the end
+        codes = np.array(codes[::-1], dtype=np.int64).reshape(-1, batch_size)
+        ops = [''.join(' CSID'[c] for c in codes[:, b] if c > 0)
+               for b in range(batch_size)]
+
+    return wer, sub, ins, dele, ops
 
 
 def wer_align(ref, hyp):
@@ -138,52 +234,13 @@ def wer_align(ref, hyp):
         ins (int): the number of insertion error
         dele (int): the number of deletion error
     """
-    # Build the matrix
-    d = np.zeros((len(ref) + 1) * (len(hyp) + 1),
-                 dtype=np.uint8).reshape((len(ref) + 1, len(hyp) + 1))
-    for i in range(len(ref) + 1):
-        for j in range(len(hyp) + 1):
-            if i == 0:
-                d[0][j] = j
-            elif j == 0:
-                d[i][0] = i
-    for i in range(1, len(ref) + 1):
-        for j in range(1, len(hyp) + 1):
-            if ref[i - 1] == hyp[j - 1]:
-                d[i][j] = d[i - 1][j - 1]
-            else:
-                sub = d[i - 1][j - 1] + 1
-                ins = d[i][j - 1] + 1
-                dele = d[i - 1][j] + 1
-                d[i][j] = min(sub, ins, dele)
-    result = float(d[len(ref)][len(hyp)]) / len(ref) * 100
+    wer, _, _, _, alignments = compute_wer_corpus(
+        [ref], [hyp], return_alignments=True)
+    result = float(wer[0]) / len(ref) * 100
     result = str("%.2f" % result) + "%"
 
     # Find out the manipulation steps
-    x = len(ref)
-    y = len(hyp)
-    error_list = []
-    while True:
-        if x == 0 and y == 0:
-            break
-        else:
-            if d[x][y] == d[x - 1][y - 1] and ref[x - 1] == hyp[y - 1]:
-                error_list.append("C")
-                x = x - 1
-                y = y - 1
-            elif d[x][y] == d[x][y - 1] + 1:
-                error_list.append("I")
-                x = x
-                y = y - 1
-            elif d[x][y] == d[x - 1][y - 1] + 1:
-                error_list.append("S")
-                x = x - 1
-                y = y - 1
-            else:
-                error_list.append("D")
-                x = x - 1
-                y = y
-    error_list = error_list[::-1]
+    error_list = list(alignments[0])
 
     # Print the result in aligned way
     print("REF: ", end='')
@@ -0,0 +1,167 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Normalize token indices into words for scoring.
+   Hypotheses are truncated by the first <EOS>, noise marks (@) are
+   removed, and consecutive spaces are collapsed by masks over the
+   vocabulary, so that token indices are not converted into strings.
+   Words are represented by integers shared with references.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import re
+import numpy as np
+
+from utils.io.labels.vocabulary import Vocabulary
+
+
+def _clean(token):
+    # NOTE: @ means noise, and > means <EOS>
+    return re.sub(r'[@>]+', '', token)
+
+
+class _Normalizer(object):
+
+    def __init__(self, vocab_file_path):
+        vocab = Vocabulary.load(vocab_file_path)
+        self.tokens = vocab.tokens.tolist()
+        self.eos = vocab.eos
+
+        self.word2idx = {}
+        self.idx2word = []
+
+    def _word_index(self, word):
+        if word not in self.word2idx:
+            self.word2idx[word] = len(self.idx2word)
+            self.idx2word.append(word)
+        return self.word2idx[word]
+
+    def _truncate(self, indices):
+        indices = np.asarray(indices, dtype=np.int64)
+        eos_pos = np.where(indices == self.eos)[0]
+        if len(eos_pos) > 0:
+            indices = indices[:eos_pos[0]]
+        return indices
+
+    def words_from_string(self, str_words):
+        """
+        Args:
+            str_words (string): a sequence of words seperated by space('_')
+        Returns:
+            words (np.ndarray): word indices
+        """
+        return np.array([self._word_index(w)
+                         for w in _clean(str_words).split('_') if w != ''],
+                        dtype=np.int64)
+
+    def to_string(self, words):
+        """Convert word indices into a string for logging.
+        Args:
+            words (np.ndarray): word indices
+        Returns:
+            str_words (string): a sequence of words
+        """
+        return '_'.join([self.idx2word[w] for w in words])
+
+
+class WordNormalizer(_Normalizer):
+    """Normalize outputs of word-level models.
+    Args:
+        vocab_file_path (string): path to the vocabulary file
+    """
+
+    def __init__(self, vocab_file_path):
+        super(WordNormalizer, self).__init__(vocab_file_path)
+
+        # Token index -> word index (-1 for noise and <EOS>)
+        self._token2word = np.array(
+            [self._word_index(_clean(t)) if _clean(t) != '' else -1
+             for t in self.tokens], dtype=np.int64)
+
+    def words(self, indices):
+        """
+        Args:
+            indices (np.ndarray): token indices
+        Returns:
+            words (np.ndarray): word indices
+        """
+        words = self._token2word[self._truncate(indices)]
+        return words[words >= 0]
+
+
+class CharNormalizer(_Normalizer):
+    """Normalize outputs of character-level models. Characters are grouped
+        into words by spaces, or by capital letters with capital_divide,
+        and each group is converted into the word index only once.
+    Args:
+        vocab_file_path (string): path to the vocabulary file
+        capital_divide (bool): if True, words will be divided by
+            capital letters. This is used for English.
+    """
+
+    def __init__(self, vocab_file_path, capital_divide=False):
+        super(CharNormalizer, self).__init__(vocab_file_path)
+
+        pieces = [_clean(t) for t in self.tokens]
+        if capital_divide:
+            pieces = [p.lower() for p in pieces]
+        self._pieces = pieces
+        self._is_kept = np.array([p != '' for p in pieces], dtype=bool)
+        self._is_space = np.array([p == '_' for p in pieces], dtype=bool)
+        self._is_head = np.array(
+            [capital_divide and 'A' <= t <= 'Z'
+             for t in self.tokens], dtype=bool) | self._is_space
+
+        # Characters of each token as indices
+        self.char2idx = {}
+        self._token2chars = [
+            [self.char2idx.setdefault(c, len(self.char2idx)) for c in p]
+            if p != '_' else [] for p in pieces]
+
+        # Sequence of token indices of a word -> word index
+        self._cache = {}
+
+    def words(self, indices):
+        """
+        Args:
+            indices (np.ndarray): token indices
+        Returns:
+            words (np.ndarray): word indices
+        """
+        indices = self._truncate(indices)
+        indices = indices[self._is_kept[indices]]
+        heads = np.where(self._is_head[indices])[0]
+        words = []
+        for segment in np.split(indices, heads):
+            segment = segment[~self._is_space[segment]]
+            if len(segment) == 0:
+                continue
+            key = tuple(segment)
+            if key not in self._cache:
+                self._cache[key] = self._word_index(
+                    ''.join([self._pieces[i] for i in key]))
+            words.append(self._cache[key])
+        return np.array(words, dtype=np.int64)
+
+    def chars(self, indices):
+        """
+        Args:
+            indices (np.ndarray): token indices
+        Returns:
+            chars (list): character indices without spaces
+        """
+        indices = self._truncate(indices)
+        return [c for i in indices for c in self._token2chars[i]]
+
+    def chars_from_words(self, words):
+        """
+        Args:
+            words (np.ndarray): word indices
+        Returns:
+            chars (list): character indices without spaces
+        """
+        return [self.char2idx.setdefault(c, len(self.char2idx))
+                for w in words for c in self.idx2word[w]]
@@ -0,0 +1,46 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Re-rank N-best lists with the weighted sum of scores."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+
+
+def rerank(nbest_hyps, scores, weights, length_bonus=0):
+    """Re-rank hypotheses of all utterances at once.
+    Args:
+        nbest_hyps (list): A list of length `[U]`, which contains lists
+            of np.ndarray of token indices
+        scores (dict): the name of scores to a list of length `[U]`, which
+            contains np.ndarray of scores of each hypothesis
+        weights (dict): the name of scores to the weight.
+            Scores which are not in weights are ignored.
+        length_bonus (float): the bonus per token
+    Returns:
+        best_hyps (list): A list of length `[U]` of np.ndarray
+        best_idx (np.ndarray): the rank of the best hypothesis in each
+            N-best list. A tensor of size `[U]`
+    """
+    nbest_lens = np.array([len(hyps) for hyps in nbest_hyps], dtype=np.int64)
+    assert np.all(nbest_lens > 0)
+    hyp_lens = np.array([len(hyp) for hyps in nbest_hyps for hyp in hyps],
+                        dtype=np.float64)
+
+    total = length_bonus * hyp_lens
+    for name, weight in weights.items():
+        if weight != 0:
+            total += weight * np.concatenate(scores[name])
+
+    # Segment-wise argmax over the flat array
+    starts = np.concatenate([[0], np.cumsum(nbest_lens)[:-1]])
+    utt_idx = np.repeat(np.arange(len(nbest_lens)), nbest_lens)
+    order = np.lexsort((-total, utt_idx))
+    # NOTE: the first hypothesis is kept for ties because lexsort is stable
+    best_idx = order[starts] - starts
+
+    best_hyps = [nbest_hyps[u][i] for u, i in enumerate(best_idx)]
+    return best_hyps, best_idx
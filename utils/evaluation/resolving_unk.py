@@ -11,67 +11,59 @@ import numpy as np
 
 
 def resolve_unk(str_hyp, best_hyps_sub, aw, aw_sub, idx2char):
+    """Replace OOV in the word-level hypothesis with the word of the
+        character-level hypothesis which the OOV attends the most.
+    Args:
+        str_hyp (string): a sequence of words
+        best_hyps_sub (np.ndarray): character indices
+        aw (np.ndarray): attention weights of the word-level decoder.
+            A tensor of size `[L, T]`
+        aw_sub (np.ndarray): attention weights of the character-level
+            decoder. A tensor of size `[L_sub, T]`
+        idx2char (Idx2char):
+    Returns:
+        str_hyp_no_unk (string): a sequence of words, where resolved
+            words are surrounded by **
+    """
+    words = str_hyp.split('_')
+    oov_positions = [i for i, w in enumerate(words) if w == 'OOV']
+    if len(oov_positions) == 0:
+        return str_hyp
 
-    oov_info = []
-    # [[idx_oov_0, t_sub_0], ...]
-
-    # Store OOV places
-    for idx_oov, w in enumerate(str_hyp.split('_')):
-        if w == 'OOV':
-            oov_info.append([idx_oov, -1])
+    # NOTE: the same as idx2char(best_hyps_sub[t: t + 1]) for each t
+    chars = idx2char.vocab.tokens[np.asarray(best_hyps_sub, dtype=np.int64)]
+    if idx2char.capital_divide:
+        chars = np.char.lower(chars)
 
     # Point to characters
-    for i in range(len(oov_info)):
-        max_attention_overlap = 0
-        for t_sub in range(len(aw_sub)):
-            # print(np.sum(aw[oov_info[i][0]] * aw_sub[t_sub]))
-            if np.sum(aw[oov_info[i][0]] * aw_sub[t_sub]) > max_attention_overlap:
-                # Check if the correcsponding character is space
-                max_char = idx2char(best_hyps_sub[t_sub: t_sub + 1])
-                if max_char == '_':
-                    continue
+    # NOTE: the attention overlap of all pairs of OOV and characters
+    aw_oov = np.asarray(aw)[oov_positions]
+    overlap = (aw_oov[:, None, :] * np.asarray(aw_sub)[None, :, :]).sum(-1)
+    is_space = np.zeros((max(len(aw_sub), len(chars)),), dtype=bool)
+    is_space[:len(chars)] = chars == '_'
+    overlap[:, is_space[:len(aw_sub)]] = 0
+    if overlap.shape[1] > 0:
+        t_subs = np.where(overlap.max(axis=1) > 0,
+                          overlap.argmax(axis=1), -1)
+    else:
+        t_subs = np.full((len(oov_positions),), -1, dtype=np.int64)
 
-                max_attention_overlap = np.sum(
-                    aw[oov_info[i][0]] * aw_sub[t_sub])
-                oov_info[i][1] = t_sub
+    # Search until space in both directions
+    space_positions = np.where(is_space)[0]
+    stop_positions = np.where(is_space[:len(chars)] | (chars == '>'))[0]
+    chars = chars.tolist()
+    covered_words = []
+    for t_sub in t_subs:
+        i = np.searchsorted(space_positions, t_sub)
+        start = space_positions[i - 1] + 1 if i > 0 else 0
+        j = np.searchsorted(stop_positions, t_sub, side='right')
+        end = stop_positions[j] if j < len(stop_positions) else len(chars)
+        covered_words.append(''.join(chars[start:end]))
 
-    str_hyp_no_unk = ''
     oov_count = 0
-    for idx_oov, w in enumerate(str_hyp.split('_')):
-        if w == 'OOV':
-            t_sub = oov_info[oov_count][1]
-            covered_word = idx2char(best_hyps_sub[t_sub: t_sub + 1])
-
-            # Search until space (forward pass)
-            forward = 1
-            while True:
-                if t_sub - forward < 0:
-                    break
-                elif idx2char(best_hyps_sub[t_sub - forward: t_sub - forward + 1]) != '_':
-                    covered_word = idx2char(
-                        best_hyps_sub[t_sub - forward: t_sub - forward + 1]) + covered_word
-                    forward += 1
-                else:
-                    break
-
-            # Search until space (backward pass)
-            backward = 1
-            while True:
-                if t_sub + backward > len(best_hyps_sub) - 1:
-                    break
-                elif idx2char(best_hyps_sub[t_sub + backward: t_sub + backward + 1]) not in ['_', '>']:
-                    covered_word += idx2char(
-                        best_hyps_sub[t_sub + backward: t_sub + backward + 1])
-                    backward += 1
-                else:
-                    break
-
-            str_hyp_no_unk += '_**' + covered_word + '**'
-            oov_count += 1
-        else:
-            str_hyp_no_unk += '_' + w
+    for i in oov_positions:
+        words[i] = '**' + covered_words[oov_count] + '**'
+        oov_count += 1
 
-    if str_hyp_no_unk[0] == '_':
-        str_hyp_no_unk = str_hyp_no_unk[1:]
+    return '_'.join(words)
 
-    return str_hyp_no_unk
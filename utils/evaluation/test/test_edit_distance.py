@@ -0,0 +1,62 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Test the batched computation of word error rates."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+import unittest
+
+sys.path.append('../../../')
+from utils.evaluation.edit_distance import compute_wer, compute_wer_corpus
+
+
+class TestEditDistance(unittest.TestCase):
+
+    def test(self):
+        print("Edit distance Working check.")
+
+        # Empty hypotheses only
+        self.check(refs=[['a', 'b'], ['c']], hyps=[[], []],
+                   expected=[(2, 0, 0, 2), (1, 0, 0, 1)])
+
+        # Empty references only
+        self.check(refs=[[], []], hyps=[['a', 'b'], ['c']],
+                   expected=[(2, 0, 2, 0), (1, 0, 1, 0)])
+
+        # Both empty
+        self.check(refs=[[]], hyps=[[]], expected=[(0, 0, 0, 0)])
+
+        # Mixed chunks
+        self.check(refs=[['a', 'b', 'c'], [], ['a', 'b'], ['a']],
+                   hyps=[['a', 'x', 'c', 'd'], ['a'], [], ['a']],
+                   expected=[(2, 1, 1, 0), (1, 0, 1, 0),
+                             (2, 0, 0, 2), (0, 0, 0, 0)])
+        self.check(refs=[['a', 'b'], [], ['a']], hyps=[[], ['a'], ['b']],
+                   expected=[(2, 0, 0, 2), (1, 0, 1, 0), (1, 1, 0, 0)],
+                   chunk_size=1)
+
+    def check(self, refs, hyps, expected, chunk_size=256):
+
+        print('==============================')
+        print('  chunk_size: %d' % chunk_size)
+        print('==============================')
+
+        wer, sub, ins, dele, alignments = compute_wer_corpus(
+            refs, hyps, return_alignments=True, chunk_size=chunk_size)
+        for u in range(len(refs)):
+            self.assertEqual((wer[u], sub[u], ins[u], dele[u]), expected[u])
+            self.assertEqual(compute_wer(refs[u], hyps[u]), expected[u])
+
+            # The alignment covers all words
+            self.assertEqual(len(alignments[u]) - alignments[u].count('I'),
+                             len(refs[u]))
+            self.assertEqual(len(alignments[u]) - alignments[u].count('D'),
+                             len(hyps[u]))
+
+
+if __name__ == '__main__':
+    unittest.main()
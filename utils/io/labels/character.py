@@ -6,7 +6,8 @@ from __future__ import division
 from __future__ import print_function
 
 import numpy as np
-import codecs
+
+from utils.io.labels.vocabulary import Vocabulary
 
 
 class Char2idx(object):
@@ -28,19 +29,8 @@ class Char2idx(object):
         self.double_letter = double_letter
         self.remove_list = remove_list
 
-        # Load the vocabulary file
-        self.map_dict = {}
-        vocab_count = 0
-        with codecs.open(vocab_file_path, 'r', 'utf-8') as f:
-            for line in f:
-                c = line.strip()
-                if c in remove_list:
-                    continue
-                self.map_dict[c] = vocab_count
-                vocab_count += 1
-
-        # Add <EOS>
-        self.map_dict['>'] = vocab_count
+        self.vocab = Vocabulary.load(vocab_file_path, remove_list)
+        self.map_dict = self.vocab.token2idx
 
     def __call__(self, str_char):
         """
@@ -126,19 +116,12 @@ class Idx2char(object):
         self.capital_divide = capital_divide
         self.remove_list = remove_list
 
-        # Load the vocabulary file
-        self.map_dict = {}
-        vocab_count = 0
-        with codecs.open(vocab_file_path, 'r', 'utf-8') as f:
-            for line in f:
-                c = line.strip()
-                if c in remove_list:
-                    continue
-                self.map_dict[vocab_count] = c
-                vocab_count += 1
-
-        # Add <EOS>
-        self.map_dict[vocab_count] = '>'
+        self.vocab = Vocabulary.load(vocab_file_path, remove_list)
+        if capital_divide:
+            self._lower = np.array([c.lower() for c in self.vocab.tokens])
+            self._is_capital = np.array(
+                ['A' <= c <= 'Z' for c in self.vocab.tokens],
+                dtype=bool)
 
     def __call__(self, indices, return_list=False):
         """
@@ -150,25 +133,39 @@ class Idx2char(object):
                 or
             char_list (list): list of characters
         """
-        _char_list = list(map(lambda c: self.map_dict[c], indices))
-        char_list = []
+        indices = np.asarray(indices, dtype=np.int64)
 
         # Convert character indices into the corresponding strings
         if self.capital_divide:
-            for i in range(len(_char_list)):
-                if i != 0 and 'A' <= _char_list[i] <= 'Z':
-                    char_list += [self.space_mark, _char_list[i].lower()]
-                else:
-                    char_list += [_char_list[i].lower()]
+            char_list = self._lower[indices].tolist()
+            heads = np.where(self._is_capital[indices])[0]
+            for i in heads[::-1]:
+                if i != 0:
+                    char_list.insert(i, self.space_mark)
 
             if return_list:
                 return char_list
 
             str_char = ''.join(char_list)
         else:
+            _char_list = self.vocab.to_tokens(indices)
             if return_list:
                 return _char_list
 
             str_char = ''.join(_char_list)
 
         return str_char
+
+    def batch(self, ys, y_lens):
+        """Convert padded character indices of all utterances at once.
+        Args:
+            ys (np.ndarray): A tensor of size `[B, T]`
+            y_lens (np.ndarray): A tensor of size `[B]`
+        Returns:
+            str_chars (list): A list of length `[B]` of sequences of
+                characters
+        """
+        if self.capital_divide:
+            return [self(ys[b][:y_lens[b]]) for b in range(len(y_lens))]
+        return [''.join(char_list)
+                for char_list in self.vocab.to_tokens_batch(ys, y_lens)]
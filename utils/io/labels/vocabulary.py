@@ -0,0 +1,104 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Vocabulary shared by label converters of the same vocabulary file."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import codecs
+
+# NOTE: (vocab_file_path, remove_list) -> Vocabulary
+_VOCABULARIES = {}
+
+
+class Vocabulary(object):
+    """Tokens in a vocabulary file and <EOS>. Use Vocabulary.load so that
+        each file is read only once.
+    Args:
+        vocab_file_path (string): path to the vocabulary file
+        remove_list (list): tokens to neglect
+    """
+
+    def __init__(self, vocab_file_path, remove_list=[]):
+        self.vocab_file_path = vocab_file_path
+
+        # Load the vocabulary file
+        tokens = []
+        with codecs.open(vocab_file_path, 'r', 'utf-8') as f:
+            for line in f:
+                token = line.strip()
+                if token in remove_list:
+                    continue
+                tokens.append(token)
+
+        # Add <EOS>
+        self.eos = len(tokens)
+        tokens.append('>')
+
+        # index -> string
+        self.tokens = np.array(tokens)
+        # string -> index
+        self.token2idx = dict((token, i) for i, token in enumerate(tokens))
+
+    @classmethod
+    def load(cls, vocab_file_path, remove_list=[]):
+        """Return the vocabulary of the file loaded before if any.
+        Args:
+            vocab_file_path (string): path to the vocabulary file
+            remove_list (list): tokens to neglect
+        Returns:
+            vocab (Vocabulary)
+        """
+        key = (vocab_file_path, tuple(remove_list))
+        if key not in _VOCABULARIES:
+            _VOCABULARIES[key] = cls(vocab_file_path, remove_list)
+        return _VOCABULARIES[key]
+
+    def __len__(self):
+        """The number of tokens including <EOS>."""
+        return len(self.tokens)
+
+    def __contains__(self, token):
+        return token in self.token2idx
+
+    def to_tokens(self, indices):
+        """
+        Args:
+            indices (list or np.ndarray): token indices
+        Returns:
+            tokens (list): list of token strings
+        """
+        return self.tokens[np.asarray(indices, dtype=np.int64)].tolist()
+
+    def to_indices(self, tokens, unk=None):
+        """
+        Args:
+            tokens (list): list of token strings
+            unk (string, optional): the token to replace unknown tokens with.
+                By default, KeyError is raised.
+        Returns:
+            indices (list): token indices
+        """
+        token2idx = self.token2idx
+        if unk is None:
+            return [token2idx[t] for t in tokens]
+        return [token2idx[t] if t in token2idx else token2idx[unk]
+                for t in tokens]
+
+    def to_tokens_batch(self, ys, y_lens):
+        """Convert padded token indices of all utterances at once.
+        Args:
+            ys (np.ndarray): A tensor of size `[B, T]`
+            y_lens (np.ndarray): A tensor of size `[B]`
+        Returns:
+            tokens (list): A list of length `[B]` of lists of token strings
+        """
+        ys = np.asarray(ys, dtype=np.int64)
+        y_lens = np.asarray(y_lens, dtype=np.int64)
+        mask = np.arange(ys.shape[1])[None, :] < y_lens[:, None]
+        tokens = self.tokens[ys[mask]].tolist()
+        offsets = np.concatenate([[0], np.cumsum(y_lens)])
+        return [tokens[offsets[b]:offsets[b + 1]] for b in range(len(y_lens))]
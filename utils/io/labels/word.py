@@ -6,7 +6,8 @@ from __future__ import division
 from __future__ import print_function
 
 import numpy as np
-import codecs
+
+from utils.io.labels.vocabulary import Vocabulary
 
 
 class Word2idx(object):
@@ -18,18 +19,7 @@ class Word2idx(object):
 
     def __init__(self, vocab_file_path, space_mark='_'):
         self.space_mark = space_mark
-
-        # Load the vocablary file
-        self.map_dict = {}
-        vocab_count = 0
-        with codecs.open(vocab_file_path, 'r', 'utf-8') as f:
-            for line in f:
-                w = line.strip()
-                self.map_dict[w] = vocab_count
-                vocab_count += 1
-
-        # Add <EOS>
-        self.map_dict['>'] = vocab_count
+        self.vocab = Vocabulary.load(vocab_file_path)
 
     def __call__(self, str_word):
         """Convert word into index.
@@ -38,19 +28,10 @@ class Word2idx(object):
         Returns:
             indices (np.ndarray): word indices
         """
-        word_list = str_word.split(self.space_mark)
-        indices = []
-
         # Convert word strings into the corresponding indices
-        for w in word_list:
-            if w in self.map_dict.keys():
-                indices.append(self.map_dict[w])
-            else:
-                # Replace with <UNK>
-                indices.append(self.map_dict['OOV'])
-
-        # return np.array(indices
-        return indices
+        # NOTE: unknown words are replaced with <UNK>
+        return self.vocab.to_indices(str_word.split(self.space_mark),
+                                     unk='OOV')
 
 
 class Idx2word(object):
@@ -62,18 +43,7 @@ class Idx2word(object):
 
     def __init__(self, vocab_file_path, space_mark='_'):
         self.space_mark = space_mark
-
-        # Load the vocabulary file
-        self.map_dict = {}
-        vocab_count = 0
-        with codecs.open(vocab_file_path, 'r', 'utf-8') as f:
-            for line in f:
-                w = line.strip()
-                self.map_dict[vocab_count] = w
-                vocab_count += 1
-
-        # Add <EOS>
-        self.map_dict[vocab_count] = '>'
+        self.vocab = Vocabulary.load(vocab_file_path)
 
     def __call__(self, indices, return_list=False):
         """
@@ -86,7 +56,7 @@ class Idx2word(object):
             word_list (list): list of words
         """
         # Convert word indices into the corresponding strings
-        word_list = list(map(lambda w: self.map_dict[w], indices))
+        word_list = self.vocab.to_tokens(indices)
 
         if return_list:
             return word_list
@@ -95,6 +65,17 @@ class Idx2word(object):
 
         return str_word
 
+    def batch(self, ys, y_lens):
+        """Convert padded word indices of all utterances at once.
+        Args:
+            ys (np.ndarray): A tensor of size `[B, T]`
+            y_lens (np.ndarray): A tensor of size `[B]`
+        Returns:
+            str_words (list): A list of length `[B]` of sequences of words
+        """
+        return [self.space_mark.join(word_list)
+                for word_list in self.vocab.to_tokens_batch(ys, y_lens)]
+
 
 class Char2word(object):
     """Convert character indices into the word index.
@@ -104,30 +85,8 @@ class Char2word(object):
     """
 
     def __init__(self, vocab_file_path_word, vocab_file_path_char):
-
-        # Load the vocabulary file (word)
-        self.map_dict_w = {}
-        vocab_count_w = 0
-        with codecs.open(vocab_file_path_word, 'r', 'utf-8') as f:
-            for line in f:
-                w = line.strip()
-                # string -> index
-                self.map_dict_w[w] = vocab_count_w
-                vocab_count_w += 1
-
-        # Load the vocabulary file
-        self.map_dict_c = {}
-        vocab_count_c = 0
-        with codecs.open(vocab_file_path_char, 'r', 'utf-8') as f:
-            for line in f:
-                c = line.strip()
-                # index -> string
-                self.map_dict_c[vocab_count_c] = c
-                vocab_count_c += 1
-
-        # Add <EOS>
-        self.map_dict_w['>'] = vocab_count_w
-        self.map_dict_c[vocab_count_c] = '>'
+        self.vocab_word = Vocabulary.load(vocab_file_path_word)
+        self.vocab_char = Vocabulary.load(vocab_file_path_char)
 
     def __call__(self, char_indices):
         """
@@ -137,15 +96,10 @@ class Char2word(object):
             word_index (int): index of the corresponding word
         """
         # Convert character indices into the corresponding character strings
-        str_single_word = ''.join(
-            list(map(lambda c: self.map_dict_c[c], char_indices)))
+        str_single_word = ''.join(self.vocab_char.to_tokens(char_indices))
 
         # Convert a word string into the corresponding index
-        if str_single_word in self.map_dict_w.keys():
-            word_index = self.map_dict_w[str_single_word]
-        else:
-            word_index = self.map_dict_w['OOV']
-        return word_index
+        return self.vocab_word.to_indices([str_single_word], unk='OOV')[0]
 
 
 class Word2char(object):
@@ -156,30 +110,11 @@ class Word2char(object):
     """
 
     def __init__(self, vocab_file_path_word, vocab_file_path_char):
+        self.vocab_word = Vocabulary.load(vocab_file_path_word)
+        self.vocab_char = Vocabulary.load(vocab_file_path_char)
 
-        # Load the vocabulary file (word)
-        self.map_dict_w = {}
-        vocab_count_w = 0
-        with codecs.open(vocab_file_path_word, 'r', 'utf-8') as f:
-            for line in f:
-                w = line.strip()
-                # index -> string
-                self.map_dict_w[vocab_count_w] = w
-                vocab_count_w += 1
-
-        # Load the vocabulary file
-        self.map_dict_c = {}
-        vocab_count_c = 0
-        with codecs.open(vocab_file_path_char, 'r', 'utf-8') as f:
-            for line in f:
-                c = line.strip()
-                # string -> index
-                self.map_dict_c[c] = vocab_count_c
-                vocab_count_c += 1
-
-        # Add <EOS>
-        self.map_dict_w[vocab_count_w] = '>'
-        self.map_dict_c['>'] = vocab_count_c
+        # NOTE: word index -> character indices
+        self._cache = {}
 
     def __call__(self, word_index):
         """
@@ -188,9 +123,11 @@ class Word2char(object):
         Returns:
             char_indices (list): indices of the corresponding characters
         """
-        # Convert word index into the the corresponding character strings
-        str_char = self.map_dict_w[word_index]
-
-        # Convert character strings into the corresponding indices
-        char_indices = list(map(lambda c: self.map_dict_c[c], list(str_char)))
-        return char_indices
+        if word_index not in self._cache:
+            # Convert word index into the the corresponding character strings
+            str_char = self.vocab_word.tokens[word_index]
+
+            # Convert character strings into the corresponding indices
+            self._cache[word_index] = self.vocab_char.to_indices(
+                list(str_char))
+        return list(self._cache[word_index])
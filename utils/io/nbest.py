@@ -0,0 +1,64 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Save and load N-best lists in the binary format (.npz).
+   All hypotheses are concatenated into one flat array of tokens, and
+   their lengths are saved to split it again.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+
+
+def save_nbest(save_path, utt_ids, nbest_hyps, scores):
+    """Save N-best lists.
+    Args:
+        save_path (string): path to the file (.npz)
+        utt_ids (list): A list of length `[U]` of utterance IDs
+        nbest_hyps (list): A list of length `[U]`, which contains lists
+            of np.ndarray of token indices
+        scores (dict): the name of scores to a list of length `[U]`, which
+            contains np.ndarray of scores of each hypothesis
+    """
+    assert len(utt_ids) == len(nbest_hyps)
+    hyps = [hyp for hyps in nbest_hyps for hyp in hyps]
+    arrays = {
+        'utt_ids': np.array(utt_ids),
+        'nbest_lens': np.array([len(hyps) for hyps in nbest_hyps],
+                               dtype=np.int32),
+        'hyp_lens': np.array([len(hyp) for hyp in hyps], dtype=np.int32),
+        'tokens': np.concatenate(
+            [np.zeros((0,), dtype=np.int32)] +
+            [np.asarray(hyp, dtype=np.int32) for hyp in hyps])}
+    for name, score in scores.items():
+        arrays['score_' + name] = np.concatenate(
+            [np.zeros((0,), dtype=np.float64)] +
+            [np.asarray(s, dtype=np.float64) for s in score])
+        assert len(arrays['score_' + name]) == len(hyps)
+    np.savez(save_path, **arrays)
+
+
+def load_nbest(path):
+    """Load N-best lists.
+    Args:
+        path (string): path to the file (.npz)
+    Returns:
+        utt_ids (list): A list of length `[U]` of utterance IDs
+        nbest_hyps (list): A list of length `[U]`, which contains lists
+            of np.ndarray of token indices
+        scores (dict): the name of scores to a list of length `[U]`, which
+            contains np.ndarray of scores of each hypothesis
+    """
+    with np.load(path) as f:
+        nbest_split = np.cumsum(f['nbest_lens'])[:-1]
+        hyps = np.split(f['tokens'].astype(np.int64),
+                        np.cumsum(f['hyp_lens'])[:-1])
+        nbest_hyps = [[hyps[i] for i in idx]
+                      for idx in np.split(np.arange(len(hyps)), nbest_split)]
+        scores = dict((k[len('score_'):], np.split(f[k], nbest_split))
+                      for k in f.files if k.startswith('score_'))
+        utt_ids = f['utt_ids'].tolist()
+    return utt_ids, nbest_hyps, scores
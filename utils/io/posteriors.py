@@ -0,0 +1,179 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Save and load CTC posteriors of a whole evaluation set.
+   Log-scale posteriors of all utterances are concatenated along the time
+   axis and saved in float16 as .npy files in one directory, so that they
+   are read by memory mapping. With top_k, only the k largest classes of
+   each frame are saved, and the rest of the probability mass is spread
+   evenly over the other classes. PosteriorWriter reduces each mini-batch
+   as soon as it is computed.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from os.path import join, isfile
+import numpy as np
+
+from utils.directory import mkdir
+
+
+def save_posteriors(save_path, utt_ids, log_probs, x_lens, top_k=None,
+                    refs=None):
+    """Save posteriors.
+    Args:
+        save_path (string): path to the directory
+        utt_ids (list): A list of length `[U]` of utterance IDs
+        log_probs (list): A list of np.ndarray of size
+            `[B, T, num_classes]` in log-scale
+        x_lens (list): A list of np.ndarray of size `[B]`
+        top_k (int, optional): if given, save only the top-k classes of
+            each frame
+        refs (list, optional): A list of length `[U]` of reference
+            transcripts
+    """
+    writer = PosteriorWriter(save_path, top_k=top_k)
+    offset = 0
+    for lp, x_len in zip(log_probs, x_lens):
+        writer.add(utt_ids[offset:offset + len(x_len)], lp, x_len,
+                   refs=refs[offset:offset + len(x_len)]
+                   if refs is not None else None)
+        offset += len(x_len)
+    assert offset == len(utt_ids)
+    writer.close()
+
+
+class PosteriorWriter(object):
+    """Save posteriors mini-batch by mini-batch. Each mini-batch is trimmed
+        to the lengths of utterances and converted into float16 (and into
+        the top-k classes) when it is added, so that padded posteriors of
+        the whole set are never kept in memory.
+    Args:
+        save_path (string): path to the directory
+        top_k (int, optional): if given, save only the top-k classes of
+            each frame
+    """
+
+    def __init__(self, save_path, top_k=None):
+        self.save_path = save_path
+        self.top_k = top_k
+        self.num_classes = None
+
+        self._utt_ids = []
+        self._refs = []
+        self._lens = []
+        self._values = []
+        self._indices = []
+        self._floor = []
+
+    def __len__(self):
+        return len(self._utt_ids)
+
+    def add(self, utt_ids, log_probs, x_lens, refs=None):
+        """Add posteriors of a mini-batch.
+        Args:
+            utt_ids (list): A list of length `[B]` of utterance IDs
+            log_probs (np.ndarray): A tensor of size `[B, T, num_classes]`
+                in log-scale
+            x_lens (np.ndarray): A tensor of size `[B]`
+            refs (list, optional): A list of length `[B]` of reference
+                transcripts
+        """
+        assert len(utt_ids) == len(x_lens)
+        frames = np.concatenate([log_probs[b, :x_lens[b]]
+                                 for b in range(len(x_lens))], axis=0)
+        self.num_classes = frames.shape[-1]
+
+        self._utt_ids += list(utt_ids)
+        self._lens.append(np.asarray(x_lens, dtype=np.int64))
+        if refs is not None:
+            assert len(refs) == len(utt_ids)
+            self._refs += list(refs)
+
+        top_k = self.top_k
+        if top_k is None or top_k >= self.num_classes:
+            self._values.append(frames.astype(np.float16))
+            return
+
+        indices = np.argpartition(-frames, top_k - 1, axis=1)[:, :top_k]
+        values = frames[np.arange(len(frames))[:, None], indices]
+        rest = np.clip(1 - np.exp(values.astype(np.float64)).sum(axis=1),
+                       1e-10, None)
+        self._values.append(values.astype(np.float16))
+        self._indices.append(indices.astype(np.int32))
+        self._floor.append(
+            np.log(rest / (self.num_classes - top_k)).astype(np.float16))
+
+    def close(self):
+        """Save all added posteriors."""
+        save_path = self.save_path
+        lens = np.concatenate(self._lens)
+
+        mkdir(save_path)
+        np.save(join(save_path, 'utt_ids.npy'), np.array(self._utt_ids))
+        np.save(join(save_path, 'offsets.npy'),
+                np.concatenate([[0], np.cumsum(lens)]).astype(np.int64))
+        np.save(join(save_path, 'num_classes.npy'),
+                np.array(self.num_classes))
+        if len(self._refs) > 0:
+            assert len(self._refs) == len(self._utt_ids)
+            np.save(join(save_path, 'refs.npy'), np.array(self._refs))
+
+        np.save(join(save_path, 'values.npy'), np.concatenate(self._values))
+        if len(self._indices) > 0:
+            np.save(join(save_path, 'indices.npy'),
+                    np.concatenate(self._indices))
+            np.save(join(save_path, 'floor.npy'), np.concatenate(self._floor))
+
+
+class PosteriorArchive(object):
+    """Read posteriors saved by save_posteriors or PosteriorWriter.
+    Args:
+        path (string): path to the directory
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.utt_ids = np.load(join(path, 'utt_ids.npy')).tolist()
+        self._offsets = np.load(join(path, 'offsets.npy'))
+        self.num_classes = int(np.load(join(path, 'num_classes.npy')))
+        self._values = np.load(join(path, 'values.npy'), mmap_mode='r')
+        if isfile(join(path, 'indices.npy')):
+            self._indices = np.load(join(path, 'indices.npy'), mmap_mode='r')
+            self._floor = np.load(join(path, 'floor.npy'), mmap_mode='r')
+        else:
+            self._indices = None
+        if isfile(join(path, 'refs.npy')):
+            self.refs = np.load(join(path, 'refs.npy')).tolist()
+        else:
+            self.refs = None
+
+    def __len__(self):
+        return len(self.utt_ids)
+
+    @property
+    def x_lens(self):
+        return np.diff(self._offsets)
+
+    def batch(self, indices):
+        """Load posteriors of utterances.
+        Args:
+            indices (list): the index of utterances
+        Returns:
+            log_probs (np.ndarray): A tensor of size `[B, T, num_classes]`
+            x_lens (np.ndarray): A tensor of size `[B]`
+        """
+        x_lens = self.x_lens[indices]
+        log_probs = np.zeros((len(indices), max(x_lens), self.num_classes),
+                             dtype=np.float32)
+        for b, i in enumerate(indices):
+            start, end = self._offsets[i], self._offsets[i + 1]
+            if self._indices is None:
+                log_probs[b, :x_lens[b]] = self._values[start:end]
+            else:
+                log_probs[b, :x_lens[b]] = self._floor[start:end, None]
+                log_probs[b, np.arange(x_lens[b])[:, None],
+                          self._indices[start:end]] = self._values[start:end]
+        return log_probs, x_lens
@@ -10,6 +10,7 @@ from __future__ import print_function
 import logging
 logger = logging.getLogger('training')
 
+import numpy as np
 import torch
 
 try:
@@ -23,14 +24,263 @@ except:
 
 INF = float("inf")
 
+# NOTE: the largest micro-batch size which fitted in memory is remembered per
+# bucket of the maximum input length, so that later mini-batches of similar
+# length are split up front instead of failing first.
+BUCKET_FRAME_NUM = 100
+micro_batch_sizes = {}
 
-def train_step(model, batch, clip_grad_norm, backend):
+
+def _length_bucket(batch):
+    return int(max(batch['x_lens'])) // BUCKET_FRAME_NUM
+
+
+def _is_out_of_memory(e):
+    return 'out of memory' in str(e)
+
+
+def split_batch(batch, micro_batch_size):
+    """Split a mini-batch into length-sorted micro-batches.
+    Args:
+        batch (dict): mini-batch made by the data loader
+        micro_batch_size (int): the maximum number of utterances per
+            micro-batch
+    Returns:
+        micro_batches (list): list of dicts with the same keys as `batch`.
+            Inputs and labels are trimmed to the longest utterance
+            in each micro-batch.
+    """
+    batch_size = len(batch['xs'])
+    if micro_batch_size >= batch_size:
+        return [batch]
+
+    perm_idx = np.argsort(-np.asarray(batch['x_lens']), kind='mergesort')
+    micro_batches = []
+    for offset in range(0, batch_size, micro_batch_size):
+        indices = perm_idx[offset:offset + micro_batch_size]
+        micro_batch = {}
+        for key, value in batch.items():
+            if isinstance(value, list):
+                micro_batch[key] = [value[i] for i in indices]
+            else:
+                micro_batch[key] = value[indices]
+
+        # Trim padding
+        for xs_key, lens_key in [('xs', 'x_lens'), ('ys', 'y_lens'),
+                                 ('ys_sub', 'y_lens_sub')]:
+            if xs_key in micro_batch and isinstance(micro_batch[xs_key], np.ndarray):
+                max_len = max(int(max(micro_batch[lens_key])), 1)
+                micro_batch[xs_key] = micro_batch[xs_key][:, :max_len]
+        for key in micro_batch.keys():
+            if key.startswith('ys_in') or key.startswith('ys_out'):
+                lens_key = 'y_lens_sub' if '_sub' in key else 'y_lens'
+                max_len = int(max(micro_batch[lens_key])) + 1
+                micro_batch[key] = micro_batch[key][:, :max_len]
+                # NOTE: including <SOS> or <EOS>
+        micro_batches.append(micro_batch)
+    return micro_batches
+
+
+class GradientAccumulator(object):
+    """Accumulate gradients over several mini-batches before updating
+    parameters, in order to emulate a larger batch size.
+    Args:
+        accum_grad_steps (int): the number of mini-batches per update
+        accum_grad_frames (int): the number of input frames per update.
+            If positive, this is used instead of accum_grad_steps.
+        normalize (string): utterance or frame.
+            utterance: the loss is averaged over all utterances in the
+                accumulated mini-batches, which is equal to the loss of a
+                single mini-batch of the same size.
+            frame: the loss is averaged over all input frames in the
+                accumulated mini-batches.
+    """
+
+    def __init__(self, accum_grad_steps=1, accum_grad_frames=0,
+                 normalize='utterance'):
+        assert accum_grad_steps >= 1
+        assert normalize in ['utterance', 'frame']
+
+        self.accum_grad_steps = accum_grad_steps
+        self.accum_grad_frames = accum_grad_frames
+        self.normalize = normalize
+        self.reset()
+
+    def reset(self):
+        self.num_steps = 0
+        self.num_utt = 0
+        self.num_frames = 0
+
+    def add(self, batch):
+        self.num_steps += 1
+        self.num_utt += len(batch['xs'])
+        self.num_frames += int(np.sum(batch['x_lens']))
+
+    @property
+    def is_pending(self):
+        return self.num_steps > 0
+
+    @property
+    def is_ready(self):
+        if self.accum_grad_frames > 0:
+            return self.num_frames >= self.accum_grad_frames
+        return self.num_steps >= self.accum_grad_steps
+
+    @property
+    def denominator(self):
+        if self.normalize == 'frame':
+            return self.num_frames
+        return self.num_utt
+
+
+def _forward_backward(model, batch, grad_scale, hierarchical):
+    """Compute gradients of a (micro-)batch.
+    Args:
+        model (torch.nn.Module):
+        batch (dict):
+        grad_scale (float): the loss is multiplied by this value before
+            back-propagation
+        hierarchical (bool):
+    Returns:
+        loss_vals (list): list of float
+    """
+    # Inputs and outputs of decoders made by the data loader
+    kwargs = {}
+    targets = dict((k, v) for k, v in batch.items()
+                   if k.startswith('ys_in') or k.startswith('ys_out'))
+    if len(targets) > 0:
+        kwargs['targets'] = targets
+
+    if hierarchical:
+        losses = model(batch['xs'], batch['ys'],
+                       batch['x_lens'], batch['y_lens'],
+                       batch['ys_sub'], batch['y_lens_sub'], **kwargs)
+    else:
+        losses = [model(batch['xs'], batch['ys'],
+                        batch['x_lens'], batch['y_lens'], **kwargs)]
+    if grad_scale == 1:
+        losses[0].backward()
+    else:
+        (losses[0] * grad_scale).backward()
+    # loss_vals = [loss.item() for loss in losses]
+    loss_vals = [loss.data[0] for loss in losses]
+    del losses
+    return loss_vals
+
+
+def _update(model, clip_grad_norm, accumulator=None):
+    """Update parameters with the accumulated gradients.
+    Args:
+        model (torch.nn.Module):
+        clip_grad_norm (float):
+        accumulator (GradientAccumulator, optional):
+    """
+    if accumulator is not None:
+        # Normalize gradients summed over utterances
+        for param in model.parameters():
+            if param.grad is not None:
+                param.grad.data.div_(accumulator.denominator)
+        accumulator.reset()
+
+    if clip_grad_norm > 0:
+        # torch.nn.utils.clip_grad_norm_(
+        #     model.parameters(), clip_grad_norm)
+        torch.nn.utils.clip_grad_norm(
+            model.parameters(), clip_grad_norm)
+    model.optimizer.step()
+    # TODO: Add scheduler
+
+
+def flush_gradients(model, clip_grad_norm, accumulator):
+    """Update parameters with gradients left in the accumulator. Call this
+    at the end of each epoch before changing the learning rate or the
+    optimizer.
+    Args:
+        model (torch.nn.Module):
+        clip_grad_norm (float):
+        accumulator (GradientAccumulator):
+    Returns:
+        model (torch.nn.Module):
+    """
+    if accumulator is not None and accumulator.is_pending:
+        _update(model, clip_grad_norm, accumulator)
+        model.optimizer.zero_grad()
+    return model
+
+
+def _pytorch_step(model, batch, clip_grad_norm, hierarchical,
+                  accumulator=None):
+    """Update parameters with a mini-batch. When the mini-batch does not fit
+    in memory, it is split into micro-batches and gradients are accumulated.
+    Args:
+        model (torch.nn.Module):
+        batch (dict):
+        clip_grad_norm (float):
+        hierarchical (bool):
+        accumulator (GradientAccumulator, optional): If set, parameters are
+            updated only when enough mini-batches are accumulated
+    Returns:
+        loss_vals (list): list of float
+    """
+    batch_size = len(batch['xs'])
+    bucket = _length_bucket(batch)
+    micro_batch_size = min(micro_batch_sizes.get(bucket, batch_size),
+                           batch_size)
+
+    if accumulator is None or not accumulator.is_pending:
+        model.optimizer.zero_grad()
+
+    while True:
+        loss_vals = [0., 0., 0.] if hierarchical else [0.]
+        try:
+            for micro_batch in split_batch(batch, micro_batch_size):
+                ratio = len(micro_batch['xs']) / batch_size
+                # NOTE: losses are averaged over utterances in each
+                # (micro-)batch. With the accumulator, they are turned into
+                # sums here and normalized in _update().
+                if accumulator is None:
+                    grad_scale = ratio
+                else:
+                    grad_scale = len(micro_batch['xs'])
+                for i, v in enumerate(_forward_backward(
+                        model, micro_batch, grad_scale, hierarchical)):
+                    loss_vals[i] += v * ratio
+            break
+        except RuntimeError as e:
+            model.optimizer.zero_grad()
+            torch.cuda.empty_cache()
+            if accumulator is not None and accumulator.is_pending:
+                logger.warning('!!!Discard accumulated gradients!!! (steps: %d)' %
+                               accumulator.num_steps)
+                accumulator.reset()
+            if not _is_out_of_memory(e) or micro_batch_size == 1:
+                raise
+            micro_batch_size = (micro_batch_size + 1) // 2
+            logger.warning('!!!Split mini-batch!!! (max_frame_num: %d, batch: %d, micro-batch: %d)' %
+                           (max(batch['x_lens']) * model.num_stack, batch_size, micro_batch_size))
+
+    if micro_batch_size < batch_size:
+        micro_batch_sizes[bucket] = micro_batch_size
+
+    if accumulator is None:
+        _update(model, clip_grad_norm)
+    else:
+        accumulator.add(batch)
+        if accumulator.is_ready:
+            _update(model, clip_grad_norm, accumulator)
+
+    return loss_vals
+
+
+def train_step(model, batch, clip_grad_norm, backend, accumulator=None):
     """
     Args:
         model (torch.nn.Module or chainer.Chain):
         batch (tuple):
         clip_grad_norm (float):
         backend (string): pytorch or chainer
+        accumulator (GradientAccumulator, optional): accumulate gradients
+            over several mini-batches (pytorch only)
     Returns:
         model (torch.nn.Module or chainer.Chain):
         loss_train_val (float):
@@ -39,20 +289,9 @@ def train_step(model, batch, clip_grad_norm, backend):
     try:
         # Step for parameter update
         if backend == 'pytorch':
-            model.optimizer.zero_grad()
-            loss_train = model(batch['xs'], batch['ys'],
-                               batch['x_lens'], batch['y_lens'])
-            loss_train.backward()
-            if clip_grad_norm > 0:
-                # torch.nn.utils.clip_grad_norm_(
-                #     model.parameters(), clip_grad_norm)
-                torch.nn.utils.clip_grad_norm(
-                    model.parameters(), clip_grad_norm)
-            model.optimizer.step()
-            # TODO: Add scheduler
-
-            # loss_train_val = loss_train.item()
-            loss_train_val = loss_train.data[0]
+            loss_train_val, = _pytorch_step(
+                model, batch, clip_grad_norm, hierarchical=False,
+                accumulator=accumulator)
 
         elif backend == 'chainer':
             model.optimizer.target.cleargrads()
@@ -63,8 +302,7 @@ def train_step(model, batch, clip_grad_norm, backend):
             model.optimizer.update()
 
             loss_train_val = loss_train.data
-
-        del loss_train
+            del loss_train
 
     except RuntimeError as e:
         logger.warning('!!!Skip mini-batch!!! (max_frame_num: %d, batch: %d)' %
@@ -72,6 +310,8 @@ def train_step(model, batch, clip_grad_norm, backend):
         if backend == 'pytorch':
             model.optimizer.zero_grad()
             torch.cuda.empty_cache()
+            if accumulator is not None:
+                accumulator.reset()
         elif backend == 'chainer':
             model.optimizer.target.cleargrads()
 
@@ -83,13 +323,15 @@ def train_step(model, batch, clip_grad_norm, backend):
     return model, loss_train_val
 
 
-def train_hierarchical_step(model, batch, clip_grad_norm, backend):
+def train_hierarchical_step(model, batch, clip_grad_norm, backend, accumulator=None):
     """
     Args:
         model (torch.nn.Module or chainer.Chain):
         batch (tuple):
         clip_grad_norm (float):
         backend (string): pytorch or chainer
+        accumulator (GradientAccumulator, optional): accumulate gradients
+            over several mini-batches (pytorch only)
     Returns:
         model (torch.nn.Module or chainer.Chain):
         loss_train_val (float):
@@ -100,26 +342,9 @@ def train_hierarchical_step(model, batch, clip_grad_norm, backend):
     try:
         # Step for parameter update
         if backend == 'pytorch':
-            model.optimizer.zero_grad()
-            loss_train, loss_main_train, loss_sub_train = model(
-                batch['xs'], batch['ys'],
-                batch['x_lens'], batch['y_lens'],
-                batch['ys_sub'], batch['y_lens_sub'])
-            loss_train.backward()
-            if clip_grad_norm > 0:
-                # torch.nn.utils.clip_grad_norm_(
-                #     model.parameters(), clip_grad_norm)
-                torch.nn.utils.clip_grad_norm(
-                    model.parameters(), clip_grad_norm)
-            model.optimizer.step()
-            # TODO: Add scheduler
-
-            # loss_train_val = loss_train.item()
-            # loss_main_train_val = loss_main_train.item()
-            # loss_sub_train_val = loss_sub_train.item()
-            loss_train_val = loss_train.data[0]
-            loss_main_train_val = loss_main_train.data[0]
-            loss_sub_train_val = loss_sub_train.data[0]
+            loss_train_val, loss_main_train_val, loss_sub_train_val = _pytorch_step(
+                model, batch, clip_grad_norm, hierarchical=True,
+                accumulator=accumulator)
 
         elif backend == 'chainer':
             model.optimizer.target.cleargrads()
@@ -134,8 +359,7 @@ def train_hierarchical_step(model, batch, clip_grad_norm, backend):
             loss_train_val = loss_train.data
             loss_main_train_val = loss_main_train.data
             loss_sub_train_val = loss_sub_train.data
-
-        del loss_train, loss_main_train, loss_sub_train
+            del loss_train, loss_main_train, loss_sub_train
 
     except RuntimeError as e:
         logger.warning('!!!Skip mini-batch!!! (max_frame_num: %d, batch: %d)' %
@@ -143,6 +367,8 @@ def train_hierarchical_step(model, batch, clip_grad_norm, backend):
         if backend == 'pytorch':
             model.optimizer.zero_grad()
             torch.cuda.empty_cache()
+            if accumulator is not None:
+                accumulator.reset()
         elif backend == 'chainer':
             model.optimizer.target.cleargrads()
 